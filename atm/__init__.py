@@ -0,0 +1,15 @@
+"""Headless transaction engine shared by the ATM front-ends.
+
+Importing the package loads no GUI toolkit; NumPy is only loaded by batch settlement.
+"""
+
+from .accounts import AccountStore
+from .clock import now_ns, format_timestamp, month_start_ns
+from .dispenser import CashDispenser
+from .fraud import VelocityScorer
+from .idempotency import IdempotencyCache
+from .engine import CashMachine, TransactionHandler
+from .journal import Journal
+from .limits import WithdrawalLimits
+from .ledger import Ledger, LedgerEntry, DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS
+from .money import CurrencyFormatter, to_cents
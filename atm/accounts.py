@@ -0,0 +1,192 @@
+from array import array
+import threading
+from .ledger import Ledger, DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS
+from .money import MAX_AMOUNT, MAX_BALANCE
+
+EMPTY = -1  # Marks a free slot in the index; account numbers are non-negative
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15  # Fibonacci hashing multiplier
+
+
+class AccountStore:
+    """
+    Class holding many accounts in flat arrays, indexed by account number.
+
+    Account numbers map to a row through an open-addressing hash index kept in
+    two typed arrays (keys and rows), so a lookup is O(1) and an account costs
+    a few machine words instead of a Python object. Balances live in a single
+    array indexed by row, and every account shares one ledger.
+
+    The store is safe to share between threads. Balance updates are guarded by
+    a fixed set of striped locks chosen by row, so threads working on different
+    accounts rarely contend, and the balance check and update happen under the
+    same lock so an account can never be overdrawn.
+    """
+
+    def __init__(self, capacity=1024, format_amount=None, lock_stripes=64):
+        """
+        Initialize an empty AccountStore.
+
+        Args:
+            capacity (int): The number of accounts to size the index for.
+            format_amount (callable): Formats an amount in cents for display, defaults to euros.
+            lock_stripes (int): The number of balance locks, rounded up to a power of two.
+        """
+        self.numbers = array("q")
+        self.balances = array("q")  # In cents
+        self.transaction_history = Ledger(format_amount)
+        self.index_lock = threading.Lock()  # Serializes account creation
+        stripes = 1 << max(0, (lock_stripes - 1).bit_length())
+        self.locks = [threading.Lock() for _ in range(stripes)]
+        self.stripe_mask = stripes - 1
+        self.index = self.allocate_index(max(8, 2 * capacity))
+
+    def allocate_index(self, size):
+        """Return an empty (keys, rows, shift, mask) index of at least `size` slots, a power of two"""
+        bits = max(3, (size - 1).bit_length())
+        keys = array("q", [EMPTY]) * (1 << bits)
+        rows = array("q", [0]) * (1 << bits)
+        return keys, rows, 64 - bits, (1 << bits) - 1
+
+    def slot(self, number, index):
+        """Return the slot holding `number` in `index`, or the free slot where it belongs"""
+        keys, rows, shift, mask = index
+        slot = ((number * GOLDEN) & MASK64) >> shift
+        while True:
+            key = keys[slot]
+            if key == number or key == EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def find(self, number):
+        """
+        Find the row of an account.
+
+        Args:
+            number (int): The account number.
+
+        Returns:
+            int: The row of the account, or -1 if there is no such account.
+        """
+        # Read the index once so a concurrent rehash cannot mix old keys with new rows
+        index = self.index
+        slot = self.slot(number, index)
+        return index[1][slot] if index[0][slot] == number else -1
+
+    def lock_for(self, row):
+        """Return the lock guarding the balance in `row`"""
+        return self.locks[row & self.stripe_mask]
+
+    def open_account(self, number, balance=0):
+        """
+        Open a new account.
+
+        Args:
+            number (int): The account or card number.
+            balance (int): The opening balance in cents.
+
+        Returns:
+            int: The row of the new account.
+        """
+        if number < 0:
+            raise ValueError("Account numbers must be non-negative.")
+        with self.index_lock:
+            index = self.index
+            slot = self.slot(number, index)
+            if index[0][slot] == number:
+                raise ValueError(f"Account {number} already exists.")
+            row = len(self.numbers)
+            self.numbers.append(number)
+            self.balances.append(balance)
+            # Publish the row before the key so a concurrent find never sees a key without its row
+            index[1][slot] = row
+            index[0][slot] = number
+            # Keep the load factor at or below one half so probe sequences stay short
+            if 2 * len(self.numbers) > len(index[0]):
+                self.rehash()
+        return row
+
+    def rehash(self):
+        """Build an index twice the size and swap it in"""
+        index = self.allocate_index(2 * len(self.index[0]))
+        keys, rows = index[0], index[1]
+        for row, number in enumerate(self.numbers):
+            slot = self.slot(number, index)
+            keys[slot] = number
+            rows[slot] = row
+        self.index = index
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, number):
+        return self.find(number) >= 0
+
+    def balance(self, number):
+        """Return the balance of an account, or None if it does not exist"""
+        row = self.find(number)
+        return self.balances[row] if row >= 0 else None
+
+    def balance_at(self, number, timestamp):
+        """
+        Return the balance of an account at a past moment.
+
+        Args:
+            number (int): The account number.
+            timestamp (int): Nanoseconds since the epoch.
+
+        Returns:
+            int: The balance in cents, or None if the account had no transactions by then.
+        """
+        return self.transaction_history.balance_at(timestamp, number)
+
+    def withdraw_money(self, number, amount):
+        """
+        Withdraw money from an account.
+
+        Args:
+            number (int): The account number.
+            amount (int): The amount to be withdrawn, in cents.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        row = self.find(number)
+        if row < 0:
+            return "Unknown account.", False
+        if amount <= 0:
+            return "Invalid withdrawal amount. Amount must be greater than 0.", False
+        if amount > MAX_AMOUNT:
+            return f"Invalid withdrawal amount. Amount must not exceed {self.transaction_history.format_amount(MAX_AMOUNT)}.", False
+        with self.lock_for(row):
+            balance = self.balances[row]
+            if balance < amount:
+                return str(self.transaction_history.append(INSUFFICIENT_FUNDS, amount, balance, account=number)), False
+            balance -= amount
+            self.balances[row] = balance
+            return self.transaction_history.append(WITHDRAWAL, amount, balance, account=number), True
+
+    def deposit_money(self, number, amount):
+        """
+        Deposit money into an account.
+
+        Args:
+            number (int): The account number.
+            amount (int): The amount to be deposited, in cents.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        row = self.find(number)
+        if row < 0:
+            return "Unknown account.", False
+        if amount <= 0:
+            return "Invalid deposit amount. Amount must be greater than 0.", False
+        if amount > MAX_AMOUNT:
+            return f"Invalid deposit amount. Amount must not exceed {self.transaction_history.format_amount(MAX_AMOUNT)}.", False
+        with self.lock_for(row):
+            balance = self.balances[row] + amount
+            if balance > MAX_BALANCE:
+                return "Deposit declined. The balance would exceed the maximum an account can hold.", False
+            self.balances[row] = balance
+            return self.transaction_history.append(DEPOSIT, amount, balance, account=number), True
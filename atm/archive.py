@@ -0,0 +1,162 @@
+import argparse
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from .journal import read_journal
+from .ledger import Ledger
+
+# Magic, number of entries, flags; padded so the columns after it stay 8-byte aligned
+HEADER = struct.Struct("<8sQB7x")
+MAGIC = b"ATMLEDG1"
+TIME_SORTED = 1
+
+# Column typecodes in file order; the one-byte kinds go last so every 8-byte column is aligned
+ARCHIVE_COLUMNS = (("timestamps", "q"), ("amounts", "q"), ("balances", "q"), ("accounts", "q"), ("kinds", "b"))
+
+
+def write_archive(ledger, path):
+    """
+    Write a ledger to an archive file, atomically replacing any existing one.
+
+    Args:
+        ledger (Ledger): The ledger to archive.
+        path (str): The archive file.
+    """
+    # Copy the committed rows under the lock and write them after releasing it, so transactions are not blocked on I/O
+    with ledger.lock:
+        count = len(ledger)
+        flags = TIME_SORTED if ledger.time_sorted else 0
+        columns = [getattr(ledger, name)[:count] for name, typecode in ARCHIVE_COLUMNS]
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as archive:
+        archive.write(HEADER.pack(MAGIC, count, flags))
+        for column in columns:
+            column.tofile(archive)
+        archive.flush()
+        os.fsync(archive.fileno())
+    os.replace(temp_path, path)
+
+
+class LedgerArchive(Ledger):
+    """
+    Read-only ledger backed by a memory-mapped archive file.
+
+    The file holds the same columns as a Ledger, each stored as one fixed-width
+    native-endian block. Opening maps the file and casts each block to a typed
+    memoryview without reading or copying it, so an archive of any size opens
+    instantly. The page cache serves reads, and rows become Python objects only
+    when they are accessed. Everything that reads a Ledger also reads an
+    archive: the history view, queries and statement export.
+
+    There is no account index in the file. Account lookups scan the columns
+    instead, over the date range when one is given. Nor are late entries kept,
+    so an archive written from a ledger with late entries is scanned whole.
+    """
+
+    def __init__(self, path, format_amount=None):
+        """
+        Open an archive file.
+
+        Args:
+            path (str): The archive file written by write_archive.
+            format_amount (callable): Formats an amount in cents for display, defaults to euros.
+        """
+        super().__init__(format_amount)
+        self.path = path
+        with open(path, "rb") as archive:
+            self.map = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, flags = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a ledger archive")
+        self.time_sorted = bool(flags & TIME_SORTED)
+        self.count = count
+        self.views = [memoryview(self.map)]
+        offset = HEADER.size
+        for name, typecode in ARCHIVE_COLUMNS:
+            size = struct.calcsize(typecode) * count
+            block = self.views[0][offset:offset + size]
+            view = block.cast(typecode)
+            self.views += [block, view]
+            setattr(self, name, view)
+            offset += size
+
+    def append(self, kind, amount, balance, timestamp=None, account=0):
+        raise TypeError("a ledger archive is read-only")
+
+    def extend(self, timestamps, kinds, amounts, balances, accounts):
+        raise TypeError("a ledger archive is read-only")
+
+    def time_range(self, start=None, end=None):
+        """Return the index range of the entries stamped in [start, end); the whole archive if it is unsorted"""
+        if not self.time_sorted:
+            # The file keeps no late runs, so every entry has to be checked
+            return 0, len(self)
+        return super().time_range(start, end)
+
+    def chain(self, account, stop, first=0):
+        """Yield the indexes of an account's entries in [first, stop), newest first"""
+        accounts = self.accounts
+        for index in range(stop - 1, first - 1, -1):
+            if accounts[index] == account:
+                yield index
+
+    def chain_forward(self, account, first, stop):
+        """Yield the indexes of an account's entries in [first, stop), oldest first"""
+        accounts = self.accounts
+        for index in range(first, stop):
+            if accounts[index] == account:
+                yield index
+
+    def recent(self, account, limit):
+        """Return the indexes of an account's most recent entries, newest first"""
+        indexes = []
+        for index in self.chain(account, len(self)):
+            if len(indexes) == limit:
+                break
+            indexes.append(index)
+        return indexes
+
+    def balance_at(self, timestamp, account=0):
+        """Return an account's balance at a past moment, or None if it had no entries by then"""
+        if not self.time_sorted:
+            # The last recorded entry before the moment holds the balance, wherever it is
+            timestamps = self.timestamps
+            for index in self.chain(account, len(self)):
+                if timestamps[index] < timestamp:
+                    return self.balances[index]
+            return None
+        for index in self.chain(account, bisect_left(self.timestamps, timestamp, 0, len(self))):
+            return self.balances[index]
+        return None
+
+    def close(self):
+        """Release the column views and unmap the file"""
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive the ledger persisted in a journal directory")
+    parser.add_argument("directory", help="journal directory, e.g. atm_journal")
+    parser.add_argument("archive", help="archive file to write")
+    args = parser.parse_args()
+
+    ledger = Ledger()
+    for timestamp, kind, amount, balance, account in read_journal(args.directory):
+        ledger.append(kind, amount, balance, timestamp, account)
+    write_archive(ledger, args.archive)
+    print(f"Archived {len(ledger):,} entries to {args.archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+NS_PER_SECOND = 1_000_000_000
+SECONDS_PER_HOUR = 3600
+
+# Anchor the monotonic clock to the wall clock once, so stamps are epoch-based but never go backwards
+EPOCH_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+
+def now_ns():
+    """Return the current time as integer nanoseconds since the epoch, from a monotonic clock"""
+    return time.monotonic_ns() + EPOCH_OFFSET_NS
+
+
+class TimestampRenderer:
+    """
+    Class rendering nanosecond timestamps as "dd-mm-YYYY HH:MM:SS" local time.
+
+    The date and hour prefix is computed once per hour and the last rendered
+    second is remembered, so rendering a run of nearby timestamps is a few
+    integer operations instead of building a datetime for each one.
+    """
+
+    def __init__(self, date_format="%d-%m-%Y %H:"):
+        """
+        Initialize the TimestampRenderer.
+
+        Args:
+            date_format (str): The strftime format of the cached date and hour prefix.
+        """
+        self.date_format = date_format
+        self.lock = threading.Lock()
+        self.hour_start = None
+        self.prefix = ""
+        self.second = None
+        self.text = ""
+
+    def render(self, timestamp_ns):
+        """
+        Render a timestamp.
+
+        Args:
+            timestamp_ns (int): Nanoseconds since the epoch.
+
+        Returns:
+            str: The local date and time, e.g. "18-10-2026 14:05:09".
+        """
+        second = timestamp_ns // NS_PER_SECOND
+        with self.lock:
+            if second == self.second:
+                return self.text
+            if self.hour_start is None or not 0 <= second - self.hour_start < SECONDS_PER_HOUR:
+                # Local offsets only change on hour boundaries, so one prefix serves the whole local hour
+                local = time.localtime(second)
+                self.prefix = time.strftime(self.date_format, local)
+                self.hour_start = second - local.tm_min * 60 - local.tm_sec
+            minutes, seconds = divmod(second - self.hour_start, 60)
+            self.text = f"{self.prefix}{minutes:02d}:{seconds:02d}"
+            self.second = second
+            return self.text
+
+
+def month_start_ns(timestamp_ns=None):
+    """
+    Return the start of the local calendar month containing a timestamp.
+
+    Args:
+        timestamp_ns (int): Nanoseconds since the epoch, defaults to now.
+
+    Returns:
+        int: Nanoseconds since the epoch at midnight on the first day of the month.
+    """
+    local = time.localtime((now_ns() if timestamp_ns is None else timestamp_ns) // NS_PER_SECOND)
+    first_day = time.mktime((local.tm_year, local.tm_mon, 1, 0, 0, 0, 0, 0, -1))
+    return int(first_day) * NS_PER_SECOND
+
+
+renderer = TimestampRenderer()
+
+
+def format_timestamp(timestamp_ns):
+    """Render a nanosecond timestamp with the shared TimestampRenderer"""
+    return renderer.render(timestamp_ns)
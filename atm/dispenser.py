@@ -0,0 +1,168 @@
+from functools import lru_cache
+from math import gcd
+import threading
+
+# Euro notes loaded by default, in cents
+DEFAULT_CASSETTES = {5000: 200, 2000: 400, 1000: 400, 500: 200}
+
+
+class CashDispenser:
+    """
+    Class representing the note cassettes of a cash machine.
+
+    For every dispensable amount up to `max_amount`, the fewest-notes breakdown
+    with unlimited notes is computed once when the dispenser is created. A
+    withdrawal looks its amount up in that table and checks it against the
+    cassettes. Only when a cassette is too low for the table's breakdown does
+    it fall back to a search, which is memoized on the amount and the note
+    counts that matter for it.
+    """
+
+    def __init__(self, cassettes=None, max_amount=100000, low_cash_notes=20):
+        """
+        Initialize the CashDispenser.
+
+        Args:
+            cassettes (dict): Note value in cents -> number of notes loaded.
+            max_amount (int): The largest single withdrawal in cents.
+            low_cash_notes (int): A cassette at or below this many notes is reported as low.
+        """
+        cassettes = DEFAULT_CASSETTES if cassettes is None else cassettes
+        self.denominations = tuple(sorted(cassettes, reverse=True))
+        self.counts = [cassettes[denomination] for denomination in self.denominations]
+        self.max_amount = max_amount
+        self.low_cash_notes = low_cash_notes
+        self.unit = 0
+        for denomination in self.denominations:
+            self.unit = gcd(self.unit, denomination)
+        self.table = self.build_table()
+        self.lock = threading.Lock()
+
+    def build_table(self):
+        """
+        Compute the fewest-notes breakdown of every multiple of the unit up to max_amount.
+
+        Returns:
+            list: Indexed by amount // unit, a tuple of note counts per denomination, or None.
+        """
+        unit, denominations = self.unit, self.denominations
+        size = self.max_amount // unit + 1
+        notes = [0] + [None] * (size - 1)
+        last = [None] * size  # Index of the last note added to reach each amount
+        for amount in range(1, size):
+            for position, denomination in enumerate(denominations):
+                rest = amount - denomination // unit
+                if rest >= 0 and notes[rest] is not None and (notes[amount] is None or notes[rest] + 1 < notes[amount]):
+                    notes[amount], last[amount] = notes[rest] + 1, position
+        table = [None] * size
+        table[0] = (0,) * len(denominations)
+        for amount in range(1, size):
+            if notes[amount] is not None:
+                counts = list(table[amount - denominations[last[amount]] // unit])
+                counts[last[amount]] += 1
+                table[amount] = tuple(counts)
+        return table
+
+    def plan(self, amount):
+        """
+        Find the notes for a withdrawal without dispensing them.
+
+        Args:
+            amount (int): The amount in cents.
+
+        Returns:
+            tuple: Note counts per denomination, in self.denominations order, or None if the amount cannot be dispensed.
+        """
+        if amount <= 0 or amount > self.max_amount or amount % self.unit:
+            return None
+        breakdown = self.table[amount // self.unit]
+        if breakdown is None:
+            return None
+        counts = self.counts
+        if all(needed <= available for needed, available in zip(breakdown, counts)):
+            return breakdown
+        # Counts above what the amount could ever use don't change the answer, so capping them keeps the cache small
+        capped = tuple(min(available, amount // denomination) for denomination, available in zip(self.denominations, counts))
+        return search_breakdown(amount, self.denominations, capped)
+
+    def dispense(self, amount):
+        """
+        Take the notes for a withdrawal out of the cassettes.
+
+        Args:
+            amount (int): The amount in cents.
+
+        Returns:
+            dict: Note value in cents -> number of notes, or None if the amount cannot be dispensed.
+        """
+        with self.lock:
+            breakdown = self.plan(amount)
+            if breakdown is None:
+                return None
+            for position, needed in enumerate(breakdown):
+                self.counts[position] -= needed
+        return {denomination: needed for denomination, needed in zip(self.denominations, breakdown) if needed}
+
+    def refill(self, denomination, notes):
+        """
+        Load notes into a cassette.
+
+        Args:
+            denomination (int): The note value in cents.
+            notes (int): The number of notes added.
+        """
+        with self.lock:
+            self.counts[self.denominations.index(denomination)] += notes
+
+    def load(self, cassettes):
+        """
+        Set the notes in the cassettes, e.g. to counts restored from a journal.
+
+        Args:
+            cassettes (dict): Note value in cents -> number of notes; cassettes not named keep their count.
+        """
+        with self.lock:
+            for position, denomination in enumerate(self.denominations):
+                self.counts[position] = cassettes.get(denomination, self.counts[position])
+
+    def cash(self):
+        """Return the total value of the notes loaded, in cents"""
+        return sum(denomination * count for denomination, count in zip(self.denominations, self.counts))
+
+    def low_cash(self):
+        """Return the note values whose cassettes are at or below the low-cash level"""
+        return [denomination for denomination, count in zip(self.denominations, self.counts) if count <= self.low_cash_notes]
+
+
+@lru_cache(maxsize=4096)
+def search_breakdown(amount, denominations, available):
+    """
+    Find the fewest-notes breakdown of an amount with limited notes.
+
+    Args:
+        amount (int): The amount in cents.
+        denominations (tuple): Note values in cents, largest first.
+        available (tuple): Notes available per denomination.
+
+    Returns:
+        tuple: Note counts per denomination, or None if no combination adds up to the amount.
+    """
+    best, best_notes = None, None
+    counts = [0] * len(denominations)
+
+    def search(position, rest, notes):
+        nonlocal best, best_notes
+        if rest == 0:
+            if best_notes is None or notes < best_notes:
+                best, best_notes = tuple(counts), notes
+            return
+        if position == len(denominations) or (best_notes is not None and notes >= best_notes):
+            return
+        denomination = denominations[position]
+        for count in range(min(available[position], rest // denomination), -1, -1):
+            counts[position] = count
+            search(position + 1, rest - count * denomination, notes + count)
+        counts[position] = 0
+
+    search(0, amount, 0)
+    return best
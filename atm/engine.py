@@ -0,0 +1,438 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from .money import CurrencyFormatter, MAX_AMOUNT, MAX_BALANCE
+from .ledger import Ledger, DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS
+from .batch import apply_batch
+from .clock import now_ns
+
+PIN_HASH_ITERATIONS = 200000  # PBKDF2 rounds; makes each PIN guess deliberately slow
+MAX_PIN_ATTEMPTS = 3  # Wrong PINs in a row before the card is locked
+SESSION_TTL = 120.0  # Seconds a session stays valid without a transaction
+
+def hash_pin(pin, salt):
+    """Return the salted PBKDF2-SHA256 hash of a PIN"""
+    return hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, PIN_HASH_ITERATIONS)
+
+class CashMachine:
+    """Class representing the Cash Machine"""
+
+    def __init__(self, formatter=None, require_pin=True, dispenser=None):
+        """
+        Initialize Cash Machine attributes.
+
+        Args:
+            formatter (CurrencyFormatter): Formats amounts, defaults to the current locale's conventions.
+            require_pin (bool): Whether transactions need a session opened with the PIN.
+            dispenser (CashDispenser): Optional note cassettes that withdrawals are paid from.
+        """
+        self.formatter = formatter or CurrencyFormatter.from_locale()
+        self.balance = 0  # In cents
+        self.transaction_history = Ledger(self.format_currency)
+        self.pin_salt = None
+        self.pin_hash = None  # Only the salted hash of the PIN is kept
+        self.require_pin = require_pin
+        self.dispenser = dispenser
+        self.failed_attempts = 0
+        self.locked = False  # Set after MAX_PIN_ATTEMPTS wrong PINs in a row
+        self.pin_listener = None  # Called with the cash machine whenever the PIN or lockout state changes
+        self.session_token = None
+        self.session_expires = 0.0
+        self.lock = threading.Lock()  # Makes the balance check and update atomic
+
+    def check_balance(self):
+        """Return a formatted string indicating the current balance"""
+        return f"Your current balance: {self.format_currency(self.balance)}"
+
+    def balance_at(self, timestamp):
+        """
+        Return the balance at a past moment.
+
+        Args:
+            timestamp (int): Nanoseconds since the epoch.
+
+        Returns:
+            int: The balance in cents at that moment.
+        """
+        balance = self.transaction_history.balance_at(timestamp)
+        return 0 if balance is None else balance
+
+    @staticmethod
+    def valid_pin(pin):
+        """Return True if a PIN has the required 4-digit format"""
+        return bool(pin) and pin.isdigit() and len(pin) == 4
+
+    def store_pin(self, pin):
+        """Replace the stored PIN hash, with a fresh salt"""
+        salt = os.urandom(16)
+        self.pin_salt, self.pin_hash = salt, hash_pin(pin, salt)
+
+    def pin_changed(self):
+        """Tell the pin_listener, e.g. a Journal persisting the PIN, that the PIN or lockout state changed"""
+        if self.pin_listener is not None:
+            self.pin_listener(self)
+
+    def set_pin(self, pin):
+        """
+        Set the first PIN if it's a 4-digit number, storing only a salted hash.
+
+        Once a PIN is set it can only be replaced with change_pin, which needs the
+        current PIN, or by the bank with reset_pin.
+
+        Args:
+            pin (str): The PIN to set.
+
+        Returns:
+            bool: True if the PIN is set successfully, False if it is invalid or a PIN is already set.
+        """
+        if self.pin_hash is not None or not self.valid_pin(pin):
+            return False
+        self.store_pin(pin)
+        self.pin_changed()
+        return True
+
+    def change_pin(self, old_pin, new_pin):
+        """
+        Replace the PIN after verifying the current one.
+
+        A wrong current PIN counts towards the lockout like any other attempt,
+        and a locked card cannot change its PIN.
+
+        Args:
+            old_pin (str): The current PIN.
+            new_pin (str): The new 4-digit PIN.
+
+        Returns:
+            bool: True if the PIN was changed, False if the new PIN is invalid or the current one was not verified.
+        """
+        if not self.valid_pin(new_pin) or not self.verify_pin(old_pin):
+            return False
+        self.store_pin(new_pin)
+        self.pin_changed()
+        return True
+
+    def reset_pin(self, pin):
+        """
+        Set a new PIN and unlock the card; an administrative operation for the bank, never offered to the customer.
+
+        Args:
+            pin (str): The new 4-digit PIN.
+
+        Returns:
+            bool: True if the PIN was reset, False if it is invalid.
+        """
+        if not self.valid_pin(pin):
+            return False
+        self.store_pin(pin)
+        self.failed_attempts = 0
+        self.locked = False
+        self.pin_changed()
+        self.close_session()
+        return True
+
+    def verify_pin(self, pin):
+        """
+        Verify if the entered PIN matches the stored PIN.
+
+        Wrong PINs are counted; after MAX_PIN_ATTEMPTS in a row the card is locked
+        and every further attempt fails until the bank calls reset_pin.
+
+        Args:
+            pin (str): The PIN to verify.
+
+        Returns:
+            bool: True if the PIN is verified successfully, False otherwise.
+        """
+        if self.locked or self.pin_hash is None or not pin:
+            return False
+        if hmac.compare_digest(hash_pin(pin, self.pin_salt), self.pin_hash):
+            if self.failed_attempts:
+                self.failed_attempts = 0
+                self.pin_changed()
+            return True
+        self.failed_attempts += 1
+        if self.failed_attempts >= MAX_PIN_ATTEMPTS:
+            self.locked = True
+        # Before returning, so a restart cannot clear a wrong attempt
+        self.pin_changed()
+        return False
+
+    def open_session(self, pin):
+        """
+        Verify the PIN once and open a session for the following transactions.
+
+        Args:
+            pin (str): The PIN to verify.
+
+        Returns:
+            str: A session token, or None if the PIN was not verified.
+        """
+        if not self.verify_pin(pin):
+            return None
+        self.session_token = secrets.token_hex(16)
+        self.session_expires = time.monotonic() + SESSION_TTL
+        return self.session_token
+
+    def check_session(self, token):
+        """
+        Check a session token and extend the session if it is valid.
+
+        Args:
+            token (str): The token returned by open_session.
+
+        Returns:
+            bool: True if the token belongs to the current, unexpired session.
+        """
+        if not self.require_pin:
+            return True
+        now = time.monotonic()
+        if token is None or self.session_token is None or now >= self.session_expires:
+            return False
+        if not hmac.compare_digest(token, self.session_token):
+            return False
+        self.session_expires = now + SESSION_TTL
+        return True
+
+    def close_session(self):
+        """End the current session"""
+        self.session_token = None
+
+    def withdraw_money(self, amount, session=None):
+        """
+        Withdraw money from the cash machine.
+
+        Args:
+            amount (int): The amount to be withdrawn, in cents.
+            session (str): The session token from open_session, when a PIN is required.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        if 0 < amount <= MAX_AMOUNT and self.check_session(session):
+            with self.lock:
+                if self.balance >= amount:
+                    # Take the notes first, so an amount that can't be paid out leaves the balance untouched
+                    if self.dispenser is not None and self.dispenser.dispense(amount) is None:
+                        return "Amount cannot be dispensed with the notes available.", False
+                    self.balance -= amount
+                    return self.transaction_history.append(WITHDRAWAL, amount, self.balance), True
+                else:
+                    return str(self.transaction_history.append(INSUFFICIENT_FUNDS, amount, self.balance)), False
+        else:
+            if amount <= 0:
+                return "Invalid withdrawal amount. Amount must be greater than 0.", False
+            elif amount > MAX_AMOUNT:
+                return f"Invalid withdrawal amount. Amount must not exceed {self.format_currency(MAX_AMOUNT)}.", False
+            elif self.pin_hash is None:
+                return "Invalid operation. PIN not set.", False
+            else:
+                return "Session expired. Please enter your PIN again.", False
+
+    def deposit_money(self, amount, session=None):
+        """
+        Deposit money into the cash machine.
+
+        Args:
+            amount (int): The amount to be deposited, in cents.
+            session (str): The session token from open_session, when a PIN is required.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        if 0 < amount <= MAX_AMOUNT and self.check_session(session):
+            with self.lock:
+                # Checked before the balance changes, so a rejected deposit leaves no trace
+                if self.balance + amount > MAX_BALANCE:
+                    return "Deposit declined. The balance would exceed the maximum this machine can hold.", False
+                self.balance += amount
+                return self.transaction_history.append(DEPOSIT, amount, self.balance), True
+        else:
+            if amount <= 0:
+                return "Invalid deposit amount. Amount must be greater than 0.", False
+            elif amount > MAX_AMOUNT:
+                return f"Invalid deposit amount. Amount must not exceed {self.format_currency(MAX_AMOUNT)}.", False
+            elif self.pin_hash is None:
+                return "Invalid operation. PIN not set.", False
+            else:
+                return "Session expired. Please enter your PIN again.", False
+
+    def note_breakdown(self, amount):
+        """
+        Describe the notes a withdrawal would be paid in, without dispensing them.
+
+        Args:
+            amount (int): The amount in cents.
+
+        Returns:
+            str: e.g. "2 x €50.00, 1 x €10.00"; an empty string without a dispenser, or None if the amount cannot be dispensed.
+        """
+        if self.dispenser is None:
+            return ""
+        with self.dispenser.lock:
+            breakdown = self.dispenser.plan(amount)
+        if breakdown is None:
+            return None
+        return ", ".join(f"{count} x {self.format_currency(denomination)}" for denomination, count in zip(self.dispenser.denominations, breakdown) if count)
+
+    def low_cash(self):
+        """Return a warning naming the notes that are running out, or an empty string"""
+        if self.dispenser is None:
+            return ""
+        low = self.dispenser.low_cash()
+        if not low:
+            return ""
+        return "Low on " + ", ".join(f"{self.format_currency(denomination)} notes" for denomination in low) + "."
+
+    def format_currency(self, amount):
+        """
+        Format the amount as currency.
+
+        Args:
+            amount (int): The amount to be formatted, in cents.
+
+        Returns:
+            str: The formatted amount as currency.
+        """
+        return self.formatter.format(amount)
+
+class TransactionHandler:
+    """Class handling transactions"""
+
+    def __init__(self, cash_machine, journal=None, accounts=None, limits=None, risk=None, idempotency=None):
+        """
+        Initialize TransactionHandler with a CashMachine instance.
+
+        Args:
+            cash_machine (CashMachine): The cash machine to operate on.
+            journal (Journal): Optional journal that makes transactions durable.
+            accounts (AccountStore): Optional store for transactions on other accounts.
+            limits (WithdrawalLimits): Optional rolling limits checked before a withdrawal changes a balance.
+            risk (VelocityScorer): Optional scoring stage that can decline a withdrawal before the limits are checked.
+            idempotency (IdempotencyCache): Optional cache that makes transactions with the same key run once.
+
+        Raises:
+            ValueError: If the journal was not recovered, so no transaction could be recorded in it.
+        """
+        # Checked up front, since a transaction's balance changes before it is journaled
+        if journal is not None and journal.log is None:
+            raise ValueError("The journal is not open. Call recover() before handling transactions with it.")
+        self.cash_machine = cash_machine
+        self.journal = journal
+        self.accounts = accounts
+        self.limits = limits
+        self.risk = risk
+        self.idempotency = idempotency
+        self.clock = now_ns  # Timestamps the limits and risk checks; a replay substitutes the recorded ones
+
+    def perform_withdrawal(self, amount, account=None, session=None, key=None):
+        """
+        Perform a withdrawal transaction.
+
+        Args:
+            amount (int): The amount to be withdrawn, in cents.
+            account (int): The account number in the AccountStore, or None for the cash machine's own balance.
+            session (str): The session token from CashMachine.open_session.
+            key (hashable): Optional idempotency key; a retry with the same key gets the first result without debiting again.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        if key is not None and self.idempotency is not None:
+            # Called through the class, so wrappers installed on this instance see the request once
+            return self.idempotency.run(key, (WITHDRAWAL, account, amount),
+                                        lambda: TransactionHandler.perform_withdrawal(self, amount, account, session))
+        try:
+            # Out-of-range amounts get the cash machine's own message without being scored or counted
+            if not 0 < amount <= MAX_AMOUNT or (self.limits is None and self.risk is None):
+                return self.withdraw(amount, account, session)
+            # The cash machine's own balance is checked as account 0, like its ledger entries
+            checked_account = 0 if account is None else account
+            timestamp = self.clock()
+            if self.risk is not None:
+                message = self.risk.check(checked_account, amount, timestamp)
+                if message is not None:
+                    return message, False
+            if self.limits is not None:
+                message = self.limits.reserve(checked_account, amount, timestamp)
+                if message is not None:
+                    return message, False
+            result, success = self.withdraw(amount, account, session)
+            if not success:
+                if self.limits is not None:
+                    self.limits.release(checked_account, amount, timestamp)
+            elif self.risk is not None:
+                # Only withdrawals that went through teach the profile what is usual for the account
+                self.risk.record(checked_account, amount, timestamp)
+            return result, success
+        except ValueError as e:
+            if "Insufficient funds" in str(e):
+                return "Insufficient funds. Withdrawal amount exceeds the current balance.", False
+            else:
+                return f"Error: {str(e)}", False
+
+    def withdraw(self, amount, account, session):
+        """Withdraw from an account or the cash machine, journaling cash machine withdrawals"""
+        if account is not None:
+            return self.accounts.withdraw_money(account, amount)
+        result, success = self.cash_machine.withdraw_money(amount, session)
+        self.record_transaction()
+        return result, success
+
+    def perform_deposit(self, amount, account=None, session=None, key=None):
+        """
+        Perform a deposit transaction.
+
+        Args:
+            amount (int): The amount to be deposited, in cents.
+            account (int): The account number in the AccountStore, or None for the cash machine's own balance.
+            session (str): The session token from CashMachine.open_session.
+            key (hashable): Optional idempotency key; a retry with the same key gets the first result without crediting again.
+
+        Returns:
+            tuple: A tuple containing a transaction result (LedgerEntry or str) and success status (bool).
+        """
+        if key is not None and self.idempotency is not None:
+            return self.idempotency.run(key, (DEPOSIT, account, amount),
+                                        lambda: TransactionHandler.perform_deposit(self, amount, account, session))
+        try:
+            if account is not None:
+                return self.accounts.deposit_money(account, amount)
+            result, success = self.cash_machine.deposit_money(amount, session)
+            self.record_transaction()
+            return result, success
+        except ValueError as e:
+            return f"Error: {str(e)}", False
+
+    def perform_refill(self, denomination, notes):
+        """
+        Load notes into one of the cash machine's cassettes, saving the new counts to the journal.
+
+        Args:
+            denomination (int): The note value in cents.
+            notes (int): The number of notes added.
+        """
+        self.cash_machine.dispenser.refill(denomination, notes)
+        if self.journal is not None:
+            self.journal.save_cassettes(self.cash_machine)
+
+    def perform_batch(self, accounts, amounts, timestamps=None):
+        """
+        Perform a batch of transactions on the AccountStore with vectorized arithmetic.
+
+        Args:
+            accounts (array-like): Account numbers, one per row.
+            amounts (array-like): Signed amounts in cents; positive deposits, negative withdrawals.
+            timestamps (array-like): Nanoseconds since the epoch per row, defaults to now.
+
+        Returns:
+            numpy.ndarray: A status per row, see atm/batch.py.
+        """
+        return apply_batch(self.accounts, accounts, amounts, timestamps)
+
+    def record_transaction(self):
+        """Append new ledger entries to the journal, if there is one"""
+        if self.journal is not None:
+            self.journal.record(self.cash_machine)
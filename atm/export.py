@@ -0,0 +1,168 @@
+"""Streaming statement export as CSV or JSON Lines.
+
+Rows come from generators over the in-memory ledger, a memory-mapped ledger
+archive or a journal directory on disk, and are written out in fixed-size chunks, so the memory an
+export needs does not grow with the length of the history.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from .archive import LedgerArchive
+from .clock import format_timestamp
+from .journal import read_journal
+from .ledger import DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS
+from .money import MINOR_UNITS
+
+KIND_NAMES = {DEPOSIT: "deposit", WITHDRAWAL: "withdrawal", INSUFFICIENT_FUNDS: "declined"}
+FIELDS = ("date", "type", "amount", "balance", "account")
+
+
+def ledger_rows(ledger, account=None, start=None, end=None):
+    """
+    Yield the raw rows of an in-memory ledger, in the order they were recorded.
+
+    Args:
+        ledger (Ledger): The ledger to read.
+        account (int): Only yield entries of this account.
+        start (int): Earliest timestamp in nanoseconds since the epoch, inclusive.
+        end (int): Latest timestamp in nanoseconds since the epoch, exclusive.
+
+    Yields:
+        tuple: (timestamp, kind, amount, balance, account) per entry.
+    """
+    timestamps, kinds, amounts, balances, accounts = ledger.columns
+    for index in ledger.between(start, end, account):
+        yield timestamps[index], kinds[index], amounts[index], balances[index], accounts[index]
+
+
+def journal_rows(directory, account=None, start=None, end=None):
+    """
+    Yield the raw rows persisted in a journal directory, oldest first.
+
+    Args:
+        directory (str): The journal directory.
+        account (int): Only yield entries of this account.
+        start (int): Earliest timestamp in nanoseconds since the epoch, inclusive.
+        end (int): Latest timestamp in nanoseconds since the epoch, exclusive.
+
+    Yields:
+        tuple: (timestamp, kind, amount, balance, account) per entry.
+    """
+    for row in read_journal(directory):
+        timestamp = row[0]
+        if account is not None and row[4] != account:
+            continue
+        if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+            continue
+        yield row
+
+
+def format_cents(amount):
+    """Format an amount in cents as a plain decimal string, e.g. 123456 -> "1234.56" """
+    units, cents = divmod(abs(amount), MINOR_UNITS)
+    return f"{'-' if amount < 0 else ''}{units}.{cents:02d}"
+
+
+def statement_rows(rows):
+    """
+    Turn raw rows into statement rows.
+
+    Args:
+        rows (iterable): (timestamp, kind, amount, balance, account) tuples.
+
+    Yields:
+        tuple: The values of FIELDS as strings and ints.
+    """
+    for timestamp, kind, amount, balance, account in rows:
+        yield format_timestamp(timestamp), KIND_NAMES.get(kind, str(kind)), format_cents(amount), format_cents(balance), account
+
+
+def write_csv(rows, output, chunk_rows=1024):
+    """
+    Write statement rows as CSV with a header line.
+
+    Args:
+        rows (iterable): Raw ledger rows.
+        output (file): A text file opened with newline="".
+        chunk_rows (int): The number of rows buffered before each write.
+
+    Returns:
+        int: The number of rows written.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    count = 0
+    for row in statement_rows(rows):
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            output.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+    output.write(buffer.getvalue())
+    return count
+
+
+def write_jsonl(rows, output, chunk_rows=1024):
+    """
+    Write statement rows as JSON Lines, one object per entry.
+
+    Args:
+        rows (iterable): Raw ledger rows.
+        output (file): A text file.
+        chunk_rows (int): The number of rows buffered before each write.
+
+    Returns:
+        int: The number of rows written.
+    """
+    chunk = []
+    count = 0
+    for row in statement_rows(rows):
+        chunk.append(json.dumps(dict(zip(FIELDS, row))))
+        count += 1
+        if len(chunk) == chunk_rows:
+            output.write("\n".join(chunk) + "\n")
+            chunk.clear()
+    if chunk:
+        output.write("\n".join(chunk) + "\n")
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a statement from a journal directory or a ledger archive")
+    parser.add_argument("source", help="journal directory, e.g. atm_journal, or archive file")
+    parser.add_argument("--format", choices=WRITERS, default="csv")
+    parser.add_argument("--account", type=int, help="only export this account")
+    parser.add_argument("--start", type=int, help="earliest timestamp in ns since the epoch")
+    parser.add_argument("--end", type=int, help="latest timestamp in ns since the epoch, exclusive")
+    parser.add_argument("--output", help="output file, defaults to stdout")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        archive = None
+        rows = journal_rows(args.source, args.account, args.start, args.end)
+    else:
+        archive = LedgerArchive(args.source)
+        rows = ledger_rows(archive, args.account, args.start, args.end)
+    try:
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                WRITERS[args.format](rows, output)
+        else:
+            WRITERS[args.format](rows, sys.stdout)
+    finally:
+        if archive is not None:
+            rows.close()
+            archive.close()
+
+
+if __name__ == "__main__":
+    main()
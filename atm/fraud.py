@@ -0,0 +1,136 @@
+import math
+import threading
+from .clock import NS_PER_SECOND
+
+
+class AccountProfile:
+    """Running statistics of one account's withdrawals, updated in constant time"""
+
+    __slots__ = ("count", "mean", "m2", "last", "gap", "burst_start", "burst")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0  # Mean amount in cents
+        self.m2 = 0.0  # Sum of squared deviations from the mean (Welford)
+        self.last = None  # Timestamp of the previous withdrawal
+        self.gap = None  # Moving average of the time between withdrawals, in ns
+        self.burst_start = 0
+        self.burst = 0  # Withdrawals since burst_start
+
+
+class VelocityScorer:
+    """
+    Class scoring withdrawals against each account's own habits.
+
+    Every withdrawal that goes through is recorded in a fixed-size profile:
+    Welford's running mean and variance of the amounts and a moving average of
+    the time between withdrawals. Declined, invalid and failed withdrawals are
+    never recorded, so retrying one does not teach the profile to accept it.
+    Every attempt still counts towards the current burst window, so retrying
+    does not escape the burst limit either. The score adds up how unusual the
+    amount is (standard deviations beyond `amount_sigmas`), how much faster
+    than usual the withdrawal follows the previous one, and how far the burst
+    is over `burst_limit`. Scoring never reads the history, so it costs the
+    same few microseconds for every account however long its history is.
+    """
+
+    def __init__(self, threshold=3.0, amount_sigmas=3.0, min_history=5, burst_window=60, burst_limit=5, gap_weight=0.1):
+        """
+        Initialize the VelocityScorer.
+
+        Args:
+            threshold (float): The score at which a withdrawal is flagged.
+            amount_sigmas (float): Standard deviations from the mean amount that still score nothing.
+            min_history (int): Withdrawals seen before amounts and gaps are scored.
+            burst_window (float): The burst window in seconds.
+            burst_limit (int): Withdrawals allowed in one burst window before they score.
+            gap_weight (float): Weight of the newest gap in the moving average of gaps.
+        """
+        self.threshold = threshold
+        self.amount_sigmas = amount_sigmas
+        self.min_history = min_history
+        self.burst_window = int(burst_window * NS_PER_SECOND)
+        self.burst_limit = burst_limit
+        self.gap_weight = gap_weight
+        self.profiles = {}  # Account number -> AccountProfile
+        self.flagged = 0
+        self.lock = threading.Lock()
+
+    def score(self, account, amount, timestamp):
+        """
+        Score a withdrawal attempt and count it towards the account's burst.
+
+        Args:
+            account (int): The account number.
+            amount (int): The withdrawal amount in cents.
+            timestamp (int): Nanoseconds since the epoch.
+
+        Returns:
+            tuple: The score (float) and a list of the reasons that contributed to it.
+        """
+        with self.lock:
+            profile = self.profiles.get(account)
+            if profile is None:
+                profile = self.profiles[account] = AccountProfile()
+            score, reasons = 0.0, []
+
+            if profile.count >= self.min_history:
+                # Floor the deviation so an account that always withdraws the same amount isn't flagged for a cent more
+                deviation = max(math.sqrt(profile.m2 / max(profile.count - 1, 1)), profile.mean * 0.1, 100.0)
+                sigmas = (amount - profile.mean) / deviation
+                if sigmas > self.amount_sigmas:
+                    score += sigmas - self.amount_sigmas
+                    reasons.append("unusual amount")
+                if profile.gap and timestamp - profile.last < profile.gap / 20:
+                    score += 1.0
+                    reasons.append("unusually quick")
+
+            if timestamp - profile.burst_start > self.burst_window:
+                profile.burst_start, profile.burst = timestamp, 0
+            profile.burst += 1
+            if profile.burst > self.burst_limit:
+                score += profile.burst - self.burst_limit
+                reasons.append("burst")
+
+            if score >= self.threshold:
+                self.flagged += 1
+            return score, reasons
+
+    def record(self, account, amount, timestamp):
+        """
+        Add a withdrawal that went through to the account's profile.
+
+        Args:
+            account (int): The account number.
+            amount (int): The withdrawal amount in cents.
+            timestamp (int): Nanoseconds since the epoch, as passed to score().
+        """
+        with self.lock:
+            profile = self.profiles.get(account)
+            if profile is None:
+                profile = self.profiles[account] = AccountProfile()
+            profile.count += 1
+            delta = amount - profile.mean
+            profile.mean += delta / profile.count
+            profile.m2 += delta * (amount - profile.mean)
+            if profile.last is not None:
+                gap = max(timestamp - profile.last, 0)
+                profile.gap = gap if profile.gap is None else profile.gap + self.gap_weight * (gap - profile.gap)
+            profile.last = timestamp
+
+    def check(self, account, amount, timestamp):
+        """
+        Score a withdrawal and decide whether it may go ahead.
+
+        Args:
+            account (int): The account number.
+            amount (int): The withdrawal amount in cents.
+            timestamp (int): Nanoseconds since the epoch.
+
+        Returns:
+            str: A message if the withdrawal is flagged, or None.
+        """
+        score, reasons = self.score(account, amount, timestamp)
+        if score >= self.threshold:
+            return f"Withdrawal declined for review ({', '.join(reasons)}). Please contact your bank."
+        return None
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import threading
+import time
+
+# Time a key is remembered, and the most keys remembered at once
+DEFAULT_TTL = 86400.0
+DEFAULT_CAPACITY = 100000
+
+
+class IdempotentCall:
+    """Class holding the outcome of one keyed transaction, which duplicates wait for"""
+
+    __slots__ = ("fingerprint", "expires", "result", "running")
+
+    def __init__(self, fingerprint, expires):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.result = None
+        self.running = True
+
+
+class IdempotencyCache:
+    """
+    Class remembering the results of keyed transactions, so a retried request is not executed twice.
+
+    Finished keys live in an OrderedDict kept in least recently used order, so
+    a lookup, an insertion and an eviction each cost constant time. At most
+    `capacity` finished keys are kept: a new key evicts the least recently used
+    one, and a key older than `ttl` seconds is forgotten. Keys whose
+    transaction is still running are kept apart and never evicted, since
+    forgetting one would let a retry execute the transaction a second time; the
+    cache may hold that many keys over capacity. A duplicate that arrives while
+    the original is still running waits for it and gets its result.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, ttl=DEFAULT_TTL):
+        """
+        Initialize the IdempotencyCache.
+
+        Args:
+            capacity (int): The most finished keys remembered at once.
+            ttl (float): Seconds a key is remembered after its transaction started.
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.calls = OrderedDict()  # Key -> finished IdempotentCall, least recently used first
+        self.running = {}  # Key -> IdempotentCall still executing
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)  # Notified whenever a keyed transaction finishes
+        self.hits = 0
+        self.evictions = 0
+
+    def run(self, key, fingerprint, operation):
+        """
+        Execute an operation once per key and return its result for every duplicate.
+
+        Args:
+            key (hashable): The idempotency key chosen by the client, e.g. a UUID.
+            fingerprint (tuple): What the request does; a key reused for a different request is rejected.
+            operation (callable): Executes the transaction and returns (result, success).
+
+        Returns:
+            tuple: The (result, success) of the first request with this key.
+        """
+        calls, running = self.calls, self.running
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                call = running.get(key)
+                if call is None:
+                    call = calls.get(key)
+                    if call is not None and call.expires <= now:
+                        del calls[key]
+                        call = None
+                    if call is None:
+                        call = running[key] = IdempotentCall(fingerprint, now + self.ttl)
+                        break
+                    calls.move_to_end(key)
+                self.hits += 1
+                if call.fingerprint != fingerprint:
+                    return "Idempotency key already used for a different transaction.", False
+                while call.running:
+                    self.finished.wait()
+                if call.result is not None:
+                    return call.result
+            # The original raised instead of returning and was forgotten, so this duplicate runs it
+
+        try:
+            result = operation()
+        except BaseException:
+            with self.lock:
+                del running[key]
+                call.running = False
+                self.finished.notify_all()
+            raise
+        with self.lock:
+            del running[key]
+            call.result = result
+            call.running = False
+            calls[key] = call
+            self.evict(time.monotonic())
+            self.finished.notify_all()
+        return result
+
+    def evict(self, now):
+        """Drop expired keys from the least recently used end and any finished keys over capacity; called with the lock held"""
+        calls = self.calls
+        while calls:
+            oldest = next(iter(calls.values()))
+            if len(calls) <= self.capacity and oldest.expires > now:
+                return
+            calls.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.calls) + len(self.running)
@@ -0,0 +1,373 @@
+from array import array
+import os
+import struct
+import threading
+import zlib
+from .ledger import WITHDRAWAL
+
+# seq, kind, amount, balance after the transaction, timestamp, account, followed by a CRC32
+RECORD = struct.Struct("<Qbqqqq")
+CHECKSUM = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + CHECKSUM.size
+
+# seq of the last journaled record, balance, number of ledger entries
+SNAPSHOT_HEADER = struct.Struct("<QqQ")
+# Typecodes of the ledger columns stored after the snapshot header, in Ledger.columns order
+SNAPSHOT_COLUMNS = "qbqqq"
+
+# Ledger entries the cassette counts already reflect, number of cassettes; then a note value and count per cassette
+CASSETTES_HEADER = struct.Struct("<QI")
+CASSETTE = struct.Struct("<qq")
+# PIN salt, PBKDF2-SHA256 hash of the PIN, wrong attempts in a row, whether the card is locked
+PIN_STATE = struct.Struct("<16s32sI?")
+
+LOG_NAME = "journal.log"
+SNAPSHOT_NAME = "snapshot.bin"
+CASSETTES_NAME = "cassettes.bin"
+PIN_NAME = "pin.bin"
+
+
+def read_log(path, chunk_records=4096):
+    """
+    Read the valid records of a journal log, stopping at the first torn or corrupt one.
+
+    Args:
+        path (str): The log file.
+        chunk_records (int): The number of records read from disk at a time.
+
+    Yields:
+        tuple: (end offset, seq, kind, amount, balance, timestamp, account) per record.
+    """
+    if not os.path.exists(path):
+        return
+    offset = 0
+    with open(path, "rb") as log:
+        while True:
+            data = log.read(chunk_records * RECORD_SIZE)
+            for start in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+                body = data[start:start + RECORD.size]
+                (checksum,) = CHECKSUM.unpack_from(data, start + RECORD.size)
+                if zlib.crc32(body) != checksum:
+                    return
+                offset += RECORD_SIZE
+                yield (offset,) + RECORD.unpack(body)
+            if len(data) < chunk_records * RECORD_SIZE:
+                return
+
+
+def read_snapshot(path, chunk_rows=4096):
+    """
+    Read the ledger rows of a snapshot a chunk at a time, without loading whole columns.
+
+    Args:
+        path (str): The snapshot file.
+        chunk_rows (int): The number of rows read from each column at a time.
+
+    Yields:
+        tuple: (timestamp, kind, amount, balance, account) per ledger entry.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as snapshot:
+        seq, balance, count = SNAPSHOT_HEADER.unpack(snapshot.read(SNAPSHOT_HEADER.size))
+        offsets, position = [], SNAPSHOT_HEADER.size
+        for typecode in SNAPSHOT_COLUMNS:
+            offsets.append(position)
+            position += array(typecode).itemsize * count
+        for first in range(0, count, chunk_rows):
+            size = min(chunk_rows, count - first)
+            chunk = []
+            for typecode, offset in zip(SNAPSHOT_COLUMNS, offsets):
+                column = array(typecode)
+                snapshot.seek(offset + first * column.itemsize)
+                column.fromfile(snapshot, size)
+                chunk.append(column)
+            yield from zip(*chunk)
+
+
+def read_journal(directory, chunk_rows=4096):
+    """
+    Read the ledger persisted in a journal directory, streaming the snapshot and then the log tail.
+
+    Args:
+        directory (str): The directory holding the log and snapshot files.
+        chunk_rows (int): The number of rows read from disk at a time.
+
+    Yields:
+        tuple: (timestamp, kind, amount, balance, account) per ledger entry, oldest first.
+    """
+    snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+    snapshot_seq = 0
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, "rb") as snapshot:
+            snapshot_seq = SNAPSHOT_HEADER.unpack(snapshot.read(SNAPSHOT_HEADER.size))[0]
+    yield from read_snapshot(snapshot_path, chunk_rows)
+    for _, seq, kind, amount, balance, timestamp, account in read_log(os.path.join(directory, LOG_NAME), chunk_rows):
+        if seq > snapshot_seq:
+            yield timestamp, kind, amount, balance, account
+
+
+class Journal:
+    """
+    Append-only write-ahead journal for a CashMachine.
+
+    Every ledger entry is appended to a log file as a fixed-width record with a
+    checksum. record() returns only once the records it covers are fsynced, so
+    a transaction the customer saw succeed survives a crash. Syncs are shared
+    by group commit: one caller at a time fsyncs everything written so far,
+    while callers arriving in the meantime write their records and wait for
+    the next sync, which then covers all of them. Every `snapshot_every`
+    records the full state is written to a snapshot and the log is truncated.
+
+    The note counts of a cash machine's dispenser are saved when it is refilled
+    and with every snapshot, together with the number of ledger entries they
+    reflect. Recovery loads them and dispenses the withdrawals recorded since
+    again, so a restart neither refills the cassettes nor forgets what they held.
+    The PIN hash and lockout state are saved whenever they change, so a restart
+    neither asks for a new PIN nor forgets wrong attempts.
+    """
+
+    def __init__(self, directory, snapshot_every=100000):
+        """
+        Initialize the Journal.
+
+        Args:
+            directory (str): The directory holding the log and snapshot files.
+            snapshot_every (int): The number of records between snapshots.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.cassettes_path = os.path.join(directory, CASSETTES_NAME)
+        self.pin_path = os.path.join(directory, PIN_NAME)
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.synced_seq = 0  # Every record up to this seq is on disk
+        self.syncing = False  # Whether a caller is fsyncing the log outside the lock
+        self.recorded = 0  # Ledger entries already journaled
+        self.since_snapshot = 0
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)  # Notified after every sync
+        self.log = None
+
+    def recover(self, cash_machine):
+        """
+        Restore a CashMachine from the latest snapshot and the journal tail.
+
+        A torn or corrupt record at the end of the log is discarded. The cash
+        machine's dispenser, if it has one, gets the note counts it had when the
+        last recovered entry was recorded. The saved PIN and lockout state are
+        restored, and every later change to them is saved.
+
+        Args:
+            cash_machine (CashMachine): The cash machine to restore into.
+        """
+        ledger = cash_machine.transaction_history
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as snapshot:
+                snapshot_seq, cash_machine.balance, count = SNAPSHOT_HEADER.unpack(snapshot.read(SNAPSHOT_HEADER.size))
+                for column in ledger.columns:
+                    column.fromfile(snapshot, count)
+                ledger.reindex()
+        self.seq = snapshot_seq
+
+        valid = 0
+        for valid, seq, kind, amount, balance, timestamp, account in read_log(self.log_path):
+            if seq <= snapshot_seq:
+                continue
+            ledger.append(kind, amount, balance, timestamp, account)
+            cash_machine.balance = balance
+            self.seq = seq
+            self.since_snapshot += 1
+
+        self.synced_seq = self.seq
+        self.recorded = len(ledger)
+        self.log = open(self.log_path, "ab")
+        self.log.truncate(valid)
+        if cash_machine.dispenser is not None:
+            self.restore_cassettes(cash_machine)
+            # Saved right away, so the next recovery only dispenses what is withdrawn from now on
+            self.save_cassettes(cash_machine)
+        if os.path.exists(self.pin_path):
+            with open(self.pin_path, "rb") as pin:
+                salt, pin_hash, failed_attempts, locked = PIN_STATE.unpack(pin.read(PIN_STATE.size))
+            cash_machine.pin_salt, cash_machine.pin_hash = salt, pin_hash
+            cash_machine.failed_attempts, cash_machine.locked = failed_attempts, locked
+        cash_machine.pin_listener = self.save_pin
+
+    def restore_cassettes(self, cash_machine):
+        """Load the saved note counts into the dispenser and dispense the withdrawals recorded after them"""
+        dispenser, ledger = cash_machine.dispenser, cash_machine.transaction_history
+        entries = 0
+        if os.path.exists(self.cassettes_path):
+            with open(self.cassettes_path, "rb") as cassettes:
+                entries, count = CASSETTES_HEADER.unpack(cassettes.read(CASSETTES_HEADER.size))
+                dispenser.load(dict(CASSETTE.iter_unpack(cassettes.read(count * CASSETTE.size))))
+        # Without saved counts the dispenser holds what was loaded before the first entry
+        kinds, amounts = ledger.kinds, ledger.amounts
+        for index in range(min(entries, len(ledger)), len(ledger)):
+            if kinds[index] == WITHDRAWAL:
+                dispenser.dispense(amounts[index])
+
+    def save_cassettes(self, cash_machine):
+        """
+        Atomically save the note counts of the cash machine's dispenser.
+
+        Call it after refilling the dispenser; snapshots and recovery call it too.
+
+        Args:
+            cash_machine (CashMachine): The cash machine whose dispenser is saved.
+        """
+        with self.lock:
+            self.save_cassettes_locked(cash_machine)
+
+    def save_cassettes_locked(self, cash_machine):
+        # Held from the cut to the rename, so an older cut never replaces a newer one
+        dispenser = cash_machine.dispenser
+        # Withdrawals dispense and append their entry under the cash machine's lock, so the counts match the entries
+        with cash_machine.lock, dispenser.lock:
+            entries = len(cash_machine.transaction_history)
+            rows = [CASSETTE.pack(denomination, count) for denomination, count in zip(dispenser.denominations, dispenser.counts)]
+        self.replace_file(self.cassettes_path, CASSETTES_HEADER.pack(entries, len(rows)) + b"".join(rows))
+
+    def save_pin(self, cash_machine):
+        """
+        Atomically save the PIN hash and lockout state of a cash machine.
+
+        Recovery installs it as the cash machine's pin_listener.
+
+        Args:
+            cash_machine (CashMachine): The cash machine whose PIN is saved.
+        """
+        if cash_machine.pin_hash is None:
+            return
+        with self.lock:
+            self.replace_file(self.pin_path, PIN_STATE.pack(cash_machine.pin_salt, cash_machine.pin_hash, cash_machine.failed_attempts, cash_machine.locked))
+
+    def replace_file(self, path, data):
+        """Atomically replace a small file in the journal directory; the caller holds the lock"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        self.sync_directory()
+
+    def record(self, cash_machine):
+        """
+        Append any ledger entries not yet journaled and wait until they are on disk.
+
+        Entries appended by other threads are journaled too, so on return every
+        entry the ledger held when it was called is durable.
+
+        Args:
+            cash_machine (CashMachine): The cash machine whose ledger is journaled.
+
+        Raises:
+            RuntimeError: If the journal is not open, i.e. recover() was not called or it was closed.
+        """
+        ledger = cash_machine.transaction_history
+        with self.lock:
+            if self.log is None:
+                raise RuntimeError("The journal is not open. Call recover() before recording transactions.")
+            records = []
+            with ledger.lock:
+                count = len(ledger)
+                accounts = ledger.accounts
+                for index in range(self.recorded, count):
+                    self.seq += 1
+                    timestamp, kind, amount, balance = ledger.entry(index)
+                    body = RECORD.pack(self.seq, kind, amount, balance, timestamp, accounts[index])
+                    records.append(body + CHECKSUM.pack(zlib.crc32(body)))
+            self.log.write(b"".join(records))
+            self.since_snapshot += len(records)
+            self.recorded = count
+            if self.since_snapshot >= self.snapshot_every:
+                self.snapshot_locked(cash_machine)
+            self.wait_synced(self.seq)
+
+    def wait_synced(self, seq):
+        """
+        Wait until every record up to seq is on disk; the caller holds the lock.
+
+        The first waiter becomes the leader: it fsyncs everything written so
+        far with the lock released, so followers can keep writing, and wakes
+        the followers it covered. The rest wait for a later sync.
+        """
+        while self.synced_seq < seq:
+            if self.syncing:
+                self.synced.wait()
+                continue
+            self.syncing = True
+            covered = self.seq
+            self.log.flush()
+            fileno = self.log.fileno()
+            self.lock.release()
+            try:
+                os.fsync(fileno)
+            finally:
+                self.lock.acquire()
+                self.syncing = False
+                self.synced.notify_all()
+            self.synced_seq = max(self.synced_seq, covered)
+
+    def sync(self):
+        """Force written records to disk"""
+        with self.lock:
+            self.wait_synced(self.seq)
+
+    def snapshot(self, cash_machine):
+        """Write a snapshot of the cash machine and truncate the log"""
+        with self.lock:
+            self.snapshot_locked(cash_machine)
+
+    def snapshot_locked(self, cash_machine):
+        while self.syncing:
+            self.synced.wait()
+        # The lock is held from here on, so no record is written between this sync and the truncation
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.synced_seq = self.seq
+        self.synced.notify_all()
+        ledger = cash_machine.transaction_history
+        # Copy exactly the journaled rows, since other threads may be appending
+        with ledger.lock:
+            columns = [column[:self.recorded] for column in ledger.columns]
+            last = next(ledger.chain(0, self.recorded), -1)
+            balance = ledger.balances[last] if last >= 0 else cash_machine.balance
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(self.seq, balance, self.recorded))
+            for column in columns:
+                column.tofile(snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.sync_directory()
+        # Records up to self.seq are covered by the snapshot, so replay skips them if we crash here
+        self.log.truncate(0)
+        os.fsync(self.log.fileno())
+        self.since_snapshot = 0
+        if cash_machine.dispenser is not None:
+            self.save_cassettes_locked(cash_machine)
+
+    def sync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        """Sync written records and close the log"""
+        with self.lock:
+            if self.log is not None:
+                self.wait_synced(self.seq)
+                while self.syncing:
+                    self.synced.wait()
+                self.log.close()
+                self.log = None
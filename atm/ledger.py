@@ -0,0 +1,423 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import itertools
+import threading
+from .clock import now_ns, format_timestamp
+from .money import CurrencyFormatter
+
+# Transaction kinds stored in the ledger
+DEPOSIT = 0
+WITHDRAWAL = 1
+INSUFFICIENT_FUNDS = 2
+
+MIN_TIMESTAMP = -(1 << 63)  # Older than any timestamp the ledger can hold
+
+
+class LedgerEntry:
+    """A lightweight view of one ledger row; the message text is rendered on demand"""
+
+    __slots__ = ("ledger", "index")
+
+    def __init__(self, ledger, index):
+        self.ledger = ledger
+        self.index = index
+
+    @property
+    def timestamp(self):
+        return self.ledger.timestamps[self.index]
+
+    @property
+    def kind(self):
+        return self.ledger.kinds[self.index]
+
+    @property
+    def amount(self):
+        return self.ledger.amounts[self.index]
+
+    @property
+    def balance(self):
+        return self.ledger.balances[self.index]
+
+    @property
+    def account(self):
+        return self.ledger.accounts[self.index]
+
+    def __str__(self):
+        return self.ledger.render(self.index)
+
+    def __repr__(self):
+        return f"LedgerEntry({self.index}, {str(self)!r})"
+
+
+class Ledger:
+    """
+    Append-only transaction history stored as parallel typed arrays.
+
+    Each transaction costs a few machine words instead of a formatted string;
+    the human-readable message is produced only when an entry is displayed.
+    Iterating or indexing the ledger yields the rendered messages, so it can be
+    used wherever the old list of strings was. Appends are thread-safe, and
+    the length only counts rows whose every column is written, so a reader
+    without the lock never sees a half-written row.
+
+    The indexes of each account's entries are kept in a sorted array, so one
+    account's entries in any index range are found by binary search without
+    scanning the rest of the ledger. Entries are stamped from a monotonic
+    clock, so the timestamp column is normally sorted and date ranges are
+    found by binary search too. An entry stamped before one recorded earlier,
+    e.g. from a batch carrying its own timestamps, is a late entry; late
+    entries are kept as runs of indexes. Date ranges are then found by binary
+    search over the newest timestamp recorded up to each entry, and only the
+    late entries are checked one by one.
+
+    Since each entry stores the balance after it, the balance at any past
+    moment is that of the account's last entry before the moment, found by a
+    binary search over the timestamps and one over the account's indexes.
+    """
+
+    def __init__(self, format_amount=None):
+        """
+        Initialize an empty ledger.
+
+        Args:
+            format_amount (callable): Formats an amount in cents for display, defaults to euros.
+        """
+        self.timestamps = array("q")  # Nanoseconds since the epoch
+        self.kinds = array("b")
+        self.amounts = array("q")  # In cents
+        self.balances = array("q")  # In cents
+        self.accounts = array("q")
+        self.positions = {}  # Account number -> array of the indexes of its entries, oldest first
+        self.newest = MIN_TIMESTAMP  # Newest timestamp recorded so far
+        self.late_starts = array("q")  # Runs [start, stop) of consecutive late entries
+        self.late_stops = array("q")
+        self.time_sorted = True  # False once an entry older than its predecessor was recorded
+        self.format_amount = format_amount or CurrencyFormatter().format
+        self.lock = threading.Lock()  # Keeps the columns aligned under concurrent appends
+        self.count = 0  # Rows fully written; raised last by every append
+
+    @property
+    def columns(self):
+        """The stored arrays, in storage order; the account index is derived from them"""
+        return self.timestamps, self.kinds, self.amounts, self.balances, self.accounts
+
+    def reindex(self):
+        """Rebuild the account index and late runs after the columns were loaded directly"""
+        self.positions = {}
+        self.newest = MIN_TIMESTAMP
+        self.late_starts = array("q")
+        self.late_stops = array("q")
+        self.time_sorted = True
+        link = self.link
+        for index, (account, timestamp) in enumerate(zip(self.accounts, self.timestamps)):
+            link(index, account, timestamp)
+        self.count = len(self.accounts)
+
+    def append(self, kind, amount, balance, timestamp=None, account=0):
+        """
+        Record a transaction.
+
+        Args:
+            kind (int): DEPOSIT, WITHDRAWAL or INSUFFICIENT_FUNDS.
+            amount (int): The transaction amount in cents.
+            balance (int): The balance after the transaction in cents.
+            timestamp (int): Nanoseconds since the epoch, defaults to now.
+            account (int): The account number, 0 for a single-account machine.
+
+        Returns:
+            LedgerEntry: A view of the recorded entry.
+        """
+        with self.lock:
+            if timestamp is None:
+                timestamp = now_ns()
+            index = self.count
+            try:
+                self.timestamps.append(timestamp)
+                self.kinds.append(kind)
+                self.amounts.append(amount)
+                self.balances.append(balance)
+                self.accounts.append(account)
+            except (OverflowError, TypeError):
+                # A value that doesn't fit its column must not leave the columns misaligned
+                for column in self.columns:
+                    del column[index:]
+                raise
+            # link(), inlined on the single-append hot path
+            positions = self.positions.get(account)
+            if positions is None:
+                positions = self.positions[account] = array("q")
+            positions.append(index)
+            if timestamp < self.newest:
+                self.mark_late(index)
+            else:
+                self.newest = timestamp
+            self.count = index + 1
+        return LedgerEntry(self, index)
+
+    def extend(self, timestamps, kinds, amounts, balances, accounts):
+        """
+        Record many transactions at once from equal-length typed arrays.
+
+        Args:
+            timestamps (array): Nanoseconds since the epoch ('q').
+            kinds (array): Transaction kinds ('b').
+            amounts (array): Transaction amounts in cents ('q').
+            balances (array): Balances after each transaction in cents ('q').
+            accounts (array): Account numbers ('q').
+        """
+        with self.lock:
+            start = self.count
+            for column, values in zip(self.columns, (timestamps, kinds, amounts, balances, accounts)):
+                column.extend(values)
+            link = self.link
+            for index, (account, timestamp) in enumerate(zip(accounts, timestamps), start):
+                link(index, account, timestamp)
+            self.count = start + len(accounts)
+
+    def link(self, index, account, timestamp):
+        """Add a new entry to its account's index and, if it is late, to the late runs; the caller holds the lock"""
+        positions = self.positions.get(account)
+        if positions is None:
+            positions = self.positions[account] = array("q")
+        positions.append(index)
+        if timestamp < self.newest:
+            self.mark_late(index)
+        else:
+            self.newest = timestamp
+
+    def mark_late(self, index):
+        """Add a new entry to the late runs; the caller holds the lock"""
+        # Stops are written before starts, so a reader that finds a run always finds its stop
+        if self.late_stops and self.late_stops[-1] == index:
+            self.late_stops[-1] = index + 1
+        else:
+            self.late_stops.append(index + 1)
+            self.late_starts.append(index)
+        self.time_sorted = False
+
+    def entry(self, index):
+        """Return the raw (timestamp, kind, amount, balance) fields of an entry"""
+        return self.timestamps[index], self.kinds[index], self.amounts[index], self.balances[index]
+
+    def recent(self, account, limit):
+        """
+        Return the indexes of an account's most recent entries.
+
+        Args:
+            account (int): The account number.
+            limit (int): The maximum number of entries.
+
+        Returns:
+            list: Entry indexes, newest first.
+        """
+        positions = self.positions.get(account)
+        if not positions:
+            return []
+        stop = bisect_left(positions, len(self))
+        return positions[max(stop - limit, 0):stop].tolist()[::-1]
+
+    def high_water(self, index):
+        """Return the newest timestamp recorded up to and including an entry"""
+        run = bisect_right(self.late_starts, index) - 1
+        if run >= 0 and index < self.late_stops[run]:
+            # The entry before a run of late entries is not late, so it holds the newest timestamp
+            return self.timestamps[self.late_starts[run] - 1]
+        return self.timestamps[index]
+
+    def time_range(self, start=None, end=None):
+        """
+        Return the index range of the entries stamped in [start, end).
+
+        On a ledger with late entries the range holds every entry in [start, end)
+        that is not late, but late entries inside it may be stamped outside
+        [start, end) and some after it may be stamped inside; between() and
+        query() account for both.
+
+        Args:
+            start (int): Nanoseconds since the epoch, inclusive; None for the beginning.
+            end (int): Nanoseconds since the epoch, exclusive; None for now.
+
+        Returns:
+            tuple: (first, stop) entry indexes.
+        """
+        count = len(self)
+        if self.late_starts:
+            # The newest timestamp up to each entry never decreases, so it can be searched instead
+            indexes, key = range(count), self.high_water
+            first = 0 if start is None else bisect_left(indexes, start, key=key)
+            stop = count if end is None else bisect_left(indexes, end, key=key)
+            return first, stop
+        first = 0 if start is None else bisect_left(self.timestamps, start, 0, count)
+        stop = count if end is None else bisect_left(self.timestamps, end, 0, count)
+        return first, stop
+
+    def late_entries(self, first, stop, start=None, end=None):
+        """
+        Return the indexes of the late entries in [first, stop) stamped in [start, end).
+
+        Args:
+            first (int): The first entry index to consider.
+            stop (int): The entry index to stop at.
+            start (int): Nanoseconds since the epoch, inclusive; None for the beginning.
+            end (int): Nanoseconds since the epoch, exclusive; None for no end.
+
+        Returns:
+            list: Entry indexes, oldest first.
+        """
+        starts, stops, timestamps = self.late_starts, self.late_stops, self.timestamps
+        indexes = []
+        for run in range(bisect_right(stops, first), len(starts)):
+            if starts[run] >= stop:
+                break
+            for index in range(max(starts[run], first), min(stops[run], stop)):
+                timestamp = timestamps[index]
+                if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                    indexes.append(index)
+        return indexes
+
+    def between(self, start=None, end=None, account=None):
+        """
+        Yield the indexes of the entries stamped in [start, end), in the order they were recorded.
+
+        Args:
+            start (int): Earliest timestamp in nanoseconds since the epoch, inclusive.
+            end (int): Latest timestamp in nanoseconds since the epoch, exclusive.
+            account (int): Only yield entries of this account.
+
+        Yields:
+            int: Entry indexes, oldest first.
+        """
+        count = len(self)
+        first, stop = self.time_range(start, end)
+        late = self.late_entries(stop, count, start, end)
+        accounts, timestamps = self.accounts, self.timestamps
+        if account is None:
+            candidates = range(first, stop)
+        else:
+            candidates = self.chain_forward(account, first, stop)
+            late = [index for index in late if accounts[index] == account]
+        check_time = not self.time_sorted and (start is not None or end is not None)
+        for index in candidates:
+            if check_time and ((start is not None and timestamps[index] < start) or (end is not None and timestamps[index] >= end)):
+                continue
+            yield index
+        yield from late
+
+    def query(self, start=None, end=None, kinds=None, min_amount=None, max_amount=None, account=None, limit=10, before=None):
+        """
+        Return one page of entries matching the filters, newest first.
+
+        The date range is located by binary search and only entries inside it are
+        examined, using the account's index when an account is given; a page of
+        recent entries therefore costs about `limit` row checks however long the
+        ledger is. Pass the returned cursor as `before` to fetch the next page.
+
+        Args:
+            start (int): Earliest timestamp in nanoseconds since the epoch, inclusive.
+            end (int): Latest timestamp in nanoseconds since the epoch, exclusive.
+            kinds (iterable): Transaction kinds to include, defaults to all.
+            min_amount (int): Smallest amount in cents to include.
+            max_amount (int): Largest amount in cents to include.
+            account (int): Only include entries of this account.
+            limit (int): The maximum number of entries on the page.
+            before (int): Cursor from a previous page; only older entries are returned.
+
+        Returns:
+            tuple: A list of LedgerEntry and the cursor of the next page, or None after the last page.
+        """
+        count = len(self) if before is None else min(before, len(self))
+        first, stop = self.time_range(start, end)
+        # Late entries past the range can still be stamped inside it; they come first, being the newest
+        late = self.late_entries(stop, count, start, end)
+        stop = min(stop, count)
+        kinds = None if kinds is None else frozenset(kinds)
+        check_time = not self.time_sorted and (start is not None or end is not None)
+        timestamps, amounts, kinds_column, accounts = self.timestamps, self.amounts, self.kinds, self.accounts
+        if account is None:
+            candidates = itertools.chain(reversed(late), range(stop - 1, first - 1, -1))
+        else:
+            late = [index for index in reversed(late) if accounts[index] == account]
+            candidates = itertools.chain(late, self.chain(account, stop, first))
+        entries = []
+        for index in candidates:
+            if len(entries) == limit:
+                return entries, index + 1
+            if kinds is not None and kinds_column[index] not in kinds:
+                continue
+            amount = amounts[index]
+            if (min_amount is not None and amount < min_amount) or (max_amount is not None and amount > max_amount):
+                continue
+            if check_time and ((start is not None and timestamps[index] < start) or (end is not None and timestamps[index] >= end)):
+                continue
+            entries.append(LedgerEntry(self, index))
+        return entries, None
+
+    def chain(self, account, stop, first=0):
+        """Yield the indexes of an account's entries in [first, stop), newest first"""
+        positions = self.positions.get(account)
+        if not positions:
+            return
+        for position in range(bisect_left(positions, stop) - 1, bisect_left(positions, first) - 1, -1):
+            yield positions[position]
+
+    def chain_forward(self, account, first, stop):
+        """Yield the indexes of an account's entries in [first, stop), oldest first"""
+        positions = self.positions.get(account)
+        if not positions:
+            return
+        for position in range(bisect_left(positions, first), bisect_left(positions, stop)):
+            yield positions[position]
+
+    def balance_at(self, timestamp, account=0):
+        """
+        Return an account's balance at a past moment.
+
+        Args:
+            timestamp (int): Nanoseconds since the epoch; entries stamped before it count.
+            account (int): The account number.
+
+        Returns:
+            int: The balance in cents after the last recorded of the account's entries before the moment, or None if it had none.
+        """
+        count = len(self)
+        # Every entry before stop is stamped before the moment; after it only late entries can be
+        first, stop = self.time_range(None, timestamp)
+        index = next(self.chain(account, stop), -1)
+        accounts = self.accounts
+        for late in reversed(self.late_entries(stop, count, None, timestamp)):
+            if accounts[late] == account:
+                index = late
+                break
+        return self.balances[index] if index >= 0 else None
+
+    def render(self, index):
+        """
+        Render the message for an entry.
+
+        Args:
+            index (int): The entry index.
+
+        Returns:
+            str: The transaction message as shown in the history.
+        """
+        timestamp, kind, amount, balance = self.entry(index)
+        if kind == INSUFFICIENT_FUNDS:
+            return "Insufficient funds. Withdrawal amount exceeds the current balance."
+        transaction_time = format_timestamp(timestamp)
+        if kind == DEPOSIT:
+            label, sign = "Deposit", "+"
+        else:
+            label, sign = "Withdrawal", "-"
+        return f"{label}: {sign}{self.format_amount(amount)}. New balance: {self.format_amount(balance)}. Date: {transaction_time}"
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.render(i) for i in range(*index.indices(len(self)))]
+        return self.render(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.render(i)
@@ -0,0 +1,169 @@
+from array import array
+import threading
+from .clock import now_ns, NS_PER_SECOND
+from .ledger import WITHDRAWAL
+from .money import CurrencyFormatter
+
+# (window in seconds, most that may be withdrawn in any such window in cents)
+DEFAULT_LIMITS = ((3600, 50000), (86400, 100000))
+
+
+class WindowCounter:
+    """
+    A rolling sum over a time window, kept in a ring of fixed-width buckets.
+
+    The window is split into `buckets` slots. Adding to the sum or reading it
+    only clears the slots that expired since the last call, which is at most
+    `buckets` of them, so both cost constant time however many amounts were
+    added. An amount leaves the sum between window - window / buckets and
+    window after it was added.
+    """
+
+    __slots__ = ("bucket_ns", "totals", "head", "total")
+
+    def __init__(self, window_ns, buckets):
+        self.bucket_ns = window_ns // buckets
+        self.totals = array("q", bytes(8 * buckets))
+        self.head = 0  # Absolute number of the newest bucket
+        self.total = 0
+
+    def advance(self, timestamp):
+        """Drop the buckets that fell out of the window ending at timestamp"""
+        bucket = timestamp // self.bucket_ns
+        if bucket <= self.head:
+            return
+        totals, size = self.totals, len(self.totals)
+        for expired in range(self.head + 1, min(bucket, self.head + size) + 1):
+            slot = expired % size
+            self.total -= totals[slot]
+            totals[slot] = 0
+        self.head = bucket
+
+    def add(self, timestamp, amount):
+        """Add an amount to the bucket of its timestamp; one past the newest bucket goes in the newest, one already expired is dropped"""
+        bucket = timestamp // self.bucket_ns
+        if bucket <= self.head - len(self.totals):
+            return
+        self.totals[min(bucket, self.head) % len(self.totals)] += amount
+        self.total += amount
+
+
+class WithdrawalLimits:
+    """
+    Class enforcing rolling withdrawal limits per account.
+
+    Each account gets one WindowCounter per limit, created on its first
+    withdrawal. A withdrawal is reserved against every limit before the balance
+    changes and released again if the withdrawal then fails, so a declined
+    withdrawal does not use up the allowance.
+    """
+
+    def __init__(self, limits=DEFAULT_LIMITS, buckets=60, format_amount=None):
+        """
+        Initialize the WithdrawalLimits.
+
+        Args:
+            limits (tuple): (window in seconds, maximum in cents) pairs.
+            buckets (int): Buckets per window; more buckets expire amounts more precisely.
+            format_amount (callable): Formats an amount in cents for messages, defaults to euros.
+        """
+        self.limits = tuple((seconds * NS_PER_SECOND, maximum) for seconds, maximum in limits)
+        self.buckets = buckets
+        self.format_amount = format_amount or CurrencyFormatter().format
+        self.counters = {}  # Account number -> one WindowCounter per limit
+        self.lock = threading.Lock()
+
+    def counters_for(self, account):
+        counters = self.counters.get(account)
+        if counters is None:
+            counters = self.counters[account] = [WindowCounter(window_ns, self.buckets) for window_ns, maximum in self.limits]
+        return counters
+
+    def reserve(self, account, amount, timestamp=None):
+        """
+        Count a withdrawal against the limits if it fits within all of them.
+
+        Args:
+            account (int): The account number.
+            amount (int): The withdrawal amount in cents.
+            timestamp (int): Nanoseconds since the epoch, defaults to now.
+
+        Returns:
+            str: A message naming the exceeded limit, or None if the amount was reserved.
+        """
+        timestamp = now_ns() if timestamp is None else timestamp
+        with self.lock:
+            counters = self.counters_for(account)
+            for counter, (window_ns, maximum) in zip(counters, self.limits):
+                counter.advance(timestamp)
+                if counter.total + amount > maximum:
+                    return f"Withdrawal limit exceeded. You can withdraw up to {self.format_amount(maximum)} per {describe_window(window_ns)}."
+            for counter in counters:
+                counter.add(timestamp, amount)
+        return None
+
+    def release(self, account, amount, timestamp):
+        """
+        Give back a reservation whose withdrawal did not go through.
+
+        Args:
+            account (int): The account number.
+            amount (int): The reserved amount in cents.
+            timestamp (int): The timestamp the amount was reserved at.
+        """
+        with self.lock:
+            for counter in self.counters_for(account):
+                counter.add(timestamp, -amount)
+
+    def count(self, account, amount, timestamp):
+        """
+        Count a withdrawal against the limits without checking them, e.g. one made before they were set up.
+
+        Args:
+            account (int): The account number.
+            amount (int): The withdrawal amount in cents.
+            timestamp (int): Nanoseconds since the epoch of the withdrawal.
+        """
+        with self.lock:
+            for counter in self.counters_for(account):
+                counter.advance(timestamp)
+                counter.add(timestamp, amount)
+
+    def seed(self, ledger, timestamp=None):
+        """
+        Count the withdrawals already in a ledger that still fall inside the longest window.
+
+        Called after recovering a ledger, so restarting the machine does not reset the allowance.
+
+        Args:
+            ledger (Ledger): The recovered ledger.
+            timestamp (int): Nanoseconds since the epoch, defaults to now.
+        """
+        timestamp = now_ns() if timestamp is None else timestamp
+        start = timestamp - max(window_ns for window_ns, maximum in self.limits)
+        timestamps, kinds, amounts, balances, accounts = ledger.columns
+        with self.lock:
+            for index in ledger.between(start, timestamp):
+                if kinds[index] == WITHDRAWAL:
+                    for counter in self.counters_for(accounts[index]):
+                        counter.advance(timestamps[index])
+                        counter.add(timestamps[index], amounts[index])
+
+    def withdrawn(self, account, timestamp=None):
+        """Return the amount counted against each limit for an account, in cents"""
+        timestamp = now_ns() if timestamp is None else timestamp
+        with self.lock:
+            totals = []
+            for counter in self.counters_for(account):
+                counter.advance(timestamp)
+                totals.append(counter.total)
+            return totals
+
+
+def describe_window(window_ns):
+    """Describe a window length for a message, e.g. "hour" or "24 hours" """
+    seconds = window_ns // NS_PER_SECOND
+    for unit_seconds, unit in ((3600, "hour"), (60, "minute"), (1, "second")):
+        if seconds % unit_seconds == 0:
+            count = seconds // unit_seconds
+            return unit if count == 1 else f"{count} {unit}s"
@@ -0,0 +1,243 @@
+"""Latency histograms and outcome counters, exported in the Prometheus text format.
+
+Instrumentation works by wrapping methods on individual objects. When it is
+not enabled, nothing is wrapped and the engine runs exactly as it would
+without this module.
+"""
+
+from array import array
+import functools
+import os
+import threading
+import time
+
+PRECISION_BITS = 3  # 8 buckets per power of two: values are recorded within 12.5%
+SUB_BUCKETS = 1 << PRECISION_BITS
+BUCKETS = (64 - PRECISION_BITS) * SUB_BUCKETS
+NS_PER_SECOND = 1e9
+
+
+def bucket_index(value):
+    """Return the histogram bucket of a non-negative integer"""
+    if value < SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - PRECISION_BITS - 1
+    return ((exponent + 1) << PRECISION_BITS) + ((value >> exponent) - SUB_BUCKETS)
+
+
+def bucket_upper_bound(index):
+    """Return the largest value recorded in a bucket"""
+    if index < SUB_BUCKETS:
+        return index
+    exponent = (index >> PRECISION_BITS) - 1
+    return ((SUB_BUCKETS + (index & (SUB_BUCKETS - 1)) + 1) << exponent) - 1
+
+
+class LatencyHistogram:
+    """
+    Class counting durations in log-linear buckets, like an HDR histogram.
+
+    Recording is a bit_length and an array increment, so the cost is the same
+    for every value. Memory is fixed at one counter per bucket, and the
+    relative error is at most 1 / SUB_BUCKETS over the whole nanosecond range.
+    """
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * BUCKETS))
+        self.count = 0
+        self.total = 0  # Sum of the recorded values in ns
+
+    def record(self, value):
+        """Record a duration in nanoseconds"""
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """Return the upper bound in ns of the bucket holding the given fraction of values"""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return bucket_upper_bound(index)
+        return 0
+
+
+class Metrics:
+    """
+    Class collecting counters and latency histograms and rendering them for Prometheus.
+
+    Metrics are keyed by name and a tuple of (label, value) pairs. Updates
+    happen under one lock, which is held for only a few dictionary operations.
+    """
+
+    def __init__(self, prefix="atm"):
+        """
+        Initialize the Metrics.
+
+        Args:
+            prefix (str): Prefix of every exported metric name.
+        """
+        self.prefix = prefix
+        self.counters = {}  # (name, labels) -> one-element list holding the count
+        self.histograms = {}  # (name, labels) -> LatencyHistogram
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def increment(self, name, labels=(), amount=1):
+        """Add to a counter"""
+        with self.lock:
+            self.counters.setdefault((name, labels), [0])[0] += amount
+
+    def observe(self, name, labels, duration_ns):
+        """Record a duration in a latency histogram"""
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(duration_ns)
+
+    def instrument(self, target, method_name, operation, classify=None):
+        """
+        Replace a method on one object with a version that is timed and counted.
+
+        Args:
+            target (object): The object whose method is wrapped; other instances are unaffected.
+            method_name (str): The method to wrap.
+            operation (str): The operation label of the recorded metrics.
+            classify (callable): Maps the method's return value to an outcome label, if outcomes are counted.
+        """
+        method = getattr(target, method_name)
+        labels = (("operation", operation),)
+        with self.lock:
+            histogram = self.histograms.setdefault(("latency_seconds", labels), LatencyHistogram())
+        counts = histogram.counts
+        cells = {}  # Outcome -> its counter cell, so the hot path builds no label tuples
+        lock, perf_counter_ns = self.lock, time.perf_counter_ns
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            result = method(*args, **kwargs)
+            elapsed = perf_counter_ns() - start
+            index = elapsed if elapsed < SUB_BUCKETS else bucket_index(elapsed)
+            with lock:
+                counts[index] += 1
+                histogram.count += 1
+                histogram.total += elapsed
+                if classify is not None:
+                    outcome = classify(result)
+                    cell = cells.get(outcome)
+                    if cell is None:
+                        cell = cells[outcome] = self.counters.setdefault(("transactions_total", labels + (("outcome", outcome),)), [0])
+                    cell[0] += 1
+            return result
+
+        setattr(target, method_name, timed)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted((key, cell[0]) for key, cell in self.counters.items())
+            histograms = sorted((key, (array("q", histogram.counts), histogram.count, histogram.total)) for key, histogram in self.histograms.items())
+        for name in sorted({name for (name, labels), value in counters}):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            lines.extend(f"{self.prefix}_{name}{format_labels(labels)} {value}" for (counter_name, labels), value in counters if counter_name == name)
+        for name in sorted({name for (name, labels), value in histograms}):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for (histogram_name, labels), (counts, count, total) in histograms:
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for index, bucket_count in enumerate(counts):
+                    if bucket_count:
+                        cumulative += bucket_count
+                        bound = (bucket_upper_bound(index) + 1) / NS_PER_SECOND
+                        lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels + (('le', f'{bound:.9g}'),))} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {total / NS_PER_SECOND:.9f}")
+                lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the exposition text to a file atomically, e.g. for the node_exporter textfile collector"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as output:
+            output.write(self.render())
+        os.replace(temp_path, path)
+
+    def write_periodically(self, path, interval=15.0):
+        """Start a background thread rewriting the file every `interval` seconds until close()"""
+        def run():
+            while not self.closed.wait(interval):
+                self.write(path)
+        threading.Thread(target=run, daemon=True).start()
+
+    def serve(self, host="127.0.0.1", port=9100):
+        """
+        Serve the exposition text over HTTP from a background thread.
+
+        Returns:
+            http.server.ThreadingHTTPServer: The running server; call shutdown() to stop it.
+        """
+        # Imported here so the engine does not load the HTTP stack unless metrics are served
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def close(self):
+        """Stop the periodic writer"""
+        self.closed.set()
+
+
+def format_labels(labels):
+    """Render label pairs as {name="value",...}, or nothing when there are none"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def transaction_outcome(result):
+    """Classify a (result, success) pair returned by TransactionHandler"""
+    message, success = result
+    if success:
+        return "ok"
+    if "Insufficient funds" in str(message):
+        return "insufficient_funds"
+    return "rejected"
+
+
+def instrument_handler(metrics, transaction_handler):
+    """
+    Time and count the operations of a TransactionHandler and its cash machine.
+
+    Args:
+        metrics (Metrics): Where the measurements go.
+        transaction_handler (TransactionHandler): The handler to instrument.
+    """
+    metrics.instrument(transaction_handler, "perform_withdrawal", "withdrawal", transaction_outcome)
+    metrics.instrument(transaction_handler, "perform_deposit", "deposit", transaction_outcome)
+    metrics.instrument(transaction_handler.cash_machine, "format_currency", "format_currency")
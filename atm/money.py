@@ -0,0 +1,143 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+import locale
+
+# Amounts are held as integer cents everywhere inside the engine
+MINOR_UNITS = 100
+MAX_AMOUNT = 10**12  # Largest amount of one transaction in cents (€10 billion)
+MAX_BALANCE = 2**63 - 1  # Largest balance the ledger's 64-bit columns can hold, in cents
+CHAR_MAX = 127  # Ends a localeconv() grouping list
+
+
+def to_cents(amount):
+    """
+    Convert an amount in euros to integer cents, rounding half up.
+
+    Args:
+        amount (str, int, float or Decimal): The amount in euros.
+
+    Returns:
+        int: The amount in cents.
+
+    Raises:
+        ValueError: If the amount is not a finite number or exceeds MAX_AMOUNT.
+    """
+    try:
+        cents = int((Decimal(str(amount).strip()) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if abs(cents) > MAX_AMOUNT:
+        raise ValueError(f"Amount too large: {amount!r}")
+    return cents
+
+
+class CurrencyFormatter:
+    """
+    Class formatting cent amounts as currency without touching the global locale.
+
+    The separators, grouping and symbol placement are captured once when the
+    formatter is built, so formatting is plain integer and string work that is
+    safe to call from any thread. Recently formatted amounts are memoized.
+    """
+
+    def __init__(self, symbol="€", decimal_point=".", thousands_sep=",", grouping=(3, 0), symbol_first=True, space=False, cache_size=4096):
+        """
+        Initialize a CurrencyFormatter.
+
+        Args:
+            symbol (str): The currency symbol.
+            decimal_point (str): The separator between units and cents.
+            thousands_sep (str): The separator between digit groups.
+            grouping (sequence): Group sizes from the right, as in localeconv(); 0 repeats the last size.
+            symbol_first (bool): Whether the symbol precedes the amount.
+            space (bool): Whether a space separates the symbol and the amount.
+            cache_size (int): The number of formatted amounts to memoize.
+        """
+        self.symbol = symbol
+        self.decimal_point = decimal_point
+        self.thousands_sep = thousands_sep
+        self.grouping = self.compile_grouping(grouping)
+        self.symbol_first = symbol_first
+        self.separator = " " if space else ""
+        self.format = lru_cache(maxsize=cache_size)(self.format_uncached)
+
+    @classmethod
+    def from_locale(cls, symbol="€"):
+        """
+        Build a formatter from the monetary conventions of the current locale.
+
+        The conventions are read once with localeconv(); the locale itself is not changed.
+        Falls back to the defaults when the locale has no monetary conventions.
+
+        Args:
+            symbol (str): The currency symbol to use.
+
+        Returns:
+            CurrencyFormatter: The formatter.
+        """
+        conventions = locale.localeconv()
+        if not conventions["mon_decimal_point"]:
+            return cls(symbol=symbol)
+        return cls(
+            symbol=symbol,
+            decimal_point=conventions["mon_decimal_point"],
+            thousands_sep=conventions["mon_thousands_sep"],
+            grouping=conventions["mon_grouping"],
+            symbol_first=conventions["p_cs_precedes"] == 1,
+            space=conventions["p_sep_by_space"] == 1,
+        )
+
+    @staticmethod
+    def compile_grouping(grouping):
+        """
+        Turn a localeconv() grouping list into explicit group sizes.
+
+        Returns:
+            tuple: (sizes, repeat) where `sizes` are the leading group sizes from
+            the right and `repeat` is the size used after them, or 0 for no more grouping.
+        """
+        sizes = []
+        for size in grouping:
+            if size == CHAR_MAX:
+                return tuple(sizes), 0
+            if size == 0:
+                return tuple(sizes), sizes[-1] if sizes else 0
+            sizes.append(size)
+        return tuple(sizes), 0
+
+    def group(self, digits):
+        """Insert thousands separators into a string of digits"""
+        sizes, repeat = self.grouping
+        if not self.thousands_sep:
+            return digits
+        groups = []
+        end = len(digits)
+        for size in sizes:
+            if end <= size:
+                break
+            groups.append(digits[end - size:end])
+            end -= size
+        else:
+            while repeat and end > repeat:
+                groups.append(digits[end - repeat:end])
+                end -= repeat
+        groups.append(digits[:end])
+        return self.thousands_sep.join(reversed(groups))
+
+    def format_uncached(self, cents):
+        """
+        Format an amount in cents.
+
+        Args:
+            cents (int): The amount in cents.
+
+        Returns:
+            str: The formatted amount, e.g. "€1,234.50".
+        """
+        units, fraction = divmod(abs(cents), MINOR_UNITS)
+        number = f"{self.group(str(units))}{self.decimal_point}{fraction:02d}"
+        if self.symbol_first:
+            text = f"{self.symbol}{self.separator}{number}"
+        else:
+            text = f"{number}{self.separator}{self.symbol}"
+        return "-" + text if cents < 0 else text
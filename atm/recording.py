@@ -0,0 +1,370 @@
+"""Session recording and headless replay.
+
+A recorder attached to a CashMachine writes every operation it performs to a
+compact binary file. Each operation is one fixed-width record: when it
+happened, what it was, whether it succeeded, and its amount. PINs are never
+written, only whether each PIN entry was accepted. Given the TransactionHandler
+too, the recorder records transactions as the handler saw them, so withdrawals
+its limits decline are recorded as well, together with the limits and the
+withdrawals already counted against them. The replayer runs a recording
+through a fresh engine and handler, at the recorded timestamps, either as fast
+as possible or at the original pacing, and reports any operation whose
+outcome differs. A
+production session can therefore be rerun as a benchmark or a regression
+check.
+
+Usage: python -m atm.recording FILE [--paced] [--speed FACTOR]
+"""
+
+import argparse
+import atexit
+import os
+import struct
+import threading
+import time
+from .clock import now_ns, NS_PER_SECOND
+from .dispenser import CashDispenser
+from .engine import CashMachine, TransactionHandler
+from .ledger import WITHDRAWAL
+from .limits import WithdrawalLimits
+from .money import CurrencyFormatter
+
+MAGIC = b"ATMREC1\0"
+# Timestamp in ns since the epoch, event, outcome (1 for success), amount or balance in cents
+EVENT = struct.Struct("<qBBq")
+
+# Events
+START = 0  # A session starts; the value is its opening balance, the outcome whether it requires a PIN
+SET_PIN = 1
+OPEN_SESSION = 2
+DEPOSIT = 3
+WITHDRAW = 4
+BALANCE = 5
+CANCEL = 6  # The customer declined the confirmation of an amount
+CHANGE_PIN = 7  # The value is 1 when the change failed on the current PIN rather than the new one
+RESET_PIN = 8
+CASSETTE = 9  # Follows START for a machine with a dispenser; the value packs notes loaded << 32 | note value
+PIN_STATE = 10  # Follows START for a card whose PIN was already set; the value is its wrong attempts, the outcome whether it is locked
+LIMITS = 11  # Follows START for a handler with withdrawal limits; the value is the buckets per window
+LIMIT_WINDOW = 12  # One per limit after LIMITS; the value is the window in seconds
+LIMIT_MAXIMUM = 13  # Follows its LIMIT_WINDOW; the value is the most that may be withdrawn in the window, in cents
+SEED = 14  # A withdrawal the limits already counted at START, stamped with its own time; the value is its amount
+BREAKDOWN = 15  # The front-end showed the notes for an amount before asking to confirm; the outcome is whether it can be dispensed
+
+EVENT_NAMES = {START: "start", SET_PIN: "set_pin", OPEN_SESSION: "open_session", DEPOSIT: "deposit",
+               WITHDRAW: "withdraw", BALANCE: "balance", CANCEL: "cancel", CHANGE_PIN: "change_pin", RESET_PIN: "reset_pin", CASSETTE: "cassette",
+               PIN_STATE: "pin_state", LIMITS: "limits", LIMIT_WINDOW: "limit_window", LIMIT_MAXIMUM: "limit_maximum",
+               SEED: "seed", BREAKDOWN: "breakdown"}
+
+# The PIN a replay uses wherever the recorded customer entered a correct one, and one that never matches it
+REPLAY_PIN = "0000"
+WRONG_PIN = "9999"
+
+
+class SessionRecorder:
+    """Class writing the operations of a cash machine session to a recording file"""
+
+    def __init__(self, path):
+        """
+        Open a recording file, appending to it if it exists.
+
+        Args:
+            path (str): The recording file.
+        """
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new:
+            self.file.write(MAGIC)
+        self.lock = threading.Lock()  # Worker threads and the UI thread record concurrently
+
+    def record(self, event, value=0, success=True, timestamp=None):
+        """
+        Append one event.
+
+        Args:
+            event (int): One of the event constants.
+            value (int): The amount or balance in cents.
+            success (bool): Whether the operation succeeded.
+            timestamp (int): Nanoseconds since the epoch, defaults to now.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.write(EVENT.pack(now_ns() if timestamp is None else timestamp, event, 1 if success else 0, value))
+
+    def attach(self, cash_machine, transaction_handler=None):
+        """
+        Record every operation of a cash machine from now on, by wrapping its methods.
+
+        Args:
+            cash_machine (CashMachine): The cash machine to record.
+            transaction_handler (TransactionHandler): Optional handler of the cash machine, whose transactions
+                are recorded instead of the cash machine's, with its limits.
+        """
+        self.record(START, cash_machine.balance, cash_machine.require_pin)
+        if cash_machine.dispenser is not None:
+            for denomination, count in zip(cash_machine.dispenser.denominations, cash_machine.dispenser.counts):
+                self.record(CASSETTE, count << 32 | denomination)
+        if cash_machine.pin_hash is not None:
+            # E.g. restored by a journal: the replay sets the replay PIN in its place
+            self.record(PIN_STATE, cash_machine.failed_attempts, cash_machine.locked)
+        limits = transaction_handler.limits if transaction_handler is not None else None
+        if limits is not None:
+            self.record(LIMITS, limits.buckets)
+            for window_ns, maximum in limits.limits:
+                self.record(LIMIT_WINDOW, window_ns // NS_PER_SECOND)
+                self.record(LIMIT_MAXIMUM, maximum)
+            # The cash machine's withdrawals that WithdrawalLimits.seed counts from its ledger
+            ledger, timestamp = cash_machine.transaction_history, now_ns()
+            timestamps, kinds, amounts, balances, accounts = ledger.columns
+            for index in ledger.between(timestamp - max(window_ns for window_ns, maximum in limits.limits), timestamp, 0):
+                if kinds[index] == WITHDRAWAL:
+                    self.record(SEED, amounts[index], True, timestamps[index])
+        set_pin, open_session = cash_machine.set_pin, cash_machine.open_session
+        change_pin, reset_pin = cash_machine.change_pin, cash_machine.reset_pin
+        withdraw_money, deposit_money, check_balance = cash_machine.withdraw_money, cash_machine.deposit_money, cash_machine.check_balance
+
+        def recorded_set_pin(pin):
+            accepted = set_pin(pin)
+            self.record(SET_PIN, 0, accepted)
+            return accepted
+
+        def recorded_change_pin(old_pin, new_pin):
+            changed = change_pin(old_pin, new_pin)
+            self.record(CHANGE_PIN, 0 if changed or not cash_machine.valid_pin(new_pin) else 1, changed)
+            return changed
+
+        def recorded_reset_pin(pin):
+            accepted = reset_pin(pin)
+            self.record(RESET_PIN, 0, accepted)
+            return accepted
+
+        def recorded_open_session(pin):
+            token = open_session(pin)
+            self.record(OPEN_SESSION, 0, token is not None)
+            return token
+
+        def recorded_clock():
+            checked.timestamp = clock()
+            return checked.timestamp
+
+        def recorded_perform_withdrawal(amount, account=None, session=None, key=None):
+            checked.timestamp = None
+            result, success = perform_withdrawal(amount, account, session, key)
+            if account is None:
+                # Stamped with the time the limits were checked at, so the replay checks them at the same time
+                self.record(WITHDRAW, amount, success, checked.timestamp)
+            return result, success
+
+        def recorded_perform_deposit(amount, account=None, session=None, key=None):
+            result, success = perform_deposit(amount, account, session, key)
+            if account is None:
+                self.record(DEPOSIT, amount, success)
+            return result, success
+
+        def recorded_withdraw_money(amount, session=None):
+            result, success = withdraw_money(amount, session)
+            self.record(WITHDRAW, amount, success)
+            return result, success
+
+        def recorded_deposit_money(amount, session=None):
+            result, success = deposit_money(amount, session)
+            self.record(DEPOSIT, amount, success)
+            return result, success
+
+        def recorded_check_balance():
+            self.record(BALANCE, cash_machine.balance)
+            return check_balance()
+
+        cash_machine.set_pin = recorded_set_pin
+        cash_machine.change_pin = recorded_change_pin
+        cash_machine.reset_pin = recorded_reset_pin
+        cash_machine.open_session = recorded_open_session
+        cash_machine.check_balance = recorded_check_balance
+        if transaction_handler is None:
+            cash_machine.withdraw_money = recorded_withdraw_money
+            cash_machine.deposit_money = recorded_deposit_money
+            return
+        # Transactions on other accounts are not recorded, as they don't change the cash machine
+        clock, perform_withdrawal, perform_deposit = transaction_handler.clock, transaction_handler.perform_withdrawal, transaction_handler.perform_deposit
+        checked = threading.local()  # The timestamp the handler checked this thread's withdrawal at, if it did
+        transaction_handler.clock = recorded_clock
+        transaction_handler.perform_withdrawal = recorded_perform_withdrawal
+        transaction_handler.perform_deposit = recorded_perform_deposit
+
+    def close(self):
+        """Flush and close the recording file"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def record_session(cash_machine, path=None, transaction_handler=None):
+    """
+    Start recording a cash machine if recording is enabled.
+
+    Args:
+        cash_machine (CashMachine): The cash machine to record.
+        path (str): The recording file, defaults to the ATM_RECORD_FILE environment variable.
+        transaction_handler (TransactionHandler): The handler the front-end runs transactions through, if any.
+
+    Returns:
+        SessionRecorder: The recorder, or None if recording is not enabled.
+    """
+    path = path or os.environ.get("ATM_RECORD_FILE")
+    if not path:
+        return None
+    recorder = SessionRecorder(path)
+    recorder.attach(cash_machine, transaction_handler)
+    atexit.register(recorder.close)
+    return recorder
+
+
+def read_recording(path, chunk_events=4096):
+    """
+    Read the events of a recording file.
+
+    Args:
+        path (str): The recording file.
+        chunk_events (int): The number of events read from disk at a time.
+
+    Yields:
+        tuple: (timestamp, event, success, value) per event.
+    """
+    with open(path, "rb") as recording:
+        if recording.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            data = recording.read(chunk_events * EVENT.size)
+            # A torn last event from a crashed session is ignored
+            for timestamp, event, success, value in EVENT.iter_unpack(data[:len(data) - len(data) % EVENT.size]):
+                yield timestamp, event, bool(success), value
+            if len(data) < chunk_events * EVENT.size:
+                return
+
+
+class Replayer:
+    """Class replaying recorded sessions against a fresh engine"""
+
+    def __init__(self, paced=False, speed=1.0):
+        """
+        Initialize the Replayer.
+
+        Args:
+            paced (bool): Whether to wait between events as long as the customer did.
+            speed (float): With pacing, how many times faster than the original to run.
+        """
+        self.paced = paced
+        self.speed = speed
+        self.events = 0
+        self.transactions = 0
+        self.mismatches = []  # (event number, event name, value, recorded success, replayed success)
+        self.elapsed = 0.0
+
+    def replay(self, events):
+        """
+        Replay events and compare each outcome with the recorded one.
+
+        Args:
+            events (iterable): (timestamp, event, success, value) tuples, as yielded by read_recording.
+
+        Returns:
+            CashMachine: The cash machine the last session ran on.
+        """
+        cash_machine = None
+        session = None
+        start = time.perf_counter()
+        for number, (timestamp, event, success, value) in enumerate(events):
+            if event == START:
+                # Pacing restarts with every session, so the time between sessions is not replayed
+                session_timestamp, session_start = timestamp, time.perf_counter()
+            elif self.paced:
+                delay = (timestamp - session_timestamp) / 1e9 / self.speed - (time.perf_counter() - session_start)
+                if delay > 0:
+                    time.sleep(delay)
+            self.events += 1
+            if event == START:
+                cash_machine = CashMachine(formatter=CurrencyFormatter(), require_pin=success)
+                cash_machine.balance = value
+                handler = TransactionHandler(cash_machine)
+                # Reads the timestamp of the event being replayed, so the limits see the recorded times
+                handler.clock = lambda: timestamp
+                session = None
+                cassettes = {}
+                continue
+            if cash_machine is None:
+                raise ValueError("recording does not start with a session start event")
+            if event == CASSETTE:
+                cassettes[value & 0xFFFFFFFF] = value >> 32
+                cash_machine.dispenser = CashDispenser(cassettes)
+                continue
+            if event == LIMITS:
+                buckets, limits = value, []
+                continue
+            if event == LIMIT_WINDOW:
+                window = value
+                continue
+            if event == LIMIT_MAXIMUM:
+                limits.append((window, value))
+                handler.limits = WithdrawalLimits(tuple(limits), buckets, cash_machine.format_currency)
+                continue
+            if event == SEED:
+                handler.limits.count(0, value, timestamp)
+                continue
+            if event == PIN_STATE:
+                cash_machine.store_pin(REPLAY_PIN)
+                cash_machine.failed_attempts, cash_machine.locked = value, success
+                continue
+            if event == SET_PIN:
+                replayed = cash_machine.set_pin(REPLAY_PIN if success else "")
+            elif event == CHANGE_PIN:
+                # The replay PIN stays the same; only whether each check passed matters
+                replayed = cash_machine.change_pin(WRONG_PIN if value else REPLAY_PIN, REPLAY_PIN if success or value else "")
+            elif event == RESET_PIN:
+                replayed = cash_machine.reset_pin(REPLAY_PIN if success else "")
+            elif event == OPEN_SESSION:
+                token = cash_machine.open_session(REPLAY_PIN if success else WRONG_PIN)
+                session = token or session
+                replayed = token is not None
+            elif event == WITHDRAW:
+                self.transactions += 1
+                replayed = handler.perform_withdrawal(value, session=session)[1]
+            elif event == DEPOSIT:
+                self.transactions += 1
+                replayed = handler.perform_deposit(value, session=session)[1]
+            elif event == BREAKDOWN:
+                replayed = cash_machine.note_breakdown(value) is not None
+            elif event == BALANCE:
+                cash_machine.check_balance()
+                replayed = cash_machine.balance == value
+            else:
+                replayed = success
+            if replayed != success:
+                self.mismatches.append((number, EVENT_NAMES.get(event, str(event)), value, success, replayed))
+        self.elapsed = time.perf_counter() - start
+        return cash_machine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded cash machine session headlessly")
+    parser.add_argument("recording")
+    parser.add_argument("--paced", action="store_true", help="keep the original time between operations")
+    parser.add_argument("--speed", type=float, default=1.0, help="with --paced, run this many times faster")
+    args = parser.parse_args()
+
+    replayer = Replayer(args.paced, args.speed)
+    cash_machine = replayer.replay(read_recording(args.recording))
+    rate = replayer.events / replayer.elapsed if replayer.elapsed else 0.0
+    print(f"Replayed {replayer.events:,} events ({replayer.transactions:,} transactions) in {replayer.elapsed:.3f}s: {rate:,.0f} events/s")
+    if cash_machine is not None:
+        print(cash_machine.check_balance())
+    for number, name, value, recorded, replayed in replayer.mismatches[:20]:
+        print(f"  event {number} {name} {value}: recorded {'success' if recorded else 'failure'}, replayed {'success' if replayed else 'failure'}")
+    if replayer.mismatches:
+        print(f"{len(replayer.mismatches)} mismatches")
+        raise SystemExit(1)
+    print("No mismatches")
+
+
+if __name__ == "__main__":
+    main()
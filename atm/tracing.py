@@ -0,0 +1,143 @@
+"""Opt-in tracing of UI callbacks and event-loop lag, written in the Chrome trace event format.
+
+The file opens in chrome://tracing or https://ui.perfetto.dev. Like the
+metrics, tracing works by wrapping methods on individual objects, so a window
+that is not traced runs untouched. Nothing here imports a GUI toolkit; the
+lag monitor only needs an object with Tk's `after` method.
+"""
+
+from collections import deque
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """
+    Class recording timed spans and counters as Chrome trace events.
+
+    Events go into a bounded ring, so a session of any length keeps only the
+    most recent `max_events` in memory. They are written out by write().
+    """
+
+    def __init__(self, path, max_events=200000):
+        """
+        Initialize the Tracer.
+
+        Args:
+            path (str): The trace file written by write().
+            max_events (int): The number of most recent events kept.
+        """
+        self.path = path
+        self.events = deque(maxlen=max_events)
+        self.pid = os.getpid()
+        self.names = {}  # Thread id -> thread name, for the viewer's track labels
+
+    def now_us(self):
+        return time.perf_counter_ns() // 1000
+
+    def span(self, name, start_us, end_us, args=None):
+        """Record a completed span"""
+        tid = threading.get_ident()
+        if tid not in self.names:
+            self.names[tid] = threading.current_thread().name
+        event = {"name": name, "ph": "X", "ts": start_us, "dur": end_us - start_us, "pid": self.pid, "tid": tid}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def counter(self, name, values):
+        """Record counter values, drawn by the viewer as a graph"""
+        self.events.append({"name": name, "ph": "C", "ts": self.now_us(), "pid": self.pid, "args": values})
+
+    def instant(self, name, args=None):
+        """Record a point-in-time marker"""
+        self.events.append({"name": name, "ph": "i", "s": "p", "ts": self.now_us(), "pid": self.pid, "tid": threading.get_ident(), "args": args or {}})
+
+    def traced(self, function, name=None):
+        """Return a version of a function that records a span per call"""
+        name = name or getattr(function, "__qualname__", repr(function))
+        now_us = self.now_us
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = now_us()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.span(name, start, now_us())
+
+        return wrapper
+
+    def wrap(self, target, *method_names):
+        """Replace methods on one object with traced versions; other instances are unaffected"""
+        for method_name in method_names:
+            method = getattr(target, method_name)
+            setattr(target, method_name, self.traced(method, f"{type(target).__name__}.{method_name}"))
+
+    def trace_after(self, root):
+        """
+        Trace every callback scheduled with root.after.
+
+        Args:
+            root (tk.Tk): The window whose after() is wrapped.
+        """
+        after = root.after
+
+        def traced_after(ms, func=None, *args):
+            if func is None:
+                return after(ms)
+            return after(ms, self.traced(func, f"after: {getattr(func, '__qualname__', repr(func))}"), *args)
+
+        root.after = traced_after
+
+    def write(self):
+        """Write the recorded events to the trace file atomically"""
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}} for tid, name in self.names.items()]
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as output:
+            json.dump({"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}, output)
+        os.replace(temp_path, self.path)
+
+
+class LagMonitor:
+    """
+    Class measuring event-loop lag with a heartbeat timer.
+
+    A callback is scheduled every `interval_ms`. How late it runs is the time
+    the event loop spent busy in other callbacks, and it is recorded as a
+    counter. A beat later than `stall_ms` is also marked as a stall, so the
+    span that caused it is easy to find next to the marker.
+    """
+
+    def __init__(self, root, tracer, interval_ms=100, stall_ms=50):
+        """
+        Initialize the LagMonitor and start the heartbeat; create it before Tracer.trace_after.
+
+        Args:
+            root (tk.Tk): The window whose event loop is measured.
+            tracer (Tracer): Where the lag is recorded.
+            interval_ms (int): The heartbeat interval.
+            stall_ms (int): The lag reported as a stall.
+        """
+        self.root = root
+        self.tracer = tracer
+        self.interval_ms = interval_ms
+        self.stall_ms = stall_ms
+        self.worst_ms = 0.0
+        self.after = root.after  # Kept untraced, so heartbeats don't show up as spans
+        self.expected = time.perf_counter() + interval_ms / 1000
+        self.after(interval_ms, self.beat)
+
+    def beat(self):
+        """Record how late this beat ran and schedule the next one"""
+        now = time.perf_counter()
+        lag_ms = max((now - self.expected) * 1000, 0.0)
+        self.worst_ms = max(self.worst_ms, lag_ms)
+        self.tracer.counter("event loop lag (ms)", {"lag": round(lag_ms, 3)})
+        if lag_ms >= self.stall_ms:
+            self.tracer.instant("stall", {"lag_ms": round(lag_ms, 3)})
+        self.expected = now + self.interval_ms / 1000
+        self.after(self.interval_ms, self.beat)
@@ -0,0 +1,85 @@
+import queue
+import threading
+
+
+class TransactionWorkerPool:
+    """
+    Class running transactions on background threads.
+
+    Requests go onto a queue served by worker threads and results come back on
+    a second queue, which the caller drains with poll() from its own thread
+    (for a Tk front-end, from a root.after timer). The caller never blocks on
+    the engine, so slow journal or ledger I/O cannot freeze it.
+    """
+
+    def __init__(self, transaction_handler, workers=1):
+        """
+        Initialize the pool and start its workers.
+
+        Args:
+            transaction_handler (TransactionHandler): The handler that executes transactions.
+            workers (int): The number of worker threads; one keeps results in submission order.
+        """
+        self.transaction_handler = transaction_handler
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0  # Submitted but not yet polled
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, transaction_type, amount, account=None, session=None, key=None):
+        """
+        Queue a transaction.
+
+        Args:
+            transaction_type (str): "withdraw" or "deposit".
+            amount (int): The amount in cents.
+            account (int): The account number, or None for the cash machine's own balance.
+            session (str): The session token from CashMachine.open_session.
+            key (hashable): Optional idempotency key, see TransactionHandler.perform_withdrawal.
+        """
+        with self.lock:
+            self.pending += 1
+        self.requests.put((transaction_type, amount, account, session, key))
+
+    def run(self):
+        """Worker loop executing queued transactions until a None request arrives"""
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            transaction_type, amount, account, session, key = request
+            try:
+                if transaction_type == "withdraw":
+                    result, success = self.transaction_handler.perform_withdrawal(amount, account, session, key)
+                else:
+                    result, success = self.transaction_handler.perform_deposit(amount, account, session, key)
+            except Exception as e:
+                result, success = f"Error: {str(e)}", False
+            self.results.put((transaction_type, amount, result, success))
+
+    def poll(self):
+        """
+        Collect the results that are ready, without blocking.
+
+        Returns:
+            list: (transaction_type, amount, result, success) tuples in completion order.
+        """
+        ready = []
+        while True:
+            try:
+                ready.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        with self.lock:
+            self.pending -= len(ready)
+        return ready
+
+    def close(self):
+        """Let queued transactions finish and stop the workers"""
+        for _ in self.threads:
+            self.requests.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,338 @@
+"""Headless benchmark suite for the shared engine, the CLI and the GUI hot paths.
+
+Each benchmark produces one number. Results are written as JSON and compared
+with a stored baseline; a result that is worse than the baseline by more than
+the tolerance is reported as a regression and makes the run exit with status 1.
+Startup benchmarks also have absolute budgets: a headless entry point that is
+too slow to import, or that loads a GUI toolkit or NumPy, fails the run. So
+does a fraud scoring stage slower than its per-withdrawal budget.
+Benchmarks that cannot run here (a missing toolkit, no display) are recorded
+as skipped.
+
+Usage: python bench.py [--output FILE] [--baseline FILE] [--tolerance 0.25] [--update-baseline]
+"""
+
+import argparse
+import builtins
+import contextlib
+import gc
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+OPERATIONS = 20000
+HISTORY_ENTRIES = 20000
+RENDER_ENTRIES = 2000
+
+
+class Skip(Exception):
+    """Raised by a benchmark that cannot run in this environment"""
+
+
+class BudgetExceeded(Exception):
+    """Raised by a benchmark whose result breaks an absolute budget"""
+
+
+def best_rate(operation, count, repeat=3):
+    """Return the best operations per second over several runs of `operation(count)`"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        operation(count)
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def load(module_name):
+    """Import a variant, turning a missing dependency into a skip"""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise Skip(f"cannot import {module_name}: {e}")
+
+
+@contextlib.contextmanager
+def scripted_console(answer):
+    """Answer every input() prompt with `answer` and discard print() output"""
+    original_input, original_print = builtins.input, builtins.print
+    builtins.input = lambda prompt="": answer
+    builtins.print = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        builtins.input, builtins.print = original_input, original_print
+
+
+def new_machine(variant):
+    """Create a ready-to-use engine and a (deposit, withdraw) pair of callables taking euros"""
+    from atm import CashMachine, TransactionHandler
+    handler = TransactionHandler(CashMachine(require_pin=False))
+    if variant == "main":
+        # The CLI reads amounts from input(), which scripted_console answers
+        cli = load("main").CashMachineCLI(handler)
+        return handler.cash_machine, lambda amount: cli.deposit_money(), lambda amount: cli.withdraw_money()
+    return handler.cash_machine, lambda amount: handler.perform_deposit(amount * 100), lambda amount: handler.perform_withdrawal(amount * 100)
+
+
+def bench_transactions(variant):
+    """Deposits and withdrawals per second, alternating"""
+    cash_machine, deposit, withdraw = new_machine(variant)
+
+    def run(count):
+        for _ in range(count // 2):
+            deposit(10)
+            withdraw(10)
+
+    with scripted_console("10"):
+        return best_rate(run, OPERATIONS)
+
+
+def bench_format_currency(variant):
+    """format_currency calls per second over varied amounts"""
+    cash_machine, deposit, withdraw = new_machine(variant)
+    amounts = [amount * 7919 for amount in range(1000)]
+
+    def run(count):
+        format_currency = cash_machine.format_currency
+        for index in range(count):
+            format_currency(amounts[index % 1000])
+
+    return best_rate(run, OPERATIONS)
+
+
+def bench_fraud_score(variant):
+    """Microseconds to score one withdrawal and record it, over many accounts with long histories"""
+    from atm import VelocityScorer
+    scorer = VelocityScorer()
+    second = 1_000_000_000
+
+    def run(count):
+        for index in range(count):
+            account, amount, timestamp = index % 1000, 1000 + index % 5000, index * second
+            scorer.score(account, amount, timestamp)
+            scorer.record(account, amount, timestamp)
+
+    run(OPERATIONS)  # Give every account a history first
+    best = 1_000_000 / best_rate(run, OPERATIONS)
+    if best > FRAUD_BUDGET_US:
+        raise BudgetExceeded(f"scoring took {best:.2f} us, budget {FRAUD_BUDGET_US} us")
+    return best
+
+
+def bench_guarded_transactions(variant):
+    """Withdrawals per second through the fraud scoring and withdrawal limit stages"""
+    from atm import CashMachine, TransactionHandler, VelocityScorer, WithdrawalLimits
+    handler = TransactionHandler(CashMachine(require_pin=False), limits=WithdrawalLimits(limits=((86400, 10**15),)),
+                                 risk=VelocityScorer(burst_limit=10**9))
+    handler.perform_deposit(10**12)
+
+    def run(count):
+        for _ in range(count):
+            handler.perform_withdrawal(1000)
+
+    return best_rate(run, OPERATIONS)
+
+
+def bench_idempotent_transactions(variant):
+    """Withdrawals per second, each with a new idempotency key, through a cache that is already full"""
+    from atm import CashMachine, IdempotencyCache, TransactionHandler
+    capacity = 10000
+    handler = TransactionHandler(CashMachine(require_pin=False), idempotency=IdempotencyCache(capacity=capacity))
+    handler.perform_deposit(10**12)
+    keys = iter(range(10**9))
+    for _ in range(capacity):
+        handler.perform_withdrawal(1, key=next(keys))
+
+    def run(count):
+        for _ in range(count):
+            handler.perform_withdrawal(1000, key=next(keys))
+
+    return best_rate(run, OPERATIONS)
+
+
+def bench_history_memory(variant):
+    """Bytes of history retained per deposit"""
+    cash_machine, deposit, withdraw = new_machine(variant)
+    deposit(10)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(HISTORY_ENTRIES):
+        deposit(10)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / HISTORY_ENTRIES
+
+
+def bench_history_render(module_name):
+    """Milliseconds to refresh the history widget after one more transaction, with a long history"""
+    module = load(module_name)
+    try:
+        root = module.tk.Tk()
+    except module.tk.TclError as e:
+        raise Skip(f"no display: {e}")
+    root.withdraw()
+    try:
+        if module_name in ("gui5", "gui6"):
+            # Build the window without the blocking PIN dialog
+            app = module.CashMachineGUI.__new__(module.CashMachineGUI)
+            cash_machine = module.CashMachine(require_pin=False)
+            app.root = root
+            if module_name == "gui5":
+                app.transaction_handler = module.TransactionHandler(cash_machine)
+                app.showing_history = False
+            else:
+                app.cash_machine = cash_machine
+            app.create_widgets()
+        else:
+            app = module.CashMachineGUI(root)
+            cash_machine = app.cash_machine
+        refresh = app.update_history_text if module_name == "gui5" else app.show_history
+        for _ in range(RENDER_ENTRIES):
+            cash_machine.deposit_money(1000)
+        refresh()
+        root.update()
+        samples = []
+        for _ in range(50):
+            cash_machine.deposit_money(1000)
+            start = time.perf_counter()
+            refresh()
+            root.update_idletasks()
+            samples.append(time.perf_counter() - start)
+        return min(samples) * 1000
+    finally:
+        root.destroy()
+
+
+def bench_startup(module_name):
+    """Milliseconds to import a headless entry point in a fresh interpreter"""
+    probe = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module_name}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(elapsed, *[name for name in {HEAVY_MODULES!r} if name in sys.modules])\n"
+    )
+    # Run from the repository, so the probe imports this checkout wherever bench.py was started from
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = float("inf")
+    for _ in range(5):
+        output = subprocess.run(
+            [sys.executable, "-c", probe], capture_output=True, text=True, check=True, cwd=directory
+        ).stdout.split()
+        if output[1:]:
+            raise BudgetExceeded(f"importing {module_name} loaded {', '.join(output[1:])}")
+        best = min(best, float(output[0]))
+    best *= 1000
+    if best > STARTUP_BUDGET_MS[module_name]:
+        raise BudgetExceeded(f"importing {module_name} took {best:.1f} ms, budget {STARTUP_BUDGET_MS[module_name]} ms")
+    return best
+
+
+# Modules a headless entry point must not load, and the import time each entry point may take
+HEAVY_MODULES = ("tkinter", "PySimpleGUI", "numpy")
+STARTUP_BUDGET_MS = {"atm": 50, "main": 50, "server": 100}
+# Time the fraud stage may add to each withdrawal
+FRAUD_BUDGET_US = 10
+
+# name -> (function, variant, unit, whether higher is better)
+BENCHMARKS = {}
+for variant in ("atm", "main"):
+    BENCHMARKS[f"{variant}.transactions"] = (bench_transactions, variant, "ops/s", True)
+BENCHMARKS["atm.format_currency"] = (bench_format_currency, "atm", "calls/s", True)
+BENCHMARKS["atm.history_memory"] = (bench_history_memory, "atm", "bytes/entry", False)
+BENCHMARKS["atm.fraud_score"] = (bench_fraud_score, "atm", "us", False)
+BENCHMARKS["atm.guarded_transactions"] = (bench_guarded_transactions, "atm", "ops/s", True)
+BENCHMARKS["atm.idempotent_transactions"] = (bench_idempotent_transactions, "atm", "ops/s", True)
+for variant in ("gui", "gui3", "gui4", "gui5", "gui6"):
+    BENCHMARKS[f"{variant}.history_render"] = (bench_history_render, variant, "ms", False)
+for module_name in STARTUP_BUDGET_MS:
+    BENCHMARKS[f"startup.{module_name}"] = (bench_startup, module_name, "ms", False)
+
+
+def run_all(selected=None):
+    """Run the benchmarks and return the results document"""
+    results, skipped, over_budget = {}, {}, {}
+    for name, (function, variant, unit, higher_is_better) in BENCHMARKS.items():
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        try:
+            value = function(variant)
+        except Skip as e:
+            skipped[name] = str(e)
+            print(f"{name:28} skipped: {e}")
+            continue
+        except BudgetExceeded as e:
+            over_budget[name] = str(e)
+            print(f"{name:28} over budget: {e}")
+            continue
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:28} {value:14,.2f} {unit}")
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+        "skipped": skipped,
+        "over_budget": over_budget,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        list: A description of each regression beyond the tolerance.
+    """
+    regressions = [f"{name}: {reason}" for name, reason in current["over_budget"].items()]
+    for name, result in current["results"].items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or not reference["value"]:
+            continue
+        ratio = result["value"] / reference["value"]
+        worse = ratio < 1 - tolerance if result["higher_is_better"] else ratio > 1 + tolerance
+        if worse:
+            regressions.append(f"{name}: {result['value']:,.2f} {result['unit']} vs baseline {reference['value']:,.2f} ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cash machine variants")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("benchmarks", nargs="*", help="only run benchmarks whose name contains one of these")
+    args = parser.parse_args()
+
+    current = run_all(args.benchmarks)
+    with open(args.output, "w") as output:
+        json.dump(current, output, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline:
+            json.dump(current, baseline, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+    try:
+        with open(args.baseline) as baseline:
+            regressions = compare(current, json.load(baseline), args.tolerance)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
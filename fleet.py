@@ -0,0 +1,208 @@
+"""Multi-process ATM fleet simulator.
+
+Starts server.py, which holds the shared account store and ledger, then runs
+a fleet of headless terminals spread over a pool of worker processes. Each
+terminal is one customer session at a time: it sends a request, waits for the
+answer and sends the next, like a real cash machine. The workload is a mix of
+operations over the accounts, with a share of the traffic going to a few hot
+accounts.
+
+The fleet is run once per process count given, and a table shows how
+throughput scales per core. After it comes a list of hot spots: the
+accounts with the most traffic, their share of it, their decline rate and
+their latency.
+
+Usage: python fleet.py [--processes 1,2,4] [--terminals N] [--duration SECONDS]
+                       [--mix deposit=0.4,withdraw=0.4,balance=0.2] [--hot-accounts N] [--hot-share F]
+                       [--target HOST:PORT]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from loadgen import percentile
+from server import FRAME, REQUEST, RESPONSE, BALANCE, WITHDRAW, DEPOSIT, HISTORY, DECLINED
+
+OPERATIONS = {"deposit": DEPOSIT, "withdraw": WITHDRAW, "balance": BALANCE, "history": HISTORY}
+
+
+class Workload:
+    """Class describing what the simulated customers do"""
+
+    def __init__(self, mix, accounts, hot_accounts, hot_share):
+        """
+        Initialize the Workload.
+
+        Args:
+            mix (dict): Operation name -> share of the requests.
+            accounts (int): Account numbers 1..accounts are used.
+            hot_accounts (int): Accounts 1..hot_accounts are hot.
+            hot_share (float): Share of the requests that go to a hot account.
+        """
+        self.operations = [OPERATIONS[name] for name in mix]
+        self.weights = list(mix.values())
+        self.accounts = accounts
+        self.hot_accounts = hot_accounts
+        self.hot_share = hot_share
+
+    def next_request(self, rng):
+        """Return the (operation, account, amount) of a customer's next request"""
+        operation = rng.choices(self.operations, self.weights)[0]
+        if self.hot_accounts and rng.random() < self.hot_share:
+            account = rng.randint(1, self.hot_accounts)
+        else:
+            account = rng.randint(1, self.accounts)
+        amount = 10 if operation == HISTORY else rng.randint(1, 100) * 100
+        return operation, account, amount
+
+
+async def terminal(host, port, workload, deadline, seed, stats):
+    """Run one terminal's sessions until the deadline, adding to stats"""
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    latencies, requests, declines, latency_sums = stats
+    request_id = 0
+    while time.perf_counter() < deadline:
+        request_id += 1
+        operation, account, amount = workload.next_request(rng)
+        payload = REQUEST.pack(request_id, operation, account, amount)
+        start = time.perf_counter()
+        writer.write(FRAME.pack(len(payload)) + payload)
+        (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+        answered, status, balance = RESPONSE.unpack_from(await reader.readexactly(length))
+        latency = time.perf_counter() - start
+        latencies.append(latency)
+        requests[account] = requests.get(account, 0) + 1
+        latency_sums[account] = latency_sums.get(account, 0.0) + latency
+        if status == DECLINED:
+            declines[account] = declines.get(account, 0) + 1
+    writer.close()
+
+
+def run_process(host, port, workload, terminals, duration, seed):
+    """
+    Run a share of the fleet in one worker process.
+
+    Returns:
+        tuple: (latencies, requests per account, declines per account, latency sum per account).
+    """
+    stats = ([], {}, {}, {})
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(terminal(host, port, workload, deadline, seed * 100003 + index, stats) for index in range(terminals)))
+
+    asyncio.run(run())
+    return stats
+
+
+def run_fleet(host, port, workload, processes, terminals, duration):
+    """
+    Run the fleet with a given number of worker processes.
+
+    Returns:
+        tuple: (elapsed seconds, merged stats as returned by run_process).
+    """
+    shares = [terminals // processes + (1 if index < terminals % processes else 0) for index in range(processes)]
+    merged = ([], {}, {}, {})
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_process, host, port, workload, share, duration, seed) for seed, share in enumerate(shares) if share]
+        for future in futures:
+            latencies, *per_account = future.result()
+            merged[0].extend(latencies)
+            for total, part in zip(merged[1:], per_account):
+                for account, value in part.items():
+                    total[account] = total.get(account, 0) + value
+    return time.perf_counter() - start, merged
+
+
+def start_server(accounts):
+    """Start server.py on a free port and wait until it accepts connections"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "server.py", "--port", str(port), "--accounts", str(accounts)],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("server.py did not start")
+
+
+def parse_mix(text):
+    """Parse "deposit=0.4,withdraw=0.4,..." into a dict"""
+    mix = {}
+    for part in text.split(","):
+        name, share = part.split("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(share)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of ATMs against server.py")
+    parser.add_argument("--processes", default=",".join(str(count) for count in (1, 2, 4) if count <= (os.cpu_count() or 1)),
+                        help="comma-separated worker process counts to compare")
+    parser.add_argument("--terminals", type=int, default=200, help="terminals in the fleet")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("deposit=0.4,withdraw=0.4,balance=0.15,history=0.05"))
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--hot-accounts", type=int, default=10)
+    parser.add_argument("--hot-share", type=float, default=0.5, help="share of requests going to the hot accounts")
+    parser.add_argument("--target", help="HOST:PORT of a running server.py, instead of starting one")
+    parser.add_argument("--top", type=int, default=5, help="hot spots to list")
+    args = parser.parse_args()
+
+    workload = Workload(args.mix, args.accounts, args.hot_accounts, args.hot_share)
+    server = None
+    if args.target:
+        host, port = args.target.rsplit(":", 1)
+        port = int(port)
+    else:
+        server, port = start_server(args.accounts)
+        host = "127.0.0.1"
+    try:
+        print(f"{'processes':>9} {'terminals':>9} {'requests/s':>12} {'per process':>12} {'efficiency':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        baseline = None
+        for processes in [int(count) for count in args.processes.split(",")]:
+            elapsed, (latencies, requests, declines, latency_sums) = run_fleet(host, port, workload, processes, args.terminals, args.duration)
+            rate = len(latencies) / elapsed
+            baseline = baseline or rate
+            latencies.sort()
+            print(f"{processes:>9} {args.terminals:>9} {rate:>12,.0f} {rate / processes:>12,.0f} {rate / (baseline * processes):>10.0%}"
+                  f" {percentile(latencies, 0.50) * 1000:>8.3f} {percentile(latencies, 0.99) * 1000:>8.3f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    total = sum(requests.values())
+    print(f"\nHot spots in the last run ({total:,} requests):")
+    print(f"{'account':>8} {'share':>7} {'declined':>9} {'mean ms':>8}")
+    ranked = sorted(requests, key=requests.get, reverse=True)
+    for account in ranked[:args.top]:
+        count = requests[account]
+        print(f"{account:>8} {count / total:>7.1%} {declines.get(account, 0) / count:>9.1%} {latency_sums[account] / count * 1000:>8.3f}")
+    # The remaining accounts together, for comparison
+    rest = ranked[args.top:]
+    count = sum(requests[account] for account in rest)
+    if count:
+        declined = sum(declines.get(account, 0) for account in rest)
+        latency = sum(latency_sums[account] for account in rest)
+        print(f"{'others':>8} {count / total:>7.1%} {declined / count:>9.1%} {latency / count * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,12 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-
-class CashMachine:
-    def __init__(self):
-        self.balance = 0
-        self.transaction_history = []
-
-    def check_balance(self):
-        return f"Your current balance: €{self.balance}"
-
-    def withdraw_money(self, amount):
-        if self.balance < amount:
-            result = "Insufficient funds. Unable to withdraw."
-        else:
-            self.balance -= amount
-            result = f"Withdrawal: -€{amount}. New balance: €{self.balance}"
-            self.transaction_history.append(result)
-        return result
-
-    def deposit_money(self, amount):
-        self.balance += amount
-        result = f"Deposit: +€{amount}. New balance: €{self.balance}"
-        self.transaction_history.append(result)
-        return result
+from atm import CashMachine, to_cents
+from atm.recording import record_session
 
 class CashMachineGUI:
     def __init__(self, root):
-        self.cash_machine = CashMachine()
+        self.cash_machine = CashMachine(require_pin=False)
+        record_session(self.cash_machine)  # Only when ATM_RECORD_FILE is set
 
         self.root = root
         self.root.title("Cash Machine GUI")
@@ -74,8 +54,8 @@ class CashMachineGUI:
 
     def withdraw_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.withdraw_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            result = str(self.cash_machine.withdraw_money(amount)[0])
             self.update_label(tk.Label(self.root, text=result, font=("Helvetica", 12), bg="#263238", fg="white"), result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())  # Update balance label
         except ValueError:
@@ -83,8 +63,8 @@ class CashMachineGUI:
 
     def deposit_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.deposit_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            result = str(self.cash_machine.deposit_money(amount)[0])
             self.update_label(tk.Label(self.root, text=result, font=("Helvetica", 12), bg="#263238", fg="white"), result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())  # Update balance label
         except ValueError:
@@ -1,35 +1,12 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from datetime import datetime  # Import the datetime module
-
-class CashMachine:
-    def __init__(self):
-        self.balance = 0
-        self.transaction_history = []
-
-    def check_balance(self):
-        return f"Your current balance: €{self.balance}"
-
-    def withdraw_money(self, amount):
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")  # European date format
-        if self.balance < amount:
-            result = "Insufficient funds. Unable to withdraw."
-        else:
-            self.balance -= amount
-            result = f"Withdrawal: -€{amount}. New balance: €{self.balance}. Date: {transaction_time}"
-            self.transaction_history.append(result)
-        return result
-
-    def deposit_money(self, amount):
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")  # European date format
-        self.balance += amount
-        result = f"Deposit: +€{amount}. New balance: €{self.balance}. Date: {transaction_time}"
-        self.transaction_history.append(result)
-        return result
+from atm import CashMachine, to_cents
+from atm.recording import record_session
 
 class CashMachineGUI:
     def __init__(self, root):
-        self.cash_machine = CashMachine()
+        self.cash_machine = CashMachine(require_pin=False)
+        record_session(self.cash_machine)  # Only when ATM_RECORD_FILE is set
 
         self.root = root
         self.root.title("Cash Machine GUI")
@@ -77,8 +54,8 @@ class CashMachineGUI:
 
     def withdraw_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.withdraw_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            result = str(self.cash_machine.withdraw_money(amount)[0])
             self.update_text(result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())  # Update balance label
         except ValueError:
@@ -87,8 +64,8 @@ class CashMachineGUI:
 
     def deposit_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.deposit_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            result = str(self.cash_machine.deposit_money(amount)[0])
             self.update_text(result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())  # Update balance label
         except ValueError:
@@ -2,156 +2,13 @@
 
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from datetime import datetime
 import locale
-
-class CashMachine:
-    """Class representing the Cash Machine"""
-
-    def __init__(self):
-        """Initialize Cash Machine attributes"""
-        self.balance = 0
-        self.transaction_history = []
-        self.pin = None  # Default PIN is None
-
-    def check_balance(self):
-        """Return a formatted string indicating the current balance"""
-        return f"Your current balance: {self.format_currency(self.balance)}"
-
-    def set_pin(self, pin):
-        """
-        Set the PIN if it's a 4-digit number.
-
-        Args:
-            pin (str): The PIN to set.
-
-        Returns:
-            bool: True if the PIN is set successfully, False otherwise.
-        """
-        if pin.isdigit() and len(pin) == 4:
-            self.pin = pin
-            return True
-        else:
-            return False
-
-    def verify_pin(self, pin):
-        """
-        Verify if the entered PIN matches the stored PIN.
-
-        Args:
-            pin (str): The PIN to verify.
-
-        Returns:
-            bool: True if the PIN is verified successfully, False otherwise.
-        """
-        return self.pin == pin
-
-    def withdraw_money(self, amount):
-        """
-        Withdraw money from the cash machine.
-
-        Args:
-            amount (float): The amount to be withdrawn.
-
-        Returns:
-            tuple: A tuple containing a transaction result message (str) and success status (bool).
-        """
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-
-        if self.pin and amount > 0:
-            if self.balance >= amount:
-                self.balance -= amount
-                result = f"Withdrawal: -{self.format_currency(amount)}. New balance: {self.format_currency(self.balance)}. Date: {transaction_time}"
-                self.transaction_history.append(result)
-                return result, True
-            else:
-                return "Insufficient funds. Withdrawal amount exceeds the current balance.", False
-        else:
-            if amount <= 0:
-                return "Invalid withdrawal amount. Amount must be greater than 0.", False
-            elif not self.pin:
-                return "Invalid operation. PIN not set.", False
-            elif not self.verify_pin(self.pin):
-                return "Invalid PIN. Please enter the correct PIN.", False
-
-    def deposit_money(self, amount):
-        """
-        Deposit money into the cash machine.
-
-        Args:
-            amount (float): The amount to be deposited.
-
-        Returns:
-            tuple: A tuple containing a transaction result message (str) and success status (bool).
-        """
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-
-        if self.pin and amount > 0:
-            self.balance += amount
-            result = f"Deposit: +{self.format_currency(amount)}. New balance: {self.format_currency(self.balance)}. Date: {transaction_time}"
-            self.transaction_history.append(result)
-            return result, True
-        else:
-            if amount <= 0:
-                return "Invalid deposit amount. Amount must be greater than 0.", False
-            elif not self.pin:
-                return "Invalid operation. PIN not set.", False
-            elif not self.verify_pin(self.pin):
-                return "Invalid PIN. Please enter the correct PIN.", False
-
-    def format_currency(self, amount):
-        """
-        Format the amount as currency using the locale module.
-
-        Args:
-            amount (float): The amount to be formatted.
-
-        Returns:
-            str: The formatted amount as currency.
-        """
-        return locale.currency(amount, grouping=True, symbol='€')
-
-class TransactionHandler:
-    """Class handling transactions"""
-
-    def __init__(self, cash_machine):
-        """Initialize TransactionHandler with a CashMachine instance"""
-        self.cash_machine = cash_machine
-
-    def perform_withdrawal(self, amount):
-        """
-        Perform a withdrawal transaction.
-
-        Args:
-            amount (float): The amount to be withdrawn.
-
-        Returns:
-            tuple: A tuple containing a transaction result message (str) and success status (bool).
-        """
-        try:
-            result, success = self.cash_machine.withdraw_money(amount)
-            return result, success
-        except ValueError as e:
-            if "Insufficient funds" in str(e):
-                return "Insufficient funds. Withdrawal amount exceeds the current balance.", False
-            else:
-                return f"Error: {str(e)}", False
-
-    def perform_deposit(self, amount):
-        """
-        Perform a deposit transaction.
-
-        Args:
-            amount (float): The amount to be deposited.
-
-        Returns:
-            tuple: A tuple containing a transaction result message (str) and success status (bool).
-        """
-        try:
-            result, success = self.cash_machine.deposit_money(amount)
-            return result, success
-        except ValueError as e:
-            return f"Error: {str(e)}", False
+import os
+from atm import CashDispenser, CashMachine, TransactionHandler, Journal, WithdrawalLimits, to_cents
+from atm.metrics import Metrics, instrument_handler
+from atm.recording import BREAKDOWN, CANCEL, record_session
+from atm.tracing import Tracer, LagMonitor
+from atm.workers import TransactionWorkerPool
 
 class GUIConstants:
     """Class containing constants for GUI styling"""
@@ -159,39 +16,174 @@ class GUIConstants:
     BUTTON_COLOR = "#2979FF"
     SUCCESS_COLOR = "#4CAF50"
     FAILURE_COLOR = "#d32f2f"  # Red color for failure
+    WARNING_COLOR = "#FFB300"  # Amber color for the low-cash warning
     TEXT_AREA_COLOR = "#455A64"
     TEXT_COLOR = "white"
     FONT_STYLE = ("Helvetica", 14)
+    POLL_INTERVAL_MS = 50  # How often results of background transactions are collected
+
+class HistoryView:
+    """Class showing a ledger in a Text widget, rendering only the visible rows"""
+
+    def __init__(self, parent, ledger, rows=20, **text_options):
+        """
+        Initialize the HistoryView.
+
+        Args:
+            parent (tk.Widget): The parent widget.
+            ledger (Ledger): The ledger to display.
+            rows (int): The number of entries visible at once.
+            **text_options: Extra options passed to the Text widget.
+        """
+        self.ledger = ledger
+        self.rows = rows
+        self.first = 0  # Index of the first visible entry
+        self.shown = 0  # Number of entries currently in the widget
+        self.follow = True  # Keep the newest entries in view
+        self.text = tk.Text(parent, height=rows, **text_options)
+        self.scrollbar = tk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+        # Entries are not wrapped, so long ones are scrolled to sideways instead of cut off
+        self.xscrollbar = tk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(xscrollcommand=self.xscrollbar.set)
+        self.text.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.text.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.text.bind("<Button-5>", lambda event: self.scroll(1))
+        self.xscrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.text.pack(side=tk.LEFT)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def refresh(self):
+        """Show new ledger entries, appending them when following the end of the ledger"""
+        # The ledger's length counts only fully written rows, so every row below it can be rendered
+        # while the worker thread appends more
+        total = len(self.ledger)
+        if not self.follow:
+            self.update_scrollbar(total)
+            return
+        last = self.first + self.shown
+        if total - last > self.rows:
+            self.render(max(0, total - self.rows))
+            return
+        for index in range(last, total):
+            if self.shown:
+                self.text.insert(tk.END, "\n")
+            self.text.insert(tk.END, self.ledger.render(index))
+            self.shown += 1
+            if self.shown > self.rows:
+                self.text.delete("1.0", "2.0")
+                self.first += 1
+                self.shown -= 1
+        self.update_scrollbar(total)
+
+    def render(self, first):
+        """Render the window of entries starting at the given index"""
+        total = len(self.ledger)
+        self.first = max(0, min(first, total - self.rows))
+        self.shown = min(self.rows, total - self.first)
+        self.follow = self.first + self.shown >= total
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, "\n".join(self.ledger[self.first:self.first + self.shown]))
+        self.update_scrollbar(total)
+
+    def clear(self):
+        """Remove all entries from the widget"""
+        self.text.delete("1.0", tk.END)
+        self.first = self.shown = 0
+        self.follow = True
+        self.update_scrollbar(0)
+
+    def scroll(self, rows):
+        """Scroll the window by a number of rows"""
+        self.render(self.first + rows)
+
+    def yview(self, *args):
+        """Handle scrollbar commands by rendering the requested window"""
+        total = len(self.ledger)
+        if args[0] == "moveto":
+            self.render(int(float(args[1]) * total))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self.scroll(int(args[1]) * step)
+
+    def update_scrollbar(self, total):
+        """Update the scrollbar to reflect the visible window"""
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + self.shown) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
 
 class CashMachineGUI:
     """Class representing the Cash Machine GUI"""
 
-    def __init__(self, root, transaction_handler):
+    def __init__(self, root, transaction_handler, worker_pool=None, recorder=None):
         """
         Initialize CashMachineGUI with a Tkinter root and a TransactionHandler instance.
 
         Args:
             root (tk.Tk): The Tkinter root.
             transaction_handler (TransactionHandler): The TransactionHandler instance.
+            worker_pool (TransactionWorkerPool): Optional pool that runs transactions off the Tk thread.
+            recorder (SessionRecorder): Optional recorder of the session, which also gets declined confirmations.
         """
         self.transaction_handler = transaction_handler
+        self.worker_pool = worker_pool
+        self.recorder = recorder
         self.showing_history = False
+        self.session = None  # Token from CashMachine.open_session; the PIN is not re-checked per transaction
         self.root = root
         self.verify_pin()
         self.root.title("ATM GUI")
         self.root.geometry("600x700")
         self.root.configure(bg=GUIConstants.BACKGROUND_COLOR)
         self.create_widgets()
+        if self.worker_pool is not None:
+            self.root.after(GUIConstants.POLL_INTERVAL_MS, self.poll_results)
 
     def verify_pin(self):
-        """Prompt the user to set a 4-digit PIN and handle invalid inputs"""
-        while True:
-            pin = simpledialog.askstring("PIN", "Enter your 4-digit PIN:")
-            if self.transaction_handler.cash_machine.set_pin(pin):
-                messagebox.showinfo("PIN Set", "PIN successfully set!")
-                break
-            else:
+        """Ask for the card's PIN and open a session, or have the user choose a PIN if none was set yet"""
+        cash_machine = self.transaction_handler.cash_machine
+        if cash_machine.pin_hash is None:
+            while True:
+                pin = simpledialog.askstring("PIN", "Choose a 4-digit PIN:")
+                if pin is None:
+                    raise SystemExit
+                if cash_machine.set_pin(pin):
+                    self.session = cash_machine.open_session(pin)
+                    messagebox.showinfo("PIN Set", "PIN successfully set!")
+                    return
                 messagebox.showerror("Error", "Invalid PIN. Please enter a 4-digit PIN.")
+        # The PIN and any wrong attempts were restored from the journal, so a restart does not reset them
+        while not cash_machine.locked:
+            pin = simpledialog.askstring("PIN", "Enter your 4-digit PIN:")
+            if pin is None:
+                raise SystemExit
+            self.session = cash_machine.open_session(pin)
+            if self.session is not None:
+                return
+            messagebox.showerror("Error", "Incorrect PIN. Please try again.")
+        messagebox.showerror("Card Locked", "Too many incorrect PIN attempts. The card is locked.")
+        raise SystemExit
+
+    def renew_session(self):
+        """
+        Ask for the PIN again after the session has expired.
+
+        Returns:
+            bool: True if a new session was opened, False if the user cancelled or the card is locked.
+        """
+        cash_machine = self.transaction_handler.cash_machine
+        while not cash_machine.locked:
+            pin = simpledialog.askstring("PIN", "Session expired. Enter your 4-digit PIN:")
+            if pin is None:
+                return False
+            self.session = cash_machine.open_session(pin)
+            if self.session is not None:
+                return True
+            messagebox.showerror("Error", "Incorrect PIN. Please try again.")
+        messagebox.showerror("Card Locked", "Too many incorrect PIN attempts. The card is locked.")
+        self.root.destroy()
+        return False
 
     def create_widgets(self):
         """Create GUI widgets"""
@@ -201,6 +193,12 @@ class CashMachineGUI:
         self.balance_label = tk.Label(self.root, text=self.transaction_handler.cash_machine.check_balance(), font=("Helvetica", 18), bg=GUIConstants.BACKGROUND_COLOR, fg=GUIConstants.TEXT_COLOR)
         self.balance_label.pack(pady=10)
 
+        self.status_label = tk.Label(self.root, text="", font=("Helvetica", 12), bg=GUIConstants.BACKGROUND_COLOR, fg=GUIConstants.TEXT_COLOR)
+        self.status_label.pack()
+
+        self.cash_label = tk.Label(self.root, text=self.transaction_handler.cash_machine.low_cash(), font=("Helvetica", 12), bg=GUIConstants.BACKGROUND_COLOR, fg=GUIConstants.WARNING_COLOR)
+        self.cash_label.pack()
+
         menu_frame = tk.Frame(self.root, bg=GUIConstants.BACKGROUND_COLOR)
         menu_frame.pack(pady=20)
 
@@ -227,8 +225,7 @@ class CashMachineGUI:
         self.history_frame = tk.Frame(self.root, bg=GUIConstants.BACKGROUND_COLOR)
         self.history_frame.pack(pady=20)
 
-        self.history_text = tk.Text(self.history_frame, height=20, width=60, wrap=tk.WORD, font=("Helvetica", 12), bg=GUIConstants.TEXT_AREA_COLOR, fg=GUIConstants.TEXT_COLOR)
-        self.history_text.pack()
+        self.history_view = HistoryView(self.history_frame, self.transaction_handler.cash_machine.transaction_history, rows=20, width=80, wrap=tk.NONE, font=("Helvetica", 12), bg=GUIConstants.TEXT_AREA_COLOR, fg=GUIConstants.TEXT_COLOR)
 
     def show_or_hide_history(self):
         """Toggle showing or hiding transaction history in the GUI"""
@@ -236,32 +233,78 @@ class CashMachineGUI:
             self.update_history_text()
             self.showing_history = True
         else:
-            self.history_text.delete(1.0, tk.END)
+            self.history_view.clear()
             self.showing_history = False
 
     def change_pin(self):
-        """Prompt the user to change their PIN"""
+        """Prompt the user for their current PIN and a new one"""
+        cash_machine = self.transaction_handler.cash_machine
+        old_pin = simpledialog.askstring("Change PIN", "Enter your current 4-digit PIN:")
+        if old_pin is None:
+            return
         new_pin = simpledialog.askstring("Change PIN", "Enter your new 4-digit PIN:")
-        if new_pin:
-            if self.transaction_handler.cash_machine.set_pin(new_pin):
-                messagebox.showinfo("PIN Changed", "PIN successfully changed!")
-            else:
-                messagebox.showerror("Error", "Invalid PIN. Please enter a 4-digit PIN.")
+        if new_pin is None:
+            return
+        if not cash_machine.valid_pin(new_pin):
+            messagebox.showerror("Error", "Invalid PIN. Please enter a 4-digit PIN.")
+        elif cash_machine.change_pin(old_pin, new_pin):
+            self.session = cash_machine.open_session(new_pin)
+            messagebox.showinfo("PIN Changed", "PIN successfully changed!")
+        elif cash_machine.locked:
+            messagebox.showerror("Card Locked", "Too many incorrect PIN attempts. The card is locked.")
+            self.root.destroy()
+        else:
+            messagebox.showerror("Error", "Incorrect PIN. The PIN was not changed.")
 
     def withdraw_or_deposit(self, transaction_type):
         """Perform withdrawal or deposit based on user input"""
         amount = self.get_amount()
         if amount is not None:
-            confirmation = messagebox.askyesno("Transaction Confirmation", f"Are you sure you want to {transaction_type} {self.transaction_handler.cash_machine.format_currency(amount)}?")
+            cash_machine = self.transaction_handler.cash_machine
+            question = f"Are you sure you want to {transaction_type} {cash_machine.format_currency(amount)}?"
+            if transaction_type == "withdraw":
+                # Show the notes up front, and turn away amounts the cassettes can't pay before asking
+                notes = cash_machine.note_breakdown(amount)
+                if self.recorder is not None:
+                    self.recorder.record(BREAKDOWN, amount, notes is not None)
+                if notes is None:
+                    messagebox.showerror("Transaction Result", "Amount cannot be dispensed with the notes available.")
+                    return
+                if notes:
+                    question += f"\n\nYou will receive {notes}."
+            confirmation = messagebox.askyesno("Transaction Confirmation", question)
+            if not confirmation and self.recorder is not None:
+                self.recorder.record(CANCEL, amount)
             if confirmation:
+                if not self.transaction_handler.cash_machine.check_session(self.session) and not self.renew_session():
+                    return
+                if self.worker_pool is not None:
+                    # Hand the transaction to a worker; poll_results picks up the outcome
+                    self.worker_pool.submit(transaction_type, amount, session=self.session)
+                    self.set_default_text()
+                    self.update_status_label()
+                    return
                 result, success = None, False
                 if transaction_type == "withdraw":
-                    result, success = self.transaction_handler.perform_withdrawal(amount)
+                    result, success = self.transaction_handler.perform_withdrawal(amount, session=self.session)
                 else:
-                    result, success = self.transaction_handler.perform_deposit(amount)
+                    result, success = self.transaction_handler.perform_deposit(amount, session=self.session)
 
                 self.handle_transaction_result(result, success)
 
+    def poll_results(self):
+        """Display the results of finished background transactions, then poll again"""
+        for transaction_type, amount, result, success in self.worker_pool.poll():
+            self.handle_transaction_result(result, success)
+        self.update_status_label()
+        # Scheduled after handling so a result dialog never runs a nested poll
+        self.root.after(GUIConstants.POLL_INTERVAL_MS, self.poll_results)
+
+    def update_status_label(self):
+        """Show how many transactions are still in flight"""
+        pending = self.worker_pool.pending
+        self.status_label.config(text=f"Processing {pending} transaction(s)..." if pending else "")
+
     def withdraw_money(self):
         """Wrapper function for withdrawing money"""
         self.withdraw_or_deposit("withdraw")
@@ -287,9 +330,9 @@ class CashMachineGUI:
         self.amount_entry.icursor("end")
 
     def get_amount(self):
-        """Get the amount entered by the user, handle invalid inputs"""
+        """Get the amount entered by the user in cents, handle invalid inputs"""
         try:
-            amount = float(self.amount_entry.get())
+            amount = to_cents(self.amount_entry.get())
             if amount <= 0:
                 messagebox.showerror("Error", "Invalid input. Amount must be greater than 0.")
                 return None
@@ -301,13 +344,12 @@ class CashMachineGUI:
     def handle_transaction_result(self, result, success):
         """Handle and display transaction results and errors"""
         if result is not None and success:
-            messagebox.showinfo("Transaction Result", result)
+            messagebox.showinfo("Transaction Result", str(result))
             self.root.configure(bg=GUIConstants.SUCCESS_COLOR)
             self.root.after(1000, lambda: self.root.configure(bg=GUIConstants.BACKGROUND_COLOR))
             self.set_default_text()
         elif result is not None:
             if "Insufficient funds" in result:
-                self.transaction_handler.cash_machine.transaction_history.append(result)
                 self.update_balance_label()
                 self.update_history_text()
                 messagebox.showerror("Transaction Result", "Insufficient funds. Withdrawal amount exceeds the current balance.")
@@ -322,14 +364,13 @@ class CashMachineGUI:
         self.update_history_text()
 
     def update_balance_label(self):
-        """Update the balance label in the GUI"""
+        """Update the balance label and the low-cash warning in the GUI"""
         self.balance_label.config(text=self.transaction_handler.cash_machine.check_balance())
+        self.cash_label.config(text=self.transaction_handler.cash_machine.low_cash())
 
     def update_history_text(self):
-        """Update the transaction history text in the GUI"""
-        self.history_text.delete(1.0, tk.END)
-        history_text = "\n".join(self.transaction_handler.cash_machine.transaction_history)
-        self.history_text.insert(tk.END, history_text)
+        """Update the transaction history view with any new transactions"""
+        self.history_view.refresh()
 
     def set_default_text(self):
         """Set default text in the entry box after a transaction"""
@@ -343,9 +384,44 @@ if __name__ == "__main__":
 
     # Create Tkinter root, CashMachine instance, and TransactionHandler instance
     root = tk.Tk()
-    cash_machine = CashMachine()
-    transaction_handler = TransactionHandler(cash_machine)
+    # Withdrawals are paid from the note cassettes, which are checked before the balance changes
+    cash_machine = CashMachine(dispenser=CashDispenser())
+    # Restore the balance, history, cassette counts and PIN from the journal before accepting transactions
+    journal = Journal("atm_journal")
+    journal.recover(cash_machine)
+    # Count recent withdrawals from the recovered history, so a restart does not reset the limits
+    limits = WithdrawalLimits(format_amount=cash_machine.format_currency)
+    limits.seed(cash_machine.transaction_history)
+    transaction_handler = TransactionHandler(cash_machine, journal, limits=limits)
+    # Recording is opt-in: ATM_RECORD_FILE names a file the session is appended to,
+    # with the transactions as the handler and its limits saw them
+    recorder = record_session(cash_machine, transaction_handler=transaction_handler)
+    # Instrumentation is opt-in: ATM_METRICS_FILE names a Prometheus textfile to keep up to date
+    metrics_file = os.environ.get("ATM_METRICS_FILE")
+    metrics = Metrics() if metrics_file else None
+    if metrics is not None:
+        instrument_handler(metrics, transaction_handler)
+    # Run transactions on a worker thread so journal I/O never blocks the window
+    worker_pool = TransactionWorkerPool(transaction_handler)
 
     # Create and run the CashMachineGUI
-    app = CashMachineGUI(root, transaction_handler)
+    app = CashMachineGUI(root, transaction_handler, worker_pool, recorder)
+    if metrics is not None:
+        metrics.instrument(app, "update_history_text", "update_history_text")
+        metrics.write_periodically(metrics_file)
+    # Tracing is opt-in too: ATM_TRACE_FILE names a Chrome trace file written on exit
+    trace_file = os.environ.get("ATM_TRACE_FILE")
+    tracer = Tracer(trace_file) if trace_file else None
+    if tracer is not None:
+        LagMonitor(root, tracer)
+        tracer.trace_after(root)
+        tracer.wrap(app, "withdraw_or_deposit", "handle_transaction_result", "update_history_text")
+        tracer.wrap(transaction_handler, "perform_withdrawal", "perform_deposit")
     root.mainloop()
+    worker_pool.close()
+    journal.close()
+    if metrics is not None:
+        metrics.close()
+        metrics.write(metrics_file)
+    if tracer is not None:
+        tracer.write()
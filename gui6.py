@@ -1,48 +1,9 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from datetime import datetime
+from atm import CashMachine, to_cents
+from atm.recording import record_session
 import locale
 
-# Class representing the Cash Machine functionality
-class CashMachine:
-    def __init__(self):
-        # Initialize balance, transaction history, and hardcoded PIN
-        self.balance = 0
-        self.transaction_history = []
-        self.pin = "1234"  # Hardcoded PIN to "1234"
-
-    def check_balance(self):
-        return f"Your current balance: {self.format_currency(self.balance)}"
-
-    def withdraw_money(self, amount):
-        # Get the current timestamp for the transaction
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-        # Check if the PIN is set and there are sufficient funds
-        if self.pin and self.balance >= amount:
-            self.balance -= amount
-            # Record the withdrawal transaction in the history
-            result = f"Withdrawal: -{self.format_currency(amount)}. New balance: {self.format_currency(self.balance)}. Date: {transaction_time}"
-            self.transaction_history.append(result)
-            return result
-        else:
-            return "Insufficient funds. Unable to withdraw."
-
-    def deposit_money(self, amount):
-        # Get the current timestamp for the transaction
-        transaction_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-        # Check if the PIN is set
-        if self.pin:
-            self.balance += amount
-            # Record the deposit transaction in the history
-            result = f"Deposit: +{self.format_currency(amount)}. New balance: {self.format_currency(self.balance)}. Date: {transaction_time}"
-            self.transaction_history.append(result)
-            return result
-        else:
-            return "Unable to deposit."
-
-    def format_currency(self, amount):
-        return locale.currency(amount, grouping=True)
-
 # Class holding constants for GUI styling
 class GUIConstants:
     BACKGROUND_COLOR = "#263238"
@@ -55,9 +16,10 @@ class GUIConstants:
 # Class representing the Cash Machine GUI
 class CashMachineGUI:
     def __init__(self, root):
-        # Initialize CashMachine instance and prompt for PIN
+        # Initialize CashMachine instance and have the user choose a PIN, which opens the first session
         self.cash_machine = CashMachine()
-        self.verify_pin()
+        record_session(self.cash_machine)  # Only when ATM_RECORD_FILE is set
+        self.choose_pin()
         self.root = root
         self.root.title("ATM GUI")
         self.root.geometry("600x700")
@@ -66,14 +28,33 @@ class CashMachineGUI:
         # Create GUI widgets
         self.create_widgets()
 
-    def verify_pin(self):
-        # Loop until a correct PIN is entered
+    def choose_pin(self):
+        # Loop until a valid 4-digit PIN is chosen; the session it opens covers the following transactions
         while True:
-            pin = simpledialog.askstring("PIN", "Enter your 4-digit PIN:")
-            if pin == self.cash_machine.pin:
-                break
-            else:
-                messagebox.showerror("Error", "Invalid PIN. Please try again.")
+            pin = simpledialog.askstring("PIN", "Choose a 4-digit PIN:")
+            if pin is None:
+                raise SystemExit
+            if self.cash_machine.set_pin(pin):
+                self.session = self.cash_machine.open_session(pin)
+                return
+            messagebox.showerror("Error", "Invalid PIN. Please enter a 4-digit PIN.")
+
+    def renew_session(self):
+        # Keep the session if it is still valid, otherwise ask for the PIN again;
+        # False if the user cancels or the card gets locked
+        if self.cash_machine.check_session(self.session):
+            return True
+        while not self.cash_machine.locked:
+            pin = simpledialog.askstring("PIN", "Session expired. Enter your 4-digit PIN:")
+            if pin is None:
+                return False
+            self.session = self.cash_machine.open_session(pin)
+            if self.session is not None:
+                return True
+            messagebox.showerror("Error", "Invalid PIN. Please try again.")
+        messagebox.showerror("Card Locked", "Too many incorrect PIN attempts. The card is locked.")
+        self.root.destroy()
+        return False
 
     def create_widgets(self):
         # Create and pack GUI elements
@@ -111,8 +92,10 @@ class CashMachineGUI:
 
     def withdraw_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.withdraw_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            if not self.renew_session():
+                return
+            result = str(self.cash_machine.withdraw_money(amount, self.session)[0])
             self.update_text(result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())
         except ValueError:
@@ -121,8 +104,10 @@ class CashMachineGUI:
 
     def deposit_money(self):
         try:
-            amount = float(self.amount_entry.get())
-            result = self.cash_machine.deposit_money(amount)
+            amount = to_cents(self.amount_entry.get())
+            if not self.renew_session():
+                return
+            result = str(self.cash_machine.deposit_money(amount, self.session)[0])
             self.update_text(result)
             self.update_label(self.balance_label, self.cash_machine.check_balance())
         except ValueError:
@@ -0,0 +1,82 @@
+"""Localhost load generator for server.py.
+
+Opens many connections, keeps a fixed number of pipelined requests in flight
+on each, and reports requests per second and p50/p99 latency.
+
+Usage: python loadgen.py [--connections N] [--pipeline N] [--duration SECONDS]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from server import FRAME, REQUEST, RESPONSE, BALANCE, WITHDRAW, DEPOSIT, HISTORY
+
+# Share of each operation in the generated traffic
+MIX = ((DEPOSIT, 0.4), (WITHDRAW, 0.4), (BALANCE, 0.15), (HISTORY, 0.05))
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at `fraction` of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def client(host, port, accounts, pipeline, deadline, seed, latencies):
+    """Drive one connection until the deadline, recording each request's latency"""
+    rng = random.Random(seed)
+    operations = [operation for operation, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    reader, writer = await asyncio.open_connection(host, port)
+    sent_at = {}
+    request_id = 0
+
+    def send():
+        nonlocal request_id
+        request_id += 1
+        operation = rng.choices(operations, weights)[0]
+        amount = 10 if operation == HISTORY else rng.randint(1, 100) * 100
+        payload = REQUEST.pack(request_id, operation, rng.randint(1, accounts), amount)
+        sent_at[request_id] = time.perf_counter()
+        writer.write(FRAME.pack(len(payload)) + payload)
+
+    for _ in range(pipeline):
+        send()
+    while sent_at:
+        (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+        payload = await reader.readexactly(length)
+        answered, status, balance = RESPONSE.unpack_from(payload)
+        latencies.append(time.perf_counter() - sent_at.pop(answered))
+        if time.perf_counter() < deadline:
+            send()
+    writer.close()
+
+
+async def run(host, port, connections, pipeline, duration, accounts):
+    """Run all clients concurrently and return (requests, elapsed, latencies)"""
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, accounts, pipeline, deadline, seed, latencies) for seed in range(connections)))
+    return len(latencies), time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--pipeline", type=int, default=16, help="requests in flight per connection")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--accounts", type=int, default=1000, help="account numbers 1..N are targeted")
+    args = parser.parse_args()
+
+    requests, elapsed, latencies = asyncio.run(run(args.host, args.port, args.connections, args.pipeline, args.duration, args.accounts))
+    latencies.sort()
+    print(f"{requests} requests in {elapsed:.2f}s: {requests / elapsed:,.0f} requests/s")
+    print(f"p50 {percentile(latencies, 0.50) * 1000:.3f} ms, p99 {percentile(latencies, 0.99) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
-class CashMachine:
-    def __init__(self):
-        self.balance = 0
+from atm import CashMachine, TransactionHandler, to_cents
+from atm.recording import record_session
+
+
+class CashMachineCLI:
+    def __init__(self, transaction_handler):
+        self.transaction_handler = transaction_handler
 
     def display_menu(self):
         print("""
@@ -15,36 +19,46 @@ class CashMachine:
         """)
 
     def check_balance(self):
-        print(f"\nYour current balance is €{self.balance}\n")
+        print(f"\n{self.transaction_handler.cash_machine.check_balance()}\n")
+
+    def read_amount(self, prompt):
+        try:
+            return to_cents(input(prompt))
+        except ValueError:
+            print("\nInvalid amount.\n")
+            return None
 
     def withdraw_money(self):
-        amount = float(input("\nEnter the amount to withdraw: € "))
-        if self.balance < amount:
-            print("\nInsufficient balance.\n")
-        else:
-            self.balance -= amount
-            print(f"\n€{amount} has been withdrawn. Your new balance is €{self.balance}\n")
+        amount = self.read_amount("\nEnter the amount to withdraw: € ")
+        if amount is not None:
+            result, success = self.transaction_handler.perform_withdrawal(amount)
+            print(f"\n{result}\n")
 
     def deposit_money(self):
-        amount = float(input("\nEnter the amount to deposit: € "))
-        self.balance += amount
-        print(f"\n€{amount} has been deposited. Your new balance is €{self.balance}\n")
-
-
-cash_machine = CashMachine()
-
-while True:
-    cash_machine.display_menu()
-    option = input("\nEnter your choice (1-4): ")
-
-    if option == '1':
-        cash_machine.check_balance()
-    elif option == '2':
-        cash_machine.withdraw_money()
-    elif option == '3':
-        cash_machine.deposit_money()
-    elif option == '4':
-        print("\nThank you for using the cash machine. Goodbye!\n")
-        break
-    else:
-        print("\nInvalid option. Please try again.\n")
\ No newline at end of file
+        amount = self.read_amount("\nEnter the amount to deposit: € ")
+        if amount is not None:
+            result, success = self.transaction_handler.perform_deposit(amount)
+            print(f"\n{result}\n")
+
+
+if __name__ == "__main__":
+    engine = CashMachine(require_pin=False)
+    transaction_handler = TransactionHandler(engine)
+    record_session(engine, transaction_handler=transaction_handler)  # Only when ATM_RECORD_FILE is set
+    cash_machine = CashMachineCLI(transaction_handler)
+
+    while True:
+        cash_machine.display_menu()
+        option = input("\nEnter your choice (1-4): ")
+
+        if option == '1':
+            cash_machine.check_balance()
+        elif option == '2':
+            cash_machine.withdraw_money()
+        elif option == '3':
+            cash_machine.deposit_money()
+        elif option == '4':
+            print("\nThank you for using the cash machine. Goodbye!\n")
+            break
+        else:
+            print("\nInvalid option. Please try again.\n")
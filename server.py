@@ -0,0 +1,159 @@
+"""asyncio TCP front-end for the transaction engine.
+
+Every message is a frame: a 4-byte big-endian payload length followed by the
+payload. A request payload is REQUEST (request id, operation, account number,
+amount in cents), optionally followed by a KEY_SIZE-byte idempotency key such
+as a UUID: a withdrawal or deposit retried with the same key is answered with
+the first result instead of being executed again. A response payload is
+RESPONSE (request id, status, balance in cents) followed by an optional UTF-8
+message; for HISTORY the message holds one ledger line per entry. Clients may
+pipeline any number of requests on a connection; responses come back in
+request order.
+
+Usage: python server.py [--host HOST] [--port PORT] [--accounts N] [--metrics-port PORT]
+                        [--idempotency-capacity N] [--idempotency-ttl SECONDS]
+"""
+
+import argparse
+import asyncio
+import struct
+from atm import AccountStore, CashMachine, IdempotencyCache, TransactionHandler
+from atm.idempotency import DEFAULT_CAPACITY, DEFAULT_TTL
+from atm.metrics import Metrics, instrument_handler
+
+FRAME = struct.Struct(">I")
+REQUEST = struct.Struct("<IBqq")
+RESPONSE = struct.Struct("<IBq")
+KEY_SIZE = 16
+
+# Operations
+BALANCE = 1
+WITHDRAW = 2
+DEPOSIT = 3
+HISTORY = 4  # The amount field holds the number of entries to return
+
+# Response statuses
+OK = 0
+DECLINED = 1
+ERROR = 2
+
+HIGH_WATER = 64 * 1024  # Drain the socket once this much output is buffered
+
+
+def encode_response(request_id, status, balance, message=""):
+    """Return a framed response"""
+    payload = RESPONSE.pack(request_id, status, balance) + message.encode()
+    return FRAME.pack(len(payload)) + payload
+
+
+class TransactionServer:
+    """Class serving a TransactionHandler to many connections on one event loop"""
+
+    def __init__(self, transaction_handler):
+        """
+        Initialize TransactionServer with a TransactionHandler instance.
+
+        Args:
+            transaction_handler (TransactionHandler): The handler whose AccountStore is served.
+        """
+        self.transaction_handler = transaction_handler
+
+    def handle_request(self, payload):
+        """
+        Execute one request payload.
+
+        Args:
+            payload (bytes): The request payload.
+
+        Returns:
+            bytes: The framed response.
+        """
+        if len(payload) == REQUEST.size:
+            key = None
+        elif len(payload) == REQUEST.size + KEY_SIZE:
+            key = payload[REQUEST.size:]
+        else:
+            return encode_response(0, ERROR, 0, "Malformed request.")
+        request_id, operation, account, amount = REQUEST.unpack_from(payload)
+        accounts = self.transaction_handler.accounts
+        if operation == WITHDRAW:
+            result, success = self.transaction_handler.perform_withdrawal(amount, account, key=key)
+        elif operation == DEPOSIT:
+            result, success = self.transaction_handler.perform_deposit(amount, account, key=key)
+        elif operation == BALANCE:
+            result, success = "", account in accounts
+        elif operation == HISTORY:
+            result, success = "\n".join(self.history(account, amount)), account in accounts
+        else:
+            return encode_response(request_id, ERROR, 0, "Unknown operation.")
+        if not success and not result:
+            result = "Unknown account."
+        balance = accounts.balance(account)
+        status = OK if success else DECLINED
+        # Successful transactions are acknowledged by status and balance alone
+        message = result if operation == HISTORY or not success else ""
+        return encode_response(request_id, status, balance or 0, str(message))
+
+    def history(self, account, limit):
+        """Return the messages of the most recent `limit` ledger entries of an account, oldest first"""
+        ledger = self.transaction_handler.accounts.transaction_history
+        return [ledger.render(index) for index in reversed(ledger.recent(account, limit))]
+
+    async def handle_connection(self, reader, writer):
+        """Serve pipelined requests from one connection until it closes"""
+        try:
+            while True:
+                header = await reader.readexactly(FRAME.size)
+                (length,) = FRAME.unpack(header)
+                if length != REQUEST.size and length != REQUEST.size + KEY_SIZE:
+                    # Refuse before reading, so a bogus length cannot make the server buffer gigabytes
+                    writer.write(encode_response(0, ERROR, 0, "Malformed request."))
+                    await writer.drain()
+                    break
+                writer.write(self.handle_request(await reader.readexactly(length)))
+                # Only wait for the socket when output backs up, so pipelined requests are answered in bulk
+                if writer.transport.get_write_buffer_size() > HIGH_WATER:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Accept connections forever"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the transaction engine over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--accounts", type=int, default=1000, help="number of demo accounts to open, numbered from 1")
+    parser.add_argument("--opening-balance", type=int, default=100000, help="in cents")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics over HTTP on this port")
+    parser.add_argument("--idempotency-capacity", type=int, default=DEFAULT_CAPACITY, help="most idempotency keys remembered")
+    parser.add_argument("--idempotency-ttl", type=float, default=DEFAULT_TTL, help="seconds an idempotency key is remembered")
+    args = parser.parse_args()
+
+    store = AccountStore(capacity=args.accounts)
+    for number in range(1, args.accounts + 1):
+        store.open_account(number, args.opening_balance)
+    idempotency = IdempotencyCache(args.idempotency_capacity, args.idempotency_ttl)
+    transaction_handler = TransactionHandler(CashMachine(), accounts=store, idempotency=idempotency)
+    if args.metrics_port is not None:
+        metrics = Metrics()
+        instrument_handler(metrics, transaction_handler)
+        metrics.serve(args.host, args.metrics_port)
+        print(f"Serving metrics on http://{args.host}:{args.metrics_port}/metrics")
+    server = TransactionServer(transaction_handler)
+    print(f"Serving {args.accounts} accounts on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Hammer a shared AccountStore from many threads and check its invariants.
+
+Usage: python stress.py [--threads N] [--accounts N] [--operations N]
+"""
+
+import argparse
+import random
+import threading
+import time
+from atm import AccountStore, CashMachine, TransactionHandler, DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS
+
+OPENING_BALANCE = 10000  # In cents
+
+
+def worker(handler, numbers, operations, seed, totals, barrier):
+    """Run a random mix of deposits and withdrawals, tallying what succeeded"""
+    rng = random.Random(seed)
+    deposited = withdrawn = 0
+    barrier.wait()
+    for _ in range(operations):
+        number = rng.choice(numbers)
+        amount = rng.randint(1, 6000)
+        if rng.random() < 0.4:
+            result, success = handler.perform_deposit(amount, number)
+            if success:
+                deposited += amount
+        else:
+            result, success = handler.perform_withdrawal(amount, number)
+            if success:
+                withdrawn += amount
+    totals.append((deposited, withdrawn))
+
+
+def run(threads, accounts, operations):
+    """
+    Run the stress test and verify the store afterwards.
+
+    Args:
+        threads (int): The number of worker threads.
+        accounts (int): The number of accounts the threads share.
+        operations (int): The number of operations per thread.
+
+    Returns:
+        float: Operations per second.
+    """
+    store = AccountStore(capacity=accounts)
+    numbers = [1000 + n for n in range(accounts)]
+    for number in numbers:
+        store.open_account(number, OPENING_BALANCE)
+    handler = TransactionHandler(CashMachine(), accounts=store)
+
+    totals = []
+    barrier = threading.Barrier(threads + 1)
+    pool = [threading.Thread(target=worker, args=(handler, numbers, operations, seed, totals, barrier)) for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # No account may ever be overdrawn
+    assert min(store.balances) >= 0, "an account was overdrawn"
+    # Money is neither created nor lost
+    deposited = sum(total[0] for total in totals)
+    withdrawn = sum(total[1] for total in totals)
+    assert sum(store.balances) == OPENING_BALANCE * accounts + deposited - withdrawn, "balances do not add up"
+    # Every operation left exactly one aligned ledger entry
+    ledger = store.transaction_history
+    assert len(ledger) == threads * operations
+    assert len({len(column) for column in ledger.columns}) == 1, "ledger columns are misaligned"
+    # Replaying each account's ledger entries reproduces its balance
+    replayed = {number: OPENING_BALANCE for number in numbers}
+    for index in range(len(ledger)):
+        timestamp, kind, amount, balance = ledger.entry(index)
+        number = ledger.accounts[index]
+        if kind == DEPOSIT:
+            replayed[number] += amount
+        elif kind == WITHDRAWAL:
+            replayed[number] -= amount
+        assert kind == INSUFFICIENT_FUNDS or replayed[number] == balance, "ledger out of order for an account"
+    assert all(store.balance(number) == replayed[number] for number in numbers)
+    return threads * operations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test the thread-safe AccountStore")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--accounts", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=20000)
+    args = parser.parse_args()
+    rate = run(args.threads, args.accounts, args.operations)
+    print(f"OK: {args.threads} threads, {args.accounts} accounts, {rate:,.0f} operations/s")
+
+
+if __name__ == "__main__":
+    main()
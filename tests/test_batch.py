@@ -0,0 +1,82 @@
+import random
+import unittest
+from atm import AccountStore
+from atm.batch import ACCEPTED, DECLINED, INVALID_AMOUNT, UNKNOWN_ACCOUNT, apply_batch
+from atm.ledger import DEPOSIT, INSUFFICIENT_FUNDS, WITHDRAWAL
+from atm.money import MAX_AMOUNT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "batch settlement requires NumPy")
+class ApplyBatchTest(unittest.TestCase):
+    def open_store(self, balances):
+        store = AccountStore()
+        for number, balance in balances.items():
+            store.open_account(number, balance)
+        return store
+
+    def test_rows_are_settled_in_order(self):
+        store = self.open_store({1: 1000, 2: 0})
+        # Account 2's withdrawal comes before the deposit that would cover it
+        status = apply_batch(store, [1, 2, 1, 2, 1], [-800, -100, -300, 500, 200], timestamps=[1, 2, 3, 4, 5])
+        self.assertEqual(status.tolist(), [ACCEPTED, DECLINED, DECLINED, ACCEPTED, ACCEPTED])
+        self.assertEqual(store.balance(1), 400)
+        self.assertEqual(store.balance(2), 500)
+        ledger = store.transaction_history
+        self.assertEqual(
+            [(ledger.kinds[index], ledger.amounts[index], ledger.balances[index], ledger.accounts[index]) for index in range(len(ledger))],
+            [
+                (WITHDRAWAL, 800, 200, 1),
+                (INSUFFICIENT_FUNDS, 100, 0, 2),
+                (INSUFFICIENT_FUNDS, 300, 200, 1),
+                (DEPOSIT, 500, 500, 2),
+                (DEPOSIT, 200, 400, 1),
+            ],
+        )
+
+    def test_invalid_rows_are_not_recorded(self):
+        store = self.open_store({1: 1000})
+        status = apply_batch(store, [1, 7, 1, 1, 1], [0, 100, MAX_AMOUNT + 1, -(MAX_AMOUNT + 1), 100])
+        self.assertEqual(status.tolist(), [INVALID_AMOUNT, UNKNOWN_ACCOUNT, INVALID_AMOUNT, INVALID_AMOUNT, ACCEPTED])
+        self.assertEqual(store.balance(1), 1100)
+        self.assertEqual(len(store.transaction_history), 1)
+
+    def test_empty_batch(self):
+        store = self.open_store({1: 1000})
+        self.assertEqual(len(apply_batch(store, [], [])), 0)
+        self.assertEqual(len(store.transaction_history), 0)
+
+    def test_fractional_amounts_are_rejected(self):
+        store = self.open_store({1: 1000})
+        with self.assertRaises(ValueError):
+            apply_batch(store, [1], [1.5])
+        with self.assertRaises(ValueError):
+            apply_batch(store, [1, 1], [100])
+
+    def test_matches_separate_calls(self):
+        generator = random.Random(7)
+        balances = {number: generator.randrange(0, 5000) for number in range(1, 20)}
+        rows = [(generator.randrange(1, 21), generator.choice((-1, 1)) * generator.randrange(1, 3000)) for _ in range(2000)]
+        batch_store, single_store = self.open_store(balances), self.open_store(balances)
+        status = apply_batch(batch_store, [account for account, amount in rows], [amount for account, amount in rows])
+        for (account, amount), row_status in zip(rows, status.tolist()):
+            if amount > 0:
+                result, success = single_store.deposit_money(account, amount)
+            else:
+                result, success = single_store.withdraw_money(account, -amount)
+            self.assertEqual(success, row_status == ACCEPTED)
+            if account not in balances:
+                self.assertEqual(row_status, UNKNOWN_ACCOUNT)
+        for number in balances:
+            self.assertEqual(batch_store.balance(number), single_store.balance(number))
+        batch_ledger, single_ledger = batch_store.transaction_history, single_store.transaction_history
+        for column in ("kinds", "amounts", "balances", "accounts"):
+            self.assertEqual(list(getattr(batch_ledger, column)[:len(batch_ledger)]), list(getattr(single_ledger, column)[:len(single_ledger)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
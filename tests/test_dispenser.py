@@ -0,0 +1,67 @@
+from itertools import product
+import unittest
+from atm.dispenser import CashDispenser
+
+
+def fewest_notes(amount, denominations, counts):
+    """Return the fewest notes that add up to an amount with the given counts, by trying every combination"""
+    best = None
+    for notes in product(*(range(count + 1) for count in counts)):
+        if sum(note * denomination for note, denomination in zip(notes, denominations)) == amount:
+            if best is None or sum(notes) < best:
+                best = sum(notes)
+    return best
+
+
+class CashDispenserTest(unittest.TestCase):
+    def test_plan_uses_the_fewest_notes(self):
+        dispenser = CashDispenser()
+        self.assertEqual(dispenser.denominations, (5000, 2000, 1000, 500))
+        self.assertEqual(dispenser.plan(18500), (3, 1, 1, 1))
+        self.assertEqual(dispenser.plan(500), (0, 0, 0, 1))
+
+    def test_plan_rejects_amounts_that_cannot_be_dispensed(self):
+        dispenser = CashDispenser()
+        for amount in (0, -500, 250, 1234, dispenser.max_amount + 500):
+            self.assertIsNone(dispenser.plan(amount))
+
+    def test_plan_works_around_depleted_cassettes(self):
+        dispenser = CashDispenser({5000: 0, 2000: 3, 1000: 0, 500: 10})
+        self.assertEqual(dispenser.plan(6000), (0, 3, 0, 0))
+        self.assertEqual(dispenser.plan(10000), (0, 3, 0, 8))
+        self.assertIsNone(dispenser.plan(12000))  # Only €110 is loaded
+
+    def test_plan_needs_more_small_notes_when_the_greedy_choice_fails(self):
+        # 6000 is 5000 + 1000 with unlimited notes, but there are no 1000 notes
+        dispenser = CashDispenser({5000: 5, 2000: 5, 1000: 0})
+        self.assertEqual(dispenser.plan(6000), (0, 3, 0))
+        self.assertEqual(dispenser.plan(11000), (1, 3, 0))
+
+    def test_plan_matches_an_exhaustive_search(self):
+        denominations = (5000, 2000, 1000, 500)
+        for counts in product((0, 1, 3), repeat=len(denominations)):
+            dispenser = CashDispenser(dict(zip(denominations, counts)), max_amount=20000)
+            for amount in range(500, 20001, 500):
+                breakdown = dispenser.plan(amount)
+                expected = fewest_notes(amount, denominations, counts)
+                if expected is None:
+                    self.assertIsNone(breakdown)
+                else:
+                    self.assertEqual(sum(breakdown), expected)
+                    self.assertEqual(sum(note * denomination for note, denomination in zip(breakdown, denominations)), amount)
+                    self.assertTrue(all(note <= count for note, count in zip(breakdown, counts)))
+
+    def test_dispense_takes_notes_out_and_refill_puts_them_back(self):
+        dispenser = CashDispenser({5000: 1, 2000: 2}, low_cash_notes=0)
+        self.assertEqual(dispenser.dispense(9000), {5000: 1, 2000: 2})
+        self.assertEqual(dispenser.cash(), 0)
+        self.assertEqual(dispenser.low_cash(), [5000, 2000])
+        self.assertIsNone(dispenser.dispense(2000))
+        dispenser.refill(2000, 4)
+        self.assertEqual(dispenser.dispense(2000), {2000: 1})
+        self.assertEqual(dispenser.counts, [0, 3])
+        self.assertEqual(dispenser.low_cash(), [5000])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from atm import CashMachine, TransactionHandler, VelocityScorer, WithdrawalLimits
+from atm.clock import NS_PER_SECOND
+
+
+class VelocityScorerTest(unittest.TestCase):
+    def test_scoring_does_not_learn(self):
+        scorer = VelocityScorer(min_history=2)
+        for index in range(3):
+            scorer.score(1, 1000, index * 3600 * NS_PER_SECOND)
+        self.assertEqual(scorer.profiles[1].count, 0)
+        for index in range(3):
+            scorer.record(1, 1000, index * 3600 * NS_PER_SECOND)
+        profile = scorer.profiles[1]
+        self.assertEqual((profile.count, profile.mean, profile.m2), (3, 1000.0, 0.0))
+        self.assertEqual(profile.gap, 3600 * NS_PER_SECOND)
+        score, reasons = scorer.score(1, 100000, 4 * 3600 * NS_PER_SECOND)
+        self.assertIn("unusual amount", reasons)
+
+    def test_every_attempt_counts_towards_the_burst(self):
+        scorer = VelocityScorer(threshold=1.0, burst_limit=2)
+        self.assertIsNone(scorer.check(1, 1000, 0))
+        self.assertIsNone(scorer.check(1, 1000, NS_PER_SECOND))
+        self.assertIn("burst", scorer.check(1, 1000, 2 * NS_PER_SECOND))
+        self.assertIsNone(scorer.check(1, 1000, 120 * NS_PER_SECOND))  # A new burst window
+
+
+class RiskStageTest(unittest.TestCase):
+    def setUp(self):
+        self.cash_machine = CashMachine(require_pin=False)
+        self.cash_machine.deposit_money(100000)
+        self.risk = VelocityScorer(min_history=1)
+        self.handler = TransactionHandler(self.cash_machine, limits=WithdrawalLimits(), risk=self.risk)
+
+    def test_invalid_amounts_are_neither_scored_nor_recorded(self):
+        for amount in (0, -100, 10**13, 10**400):
+            result, success = self.handler.perform_withdrawal(amount)
+            self.assertFalse(success)
+            self.assertIn("Invalid withdrawal amount", result)
+        self.assertEqual(self.risk.profiles, {})
+
+    def test_only_successful_withdrawals_are_recorded(self):
+        self.assertFalse(self.handler.perform_withdrawal(200000)[1])  # Insufficient funds
+        self.assertEqual(self.risk.profiles[0].count, 0)
+        self.assertEqual(self.risk.profiles[0].burst, 1)
+        self.assertTrue(self.handler.perform_withdrawal(2000)[1])
+        self.assertEqual((self.risk.profiles[0].count, self.risk.profiles[0].mean), (1, 2000.0))
+
+    def test_flagged_withdrawals_are_not_recorded(self):
+        self.assertTrue(self.handler.perform_withdrawal(1000)[1])
+        result, success = self.handler.perform_withdrawal(45000)
+        self.assertFalse(success)
+        self.assertIn("declined for review", result)
+        self.assertEqual((self.risk.profiles[0].count, self.risk.profiles[0].mean), (1, 1000.0))
+        self.assertEqual(self.cash_machine.balance, 99000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from atm import CashMachine, IdempotencyCache, TransactionHandler
+
+
+class Operation:
+    """Callable counting how often it runs, optionally blocking until released"""
+
+    def __init__(self, result=("done", True), block=False):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait()
+        return self.result
+
+
+class IdempotencyCacheTest(unittest.TestCase):
+    def test_duplicate_returns_the_first_result(self):
+        cache = IdempotencyCache()
+        first, second = Operation(("first", True)), Operation(("second", True))
+        self.assertEqual(cache.run(b"key", (1,), first), ("first", True))
+        self.assertEqual(cache.run(b"key", (1,), second), ("first", True))
+        self.assertEqual((first.calls, second.calls, cache.hits), (1, 0, 1))
+
+    def test_key_reused_for_a_different_request(self):
+        cache = IdempotencyCache()
+        cache.run(b"key", (1,), Operation())
+        operation = Operation()
+        result, success = cache.run(b"key", (2,), operation)
+        self.assertFalse(success)
+        self.assertIn("different transaction", result)
+        self.assertEqual(operation.calls, 0)
+
+    def test_key_is_forgotten_after_the_ttl(self):
+        cache = IdempotencyCache(ttl=60)
+        with mock.patch("atm.idempotency.time.monotonic", return_value=1000.0):
+            cache.run(b"key", (1,), Operation(("first", True)))
+        with mock.patch("atm.idempotency.time.monotonic", return_value=1059.0):
+            self.assertEqual(cache.run(b"key", (1,), Operation(("second", True))), ("first", True))
+        with mock.patch("atm.idempotency.time.monotonic", return_value=1060.0):
+            self.assertEqual(cache.run(b"key", (1,), Operation(("third", True))), ("third", True))
+
+    def test_least_recently_used_key_is_evicted_at_capacity(self):
+        cache = IdempotencyCache(capacity=2)
+        cache.run(b"a", (1,), Operation(("a", True)))
+        cache.run(b"b", (1,), Operation(("b", True)))
+        cache.run(b"a", (1,), Operation())  # A hit makes "a" the most recently used
+        cache.run(b"c", (1,), Operation(("c", True)))
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+        self.assertEqual(cache.run(b"a", (1,), Operation(("again", True))), ("a", True))
+        self.assertEqual(cache.run(b"b", (1,), Operation(("again", True))), ("again", True))
+
+    def test_duplicate_waits_for_the_running_original(self):
+        cache = IdempotencyCache()
+        original = Operation(("first", True), block=True)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cache.run(b"key", (1,), original)))
+        thread.start()
+        self.assertTrue(original.started.wait(5))
+        duplicate = threading.Thread(target=lambda: results.append(cache.run(b"key", (1,), Operation(("second", True)))))
+        duplicate.start()
+        time.sleep(0.05)
+        self.assertEqual(results, [])  # The duplicate is waiting rather than running
+        original.release.set()
+        thread.join(5)
+        duplicate.join(5)
+        self.assertEqual(results, [("first", True), ("first", True)])
+        self.assertEqual(original.calls, 1)
+
+    def test_key_is_forgotten_when_the_operation_raises(self):
+        cache = IdempotencyCache()
+
+        def fail():
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            cache.run(b"key", (1,), fail)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.run(b"key", (1,), Operation(("retried", True))), ("retried", True))
+
+    def test_running_key_is_never_evicted(self):
+        cache = IdempotencyCache(capacity=1)
+        original = Operation(("first", True), block=True)
+        thread = threading.Thread(target=cache.run, args=(b"slow", (1,), original))
+        thread.start()
+        self.assertTrue(original.started.wait(5))
+        # Other keys fill the cache while the first is still running
+        for key in (b"a", b"b", b"c"):
+            cache.run(key, (1,), Operation())
+        retry = Operation(("second", True))
+        results = []
+        duplicate = threading.Thread(target=lambda: results.append(cache.run(b"slow", (1,), retry)))
+        duplicate.start()
+        original.release.set()
+        thread.join(5)
+        duplicate.join(5)
+        self.assertEqual(results, [("first", True)])
+        self.assertEqual((original.calls, retry.calls), (1, 0))
+        self.assertEqual(len(cache), 1)
+
+    def test_retried_withdrawal_debits_once(self):
+        cash_machine = CashMachine(require_pin=False)
+        cash_machine.deposit_money(10000)
+        handler = TransactionHandler(cash_machine, idempotency=IdempotencyCache(capacity=1))
+        handler.perform_withdrawal(2500, key=b"w1")
+        first = handler.perform_withdrawal(100, key=b"w2")
+        self.assertTrue(first[1])
+        self.assertEqual(handler.perform_withdrawal(100, key=b"w2"), first)
+        self.assertEqual(cash_machine.balance, 7400)
+
+
+if __name__ == "__main__":
+    unittest.main()
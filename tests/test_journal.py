@@ -0,0 +1,177 @@
+import os
+import tempfile
+import threading
+import unittest
+from atm import CashDispenser, CashMachine, Journal, TransactionHandler
+from atm.journal import CASSETTES_NAME, LOG_NAME, RECORD_SIZE, SNAPSHOT_NAME, read_journal
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = self.temp.name
+        self.log_path = os.path.join(self.directory, LOG_NAME)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def open_machine(self, dispenser=None, **options):
+        """Recover a cash machine from the test directory"""
+        cash_machine = CashMachine(require_pin=False, dispenser=dispenser)
+        journal = Journal(self.directory, **options)
+        journal.recover(cash_machine)
+        return cash_machine, journal, TransactionHandler(cash_machine, journal=journal)
+
+    def test_recover_replays_the_log(self):
+        cash_machine, journal, handler = self.open_machine()
+        handler.perform_deposit(10000)
+        handler.perform_withdrawal(2500)
+        handler.perform_withdrawal(99999)  # Recorded as insufficient funds
+        # No close(): record() has already made every transaction durable
+        recovered, journal, _ = self.open_machine()
+        self.assertEqual(recovered.balance, 7500)
+        self.assertEqual(list(recovered.transaction_history), list(cash_machine.transaction_history))
+        journal.close()
+
+    def test_torn_tail_is_discarded(self):
+        cash_machine, journal, handler = self.open_machine()
+        handler.perform_deposit(10000)
+        handler.perform_deposit(500)
+        journal.close()
+        with open(self.log_path, "r+b") as log:
+            log.truncate(RECORD_SIZE + RECORD_SIZE // 2)  # Half of the second record was written
+        recovered, journal, handler = self.open_machine()
+        self.assertEqual(recovered.balance, 10000)
+        self.assertEqual(len(recovered.transaction_history), 1)
+        self.assertEqual(os.path.getsize(self.log_path), RECORD_SIZE)
+        # New records go after the last valid one
+        handler.perform_deposit(200)
+        journal.close()
+        recovered, journal, _ = self.open_machine()
+        self.assertEqual(recovered.balance, 10200)
+        journal.close()
+
+    def test_corrupt_record_ends_the_log(self):
+        cash_machine, journal, handler = self.open_machine()
+        for _ in range(3):
+            handler.perform_deposit(100)
+        journal.close()
+        with open(self.log_path, "r+b") as log:
+            log.seek(RECORD_SIZE + 10)
+            log.write(b"\xff")
+        recovered, journal, _ = self.open_machine()
+        self.assertEqual(recovered.balance, 100)
+        journal.close()
+
+    def test_snapshot_truncates_the_log(self):
+        cash_machine, journal, handler = self.open_machine(snapshot_every=4)
+        for _ in range(6):
+            handler.perform_deposit(100)
+        journal.close()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, SNAPSHOT_NAME)))
+        self.assertEqual(os.path.getsize(self.log_path), 2 * RECORD_SIZE)
+        recovered, journal, _ = self.open_machine(snapshot_every=4)
+        self.assertEqual(recovered.balance, 600)
+        self.assertEqual(list(recovered.transaction_history), list(cash_machine.transaction_history))
+        self.assertEqual(len(list(read_journal(self.directory))), 6)
+        journal.close()
+
+    def test_crash_between_snapshot_and_truncate(self):
+        cash_machine, journal, handler = self.open_machine()
+        for _ in range(3):
+            handler.perform_deposit(100)
+        with open(self.log_path, "rb") as log:
+            log_before = log.read()
+        journal.snapshot(cash_machine)
+        journal.close()
+        # Put back the records the snapshot already covers, as if the truncation never happened
+        with open(self.log_path, "wb") as log:
+            log.write(log_before)
+        recovered, journal, _ = self.open_machine()
+        self.assertEqual(recovered.balance, 300)
+        self.assertEqual(len(recovered.transaction_history), 3)
+        journal.close()
+
+    def test_cassettes_survive_a_restart(self):
+        cassettes = {5000: 10, 2000: 10}
+        cash_machine, journal, handler = self.open_machine(CashDispenser(cassettes))
+        handler.perform_deposit(100000)
+        handler.perform_withdrawal(9000)  # 1 x 50 + 2 x 20
+        handler.perform_refill(5000, 5)
+        handler.perform_withdrawal(4000)
+        handler.perform_withdrawal(3000)  # Not dispensable, so nothing is taken
+        self.assertEqual(cash_machine.dispenser.counts, [14, 6])
+        # No close(): the withdrawal after the refill is dispensed again from the log
+        recovered, journal, handler = self.open_machine(CashDispenser(cassettes))
+        self.assertEqual(recovered.dispenser.counts, [14, 6])
+        self.assertEqual(recovered.balance, 100000 - 9000 - 4000)
+        journal.close()
+
+    def test_cassettes_survive_a_snapshot(self):
+        cash_machine, journal, handler = self.open_machine(CashDispenser({5000: 10}), snapshot_every=3)
+        handler.perform_deposit(100000)
+        for _ in range(4):
+            handler.perform_withdrawal(5000)
+        journal.close()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, CASSETTES_NAME)))
+        recovered, journal, _ = self.open_machine(CashDispenser({5000: 10}), snapshot_every=3)
+        self.assertEqual(recovered.dispenser.counts, [6])
+        journal.close()
+
+    def test_pin_and_lockout_survive_a_restart(self):
+        cash_machine, journal, _ = self.open_machine()
+        self.assertTrue(cash_machine.set_pin("1234"))
+        self.assertIsNone(cash_machine.open_session("4321"))
+        journal.close()
+        recovered, journal, _ = self.open_machine()
+        # The PIN cannot be chosen again, and the wrong attempt still counts
+        self.assertFalse(recovered.set_pin("5555"))
+        self.assertEqual(recovered.failed_attempts, 1)
+        self.assertIsNotNone(recovered.open_session("1234"))
+        self.assertIsNone(recovered.open_session("0000"))
+        self.assertIsNone(recovered.open_session("0000"))
+        self.assertIsNone(recovered.open_session("0000"))
+        journal.close()
+        recovered, journal, _ = self.open_machine()
+        self.assertTrue(recovered.locked)
+        self.assertIsNone(recovered.open_session("1234"))
+        self.assertTrue(recovered.reset_pin("2468"))
+        journal.close()
+        recovered, journal, _ = self.open_machine()
+        self.assertFalse(recovered.locked)
+        self.assertIsNotNone(recovered.open_session("2468"))
+        journal.close()
+
+    def test_journal_must_be_recovered_first(self):
+        cash_machine = CashMachine(require_pin=False)
+        journal = Journal(self.directory)
+        with self.assertRaises(ValueError):
+            TransactionHandler(cash_machine, journal=journal)
+        with self.assertRaises(RuntimeError):
+            journal.record(cash_machine)
+
+    def test_concurrent_records_are_all_durable(self):
+        cash_machine, journal, handler = self.open_machine(snapshot_every=500)
+        errors = []
+
+        def deposit():
+            for _ in range(300):
+                result, success = handler.perform_deposit(100)
+                if not success:
+                    errors.append(result)
+
+        threads = [threading.Thread(target=deposit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(journal.synced_seq, journal.seq)
+        recovered, journal, _ = self.open_machine()
+        self.assertEqual(recovered.balance, 8 * 300 * 100)
+        self.assertEqual(len(recovered.transaction_history), 8 * 300)
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+from array import array
+import os
+import random
+import tempfile
+import unittest
+from atm.archive import LedgerArchive, write_archive
+from atm.ledger import DEPOSIT, INSUFFICIENT_FUNDS, WITHDRAWAL, Ledger
+
+KINDS = (DEPOSIT, WITHDRAWAL, INSUFFICIENT_FUNDS)
+
+
+def build_ledger(entries, late=0.0, seed=0, batch=False):
+    """Return a ledger of random entries, a fraction of them stamped before earlier ones, and its rows"""
+    generator = random.Random(seed)
+    rows, timestamp = [], 1000
+    for _ in range(entries):
+        timestamp += generator.randrange(0, 3)
+        stamp = timestamp - generator.randrange(1, 200) if generator.random() < late else timestamp
+        rows.append((stamp, generator.choice(KINDS), generator.randrange(1, 500), generator.randrange(0, 10**6), generator.randrange(4)))
+    ledger = Ledger()
+    if batch:
+        ledger.extend(*(array(typecode, column) for typecode, column in zip("qbqqq", zip(*rows))))
+    else:
+        for stamp, kind, amount, balance, account in rows:
+            ledger.append(kind, amount, balance, stamp, account)
+    return ledger, rows
+
+
+class LedgerIndexTest(unittest.TestCase):
+    def check_against_scan(self, ledger, rows):
+        generator = random.Random(1)
+        count = len(rows)
+        for account in range(5):
+            expected = [index for index in range(count) if rows[index][4] == account]
+            self.assertEqual(list(ledger.chain(account, count)), expected[::-1])
+            self.assertEqual(ledger.recent(account, 7), expected[::-1][:7])
+            first, stop = sorted(generator.randrange(count + 1) for _ in range(2))
+            self.assertEqual(list(ledger.chain(account, stop, first)), [index for index in expected[::-1] if first <= index < stop])
+        for _ in range(200):
+            start, end = sorted(generator.randrange(900, 1000 + 2 * count) for _ in range(2))
+            account = generator.choice((None, 0, 1, 2, 3))
+            expected = [index for index in range(count)
+                        if start <= rows[index][0] < end and (account is None or rows[index][4] == account)]
+            self.assertEqual(list(ledger.between(start, end, account)), expected)
+            # Page through the same range newest first
+            pages, before = [], None
+            while True:
+                entries, before = ledger.query(start, end, account=account, limit=9, before=before)
+                pages += [entry.index for entry in entries]
+                if before is None:
+                    break
+            self.assertEqual(pages, expected[::-1])
+            # The balance at a moment is that of the last recorded entry stamped before it
+            moment, account = generator.randrange(900, 1000 + 2 * count), generator.randrange(5)
+            before_moment = [index for index in range(count) if rows[index][0] < moment and rows[index][4] == account]
+            self.assertEqual(ledger.balance_at(moment, account), rows[before_moment[-1]][3] if before_moment else None)
+
+    def test_sorted_ledger(self):
+        ledger, rows = build_ledger(2000)
+        self.assertTrue(ledger.time_sorted)
+        self.check_against_scan(ledger, rows)
+
+    def test_ledger_with_late_entries(self):
+        ledger, rows = build_ledger(2000, late=0.05)
+        self.assertFalse(ledger.time_sorted)
+        self.assertTrue(ledger.late_starts)
+        self.check_against_scan(ledger, rows)
+
+    def test_ledger_with_late_entries_extended_in_bulk(self):
+        ledger, rows = build_ledger(2000, late=0.3, seed=3, batch=True)
+        self.check_against_scan(ledger, rows)
+
+    def test_reindex_rebuilds_the_late_runs(self):
+        ledger, rows = build_ledger(500, late=0.1, seed=5)
+        loaded = Ledger()
+        for column, values in zip(loaded.columns, ledger.columns):
+            column.extend(values)
+        loaded.reindex()
+        self.assertEqual((loaded.late_starts, loaded.late_stops), (ledger.late_starts, ledger.late_stops))
+        self.check_against_scan(loaded, rows)
+
+    def test_only_late_entries_lose_the_binary_search(self):
+        ledger = Ledger()
+        for timestamp in (10, 20, 30, 15, 40, 50, 5, 60):
+            ledger.append(DEPOSIT, 1, 0, timestamp)
+        self.assertEqual((list(ledger.late_starts), list(ledger.late_stops)), ([3, 6], [4, 7]))
+        # Entries recorded in time order bound the range; late ones are checked individually
+        self.assertEqual(ledger.time_range(35, 55), (4, 7))
+        self.assertEqual(list(ledger.between(12, 45)), [1, 2, 3, 4])
+
+    def test_archive_matches_the_ledger(self):
+        for late in (0.0, 0.05):
+            ledger, rows = build_ledger(1000, late=late, seed=9)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "ledger.archive")
+                write_archive(ledger, path)
+                with LedgerArchive(path) as archive:
+                    self.assertEqual(archive.time_sorted, ledger.time_sorted)
+                    self.check_against_scan(archive, rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
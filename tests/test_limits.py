@@ -0,0 +1,85 @@
+import unittest
+from atm.clock import NS_PER_SECOND
+from atm.ledger import DEPOSIT, WITHDRAWAL, Ledger
+from atm.limits import WindowCounter, WithdrawalLimits
+
+START = 1_699_999_200 * NS_PER_SECOND  # A bucket boundary for every window below
+HOUR = 3600 * NS_PER_SECOND
+
+
+class WindowCounterTest(unittest.TestCase):
+    def test_amounts_expire_with_their_bucket(self):
+        counter = WindowCounter(60 * NS_PER_SECOND, 6)
+        counter.advance(START)
+        counter.add(START, 100)
+        counter.advance(START + 15 * NS_PER_SECOND)
+        counter.add(START + 15 * NS_PER_SECOND, 50)
+        counter.advance(START + 59 * NS_PER_SECOND)
+        self.assertEqual(counter.total, 150)
+        counter.advance(START + 60 * NS_PER_SECOND)  # The first bucket left the window
+        self.assertEqual(counter.total, 50)
+        counter.advance(START + 10 * 60 * NS_PER_SECOND)  # A gap longer than the window clears every bucket
+        self.assertEqual(counter.total, 0)
+        self.assertEqual(list(counter.totals), [0] * 6)
+
+    def test_late_amount_outside_the_window_is_ignored(self):
+        counter = WindowCounter(60 * NS_PER_SECOND, 6)
+        counter.advance(START + 120 * NS_PER_SECOND)
+        counter.add(START, 100)
+        self.assertEqual(counter.total, 0)
+
+
+class WithdrawalLimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.limits = WithdrawalLimits(((3600, 50000), (86400, 100000)))
+
+    def test_reserve_refuses_past_the_limit(self):
+        self.assertIsNone(self.limits.reserve(1, 30000, START))
+        message = self.limits.reserve(1, 30000, START + NS_PER_SECOND)
+        self.assertIn("per hour", message)
+        self.assertEqual(self.limits.withdrawn(1, START + NS_PER_SECOND), [30000, 30000])
+        # Other accounts have their own allowance
+        self.assertIsNone(self.limits.reserve(2, 50000, START))
+
+    def test_allowance_returns_when_the_window_passes(self):
+        self.assertIsNone(self.limits.reserve(1, 50000, START))
+        self.assertIsNotNone(self.limits.reserve(1, 100, START + HOUR - NS_PER_SECOND))
+        self.assertIsNone(self.limits.reserve(1, 50000, START + HOUR))
+        self.assertEqual(self.limits.withdrawn(1, START + HOUR), [50000, 100000])
+        message = self.limits.reserve(1, 100, START + 2 * HOUR)
+        self.assertIn("per 24 hours", message)
+
+    def test_release_after_the_head_moved_on(self):
+        self.assertIsNone(self.limits.reserve(1, 20000, START))
+        # Another withdrawal moves the counters on before the first one fails
+        self.assertIsNone(self.limits.reserve(1, 10000, START + 30 * 60 * NS_PER_SECOND))
+        self.limits.release(1, 20000, START)
+        self.assertEqual(self.limits.withdrawn(1, START + 30 * 60 * NS_PER_SECOND), [10000, 10000])
+        # The released amount came out of its own bucket, so the total stays right when that bucket expires
+        self.assertEqual(self.limits.withdrawn(1, START + HOUR), [10000, 10000])
+        self.assertEqual(self.limits.withdrawn(1, START + 90 * 60 * NS_PER_SECOND), [0, 10000])
+
+    def test_release_of_an_expired_reservation_is_ignored(self):
+        self.assertIsNone(self.limits.reserve(1, 20000, START))
+        self.assertEqual(self.limits.withdrawn(1, START + 2 * HOUR), [0, 20000])
+        self.limits.release(1, 20000, START)
+        self.assertEqual(self.limits.withdrawn(1, START + 2 * HOUR), [0, 0])
+        self.assertEqual(self.limits.withdrawn(1, START + 2 * 86400 * NS_PER_SECOND), [0, 0])
+
+    def test_seed_counts_recent_withdrawals_from_a_recovered_ledger(self):
+        ledger = Ledger()
+        ledger.append(WITHDRAWAL, 40000, 0, START - 86400 * NS_PER_SECOND, 1)  # Outside both windows
+        ledger.append(WITHDRAWAL, 30000, 0, START + 10 * NS_PER_SECOND, 1)
+        ledger.append(DEPOSIT, 99999, 0, START + 20 * NS_PER_SECOND, 1)
+        ledger.append(WITHDRAWAL, 15000, 0, START + HOUR + 30 * NS_PER_SECOND, 1)
+        ledger.append(WITHDRAWAL, 5000, 0, START + HOUR + 40 * NS_PER_SECOND, 2)
+        now = START + HOUR + 60 * NS_PER_SECOND
+        self.limits.seed(ledger, now)
+        self.assertEqual(self.limits.withdrawn(1, now), [15000, 45000])
+        self.assertEqual(self.limits.withdrawn(2, now), [5000, 5000])
+        self.assertIsNotNone(self.limits.reserve(1, 40000, now))
+        self.assertIsNone(self.limits.reserve(1, 35000, now))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+from decimal import Decimal
+import unittest
+from atm.money import CHAR_MAX, MAX_AMOUNT, CurrencyFormatter, to_cents
+
+
+class ToCentsTest(unittest.TestCase):
+    def test_rounds_half_up(self):
+        self.assertEqual(to_cents("12.345"), 1235)
+        self.assertEqual(to_cents("12.344"), 1234)
+        self.assertEqual(to_cents("0.005"), 1)
+        self.assertEqual(to_cents("-0.005"), -1)
+
+    def test_accepts_numbers_and_text(self):
+        self.assertEqual(to_cents(12), 1200)
+        self.assertEqual(to_cents(0.1), 10)  # Converted through str, so the binary error does not round it down
+        self.assertEqual(to_cents(Decimal("7.5")), 750)
+        self.assertEqual(to_cents(" 3 "), 300)
+
+    def test_rejects_invalid_amounts(self):
+        for amount in ("", "abc", "1,50", "NaN", "Infinity"):
+            with self.assertRaises(ValueError):
+                to_cents(amount)
+
+    def test_rejects_amounts_over_the_maximum(self):
+        self.assertEqual(to_cents(MAX_AMOUNT // 100), MAX_AMOUNT)
+        with self.assertRaises(ValueError):
+            to_cents(MAX_AMOUNT // 100 + 1)
+        with self.assertRaises(ValueError):
+            to_cents("1e400")
+
+
+class CurrencyFormatterTest(unittest.TestCase):
+    def test_default_format(self):
+        formatter = CurrencyFormatter()
+        self.assertEqual(formatter.format(0), "€0.00")
+        self.assertEqual(formatter.format(5), "€0.05")
+        self.assertEqual(formatter.format(123456), "€1,234.56")
+        self.assertEqual(formatter.format(100000000), "€1,000,000.00")
+        self.assertEqual(formatter.format(-123456), "-€1,234.56")
+
+    def test_grouping(self):
+        cases = (
+            ((3, 0), "1,234,567,890"),  # Groups of three repeated
+            ((3, 2, 0), "1,23,45,67,890"),  # Indian grouping
+            ((3, CHAR_MAX), "1234567,890"),  # No grouping after the first group
+            ((3,), "1234567,890"),  # A list without 0 does not repeat either
+            ((), "1234567890"),
+        )
+        for grouping, expected in cases:
+            self.assertEqual(CurrencyFormatter(grouping=grouping).group("1234567890"), expected)
+        self.assertEqual(CurrencyFormatter().group("123"), "123")
+        self.assertEqual(CurrencyFormatter(thousands_sep="").group("1234567"), "1234567")
+
+    def test_locale_conventions(self):
+        formatter = CurrencyFormatter(decimal_point=",", thousands_sep=".", symbol_first=False, space=True)
+        self.assertEqual(formatter.format(123456789), "1.234.567,89 €")
+        self.assertEqual(formatter.format(-50), "-0,50 €")
+
+
+if __name__ == "__main__":
+    unittest.main()
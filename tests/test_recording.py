@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from atm import CashDispenser, CashMachine, TransactionHandler, WithdrawalLimits
+from atm.clock import now_ns, NS_PER_SECOND
+from atm.recording import BREAKDOWN, LIMIT_MAXIMUM, SEED, WITHDRAW, Replayer, read_recording, record_session
+
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp.name, "session.rec")
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def replay(self):
+        replayer = Replayer()
+        cash_machine = replayer.replay(read_recording(self.path))
+        return replayer, cash_machine
+
+    def test_withdrawals_declined_by_the_limits_are_recorded_and_replayed(self):
+        cash_machine = CashMachine(require_pin=False, dispenser=CashDispenser({5000: 20, 1000: 20}))
+        cash_machine.deposit_money(200000)
+        handler = TransactionHandler(cash_machine, limits=WithdrawalLimits(((3600, 30000),), buckets=12))
+        recorder = record_session(cash_machine, self.path, handler)
+        self.assertTrue(handler.perform_withdrawal(20000)[1])
+        self.assertIn("limit exceeded", handler.perform_withdrawal(20000)[0])
+        self.assertIn("limit exceeded", handler.perform_withdrawal(15000)[0])
+        self.assertTrue(handler.perform_withdrawal(10000)[1])
+        recorder.record(BREAKDOWN, 1234, cash_machine.note_breakdown(1234) is not None)
+        recorder.close()
+
+        events = list(read_recording(self.path))
+        self.assertEqual([(success, value) for _, event, success, value in events if event == WITHDRAW],
+                         [(True, 20000), (False, 20000), (False, 15000), (True, 10000)])
+        self.assertEqual([value for _, event, _, value in events if event == LIMIT_MAXIMUM], [30000])
+        replayer, replayed = self.replay()
+        self.assertEqual(replayer.mismatches, [])
+        self.assertEqual(replayed.balance, cash_machine.balance)
+        self.assertEqual(replayed.dispenser.counts, cash_machine.dispenser.counts)
+
+    def test_withdrawals_counted_before_recording_are_seeded(self):
+        cash_machine = CashMachine(require_pin=False)
+        cash_machine.deposit_money(100000)
+        cash_machine.withdraw_money(25000)
+        limits = WithdrawalLimits(((86400, 30000),))
+        limits.seed(cash_machine.transaction_history)
+        handler = TransactionHandler(cash_machine, limits=limits)
+        recorder = record_session(cash_machine, self.path, handler)
+        self.assertFalse(handler.perform_withdrawal(10000)[1])
+        self.assertTrue(handler.perform_withdrawal(5000)[1])
+        recorder.close()
+
+        seeds = [(timestamp, value) for timestamp, event, _, value in read_recording(self.path) if event == SEED]
+        self.assertEqual(seeds, [(cash_machine.transaction_history.columns[0][1], 25000)])
+        replayer, replayed = self.replay()
+        self.assertEqual(replayer.mismatches, [])
+        self.assertEqual(replayed.balance, 70000)
+
+    def test_replay_uses_the_recorded_timestamps(self):
+        cash_machine = CashMachine(require_pin=False)
+        cash_machine.deposit_money(100000)
+        handler = TransactionHandler(cash_machine, limits=WithdrawalLimits(((60, 10000),), buckets=6))
+        clock = [now_ns()]
+        handler.clock = lambda: clock[0]
+        recorder = record_session(cash_machine, self.path, handler)
+        self.assertTrue(handler.perform_withdrawal(10000)[1])
+        clock[0] += 120 * NS_PER_SECOND  # The window has passed, though the replay runs at once
+        self.assertTrue(handler.perform_withdrawal(10000)[1])
+        recorder.close()
+        replayer, replayed = self.replay()
+        self.assertEqual(replayer.mismatches, [])
+        self.assertEqual(replayed.balance, 80000)
+
+
+if __name__ == "__main__":
+    unittest.main()